@@ -0,0 +1,269 @@
+"""Motor colunar de analytics (ANALYTICS_MOTOR=colunar).
+
+Guarda no processo uma cópia do rollup vendas_diarias em arrays do numpy, uma
+posição por linha (dia, produto, cliente). dia, mes, produto_id e cliente_id
+viram códigos inteiros, com o vocabulário de cada coluna ao lado; valor,
+quantidade e pedidos ficam em arrays float64/int64.
+
+agregar() recebe a mesma consulta e o mesmo pipeline que repos.vendas.agregar.
+Cada $match vira uma máscara booleana: a condição é avaliada uma vez por valor
+distinto do vocabulário, com as mesmas regras do armazenamento em memória, e
+indexada pelos códigos. O $group vira np.unique + np.bincount sobre as linhas
+selecionadas. O que vem depois do $group ($sort, $limit, $lookup, outro $group)
+já é pequeno e segue pelo interpretador de armazenamento.py, assim como qualquer
+estágio que a cópia não saiba vetorizar.
+
+A cópia é carregada na primeira consulta e atualizada a cada escrita deste
+processo com o acumulado que aplicar_vendas_diarias acabou de gravar no rollup:
+linha existente é somada no lugar, linha nova vai para o fim e linha sem pedidos
+é desativada, como no banco. Escritas de outro processo (manage.py, outro
+worker) entram na recarga completa a cada ANALYTICS_COLUNAR_TTL_SEGUNDOS.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from armazenamento import corresponde, executar_pipeline
+
+logger = logging.getLogger(__name__)
+
+CODIFICADOS = ("dia", "mes", "produto_id", "cliente_id")
+NUMERICOS = {"valor": np.float64, "quantidade": np.float64, "pedidos": np.int64}
+TEXTOS = ("produto_nome", "cliente_nome")
+TENTATIVAS_CARGA = 3
+
+
+class Vocabulario:
+    def __init__(self):
+        self.valores: List[Any] = []
+        self.codigos: Dict[Any, int] = {}
+
+    def codigo(self, valor: Any) -> int:
+        codigo = self.codigos.get(valor)
+        if codigo is None:
+            codigo = self.codigos[valor] = len(self.valores)
+            self.valores.append(valor)
+        return codigo
+
+
+class TabelaVendas:
+    def __init__(self, linhas: List[Dict[str, Any]]):
+        self.vocabularios = {campo: Vocabulario() for campo in CODIFICADOS}
+        self.n = len(linhas)
+        capacidade = max(self.n * 2, 1024)
+        self.codigos = {campo: np.zeros(capacidade, np.int32) for campo in CODIFICADOS}
+        self.numeros = {campo: np.zeros(capacidade, tipo) for campo, tipo in NUMERICOS.items()}
+        self.ativa = np.zeros(capacidade, bool)
+        self.ativa[:self.n] = True
+        for campo in CODIFICADOS:
+            vocabulario = self.vocabularios[campo]
+            self.codigos[campo][:self.n] = [vocabulario.codigo(linha.get(campo)) for linha in linhas]
+        for campo in NUMERICOS:
+            self.numeros[campo][:self.n] = [linha.get(campo) or 0 for linha in linhas]
+        self.textos = {campo: [linha.get(campo) for linha in linhas] for campo in TEXTOS}
+        # (dia, produto_id, cliente_id) -> posição da linha ativa
+        self.posicoes = {(linha.get("dia"), linha.get("produto_id"), linha.get("cliente_id")): i
+                         for i, linha in enumerate(linhas)}
+        self.predicados: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def acrescentar(self, chave: tuple, mes: Any) -> int:
+        if self.n == len(self.ativa):
+            for colunas in (self.codigos, self.numeros):
+                for campo, coluna in colunas.items():
+                    colunas[campo] = np.concatenate([coluna, np.zeros_like(coluna)])
+            self.ativa = np.concatenate([self.ativa, np.zeros_like(self.ativa)])
+        i = self.n
+        for campo, valor in zip(CODIFICADOS, (chave[0], mes, chave[1], chave[2])):
+            self.codigos[campo][i] = self.vocabularios[campo].codigo(valor)
+        for coluna in self.numeros.values():
+            coluna[i] = 0
+        for coluna in self.textos.values():
+            coluna.append(None)
+        self.ativa[i] = True
+        self.posicoes[chave] = i
+        self.n += 1
+        return i
+
+    def aplicar(self, acumulado: Dict[tuple, Dict[str, Any]]):
+        # Mesmas regras de MemoriaVendas.aplicar / MongoVendas.aplicar
+        for chave, linha in acumulado.items():
+            i = self.posicoes.get(chave)
+            if i is None:
+                i = self.acrescentar(chave, linha["mes"])
+            for campo, coluna in self.numeros.items():
+                coluna[i] += linha[campo]
+            for campo, coluna in self.textos.items():
+                coluna[i] = linha[campo]
+            if linha["pedidos"] < 0 and self.numeros["pedidos"][i] <= 0:
+                self.ativa[i] = False
+                del self.posicoes[chave]
+
+    def predicado(self, campo: str, condicao: Any) -> np.ndarray:
+        # Resultado da condição para cada valor do vocabulário; valores novos são avaliados
+        # só quando aparecem
+        chave = (campo, repr(condicao))
+        valores = self.vocabularios[campo].valores
+        tabela = self.predicados.get(chave)
+        inicio = 0 if tabela is None else len(tabela)
+        if inicio < len(valores):
+            novos = np.fromiter((corresponde({campo: valor}, {campo: condicao}) for valor in valores[inicio:]),
+                                bool, len(valores) - inicio)
+            tabela = novos if tabela is None else np.concatenate([tabela, novos])
+            if len(self.predicados) > 1000:
+                self.predicados.clear()
+            self.predicados[chave] = tabela
+        return tabela
+
+    def vetorizavel(self, filtro: Dict[str, Any]) -> bool:
+        return all(
+            all(self.vetorizavel(sub) for sub in condicao) if campo in ("$or", "$and") else campo in CODIFICADOS
+            for campo, condicao in filtro.items()
+        )
+
+    def filtrar(self, filtro: Dict[str, Any]) -> np.ndarray:
+        mascara = np.ones(self.n, bool)
+        for campo, condicao in filtro.items():
+            if campo == "$or":
+                alguma = np.zeros(self.n, bool)
+                for sub in condicao:
+                    alguma |= self.filtrar(sub)
+                mascara &= alguma
+            elif campo == "$and":
+                for sub in condicao:
+                    mascara &= self.filtrar(sub)
+            else:
+                mascara &= self.predicado(campo, condicao)[self.codigos[campo][:self.n]]
+        return mascara
+
+    def chave_grupo(self, linhas: np.ndarray, especificacao: Any) -> Optional[Tuple[np.ndarray, List[Any]]]:
+        # (grupo de cada linha, _id de cada grupo); None se o _id não for de colunas codificadas
+        if especificacao is None:
+            return np.zeros(len(linhas), np.intp), [None] if len(linhas) else []
+        if not isinstance(especificacao, (str, dict)):
+            return None
+        referencias = [especificacao] if isinstance(especificacao, str) else list(especificacao.values())
+        if not all(isinstance(ref, str) and ref.startswith("$") and ref[1:] in CODIFICADOS for ref in referencias):
+            return None
+        campos = [ref[1:] for ref in referencias]
+        if not len(linhas):
+            return np.zeros(0, np.intp), []
+        combinado = np.zeros(len(linhas), np.int64)
+        for campo in campos:
+            combinado = combinado * len(self.vocabularios[campo].valores) + self.codigos[campo][linhas]
+        unicos, grupos = np.unique(combinado, return_inverse=True)
+        partes = []
+        for campo in reversed(campos):
+            tamanho = len(self.vocabularios[campo].valores)
+            partes.append([self.vocabularios[campo].valores[codigo] for codigo in (unicos % tamanho).tolist()])
+            unicos = unicos // tamanho
+        partes.reverse()
+        if isinstance(especificacao, str):
+            return grupos, partes[0]
+        return grupos, [dict(zip(especificacao, valores)) for valores in zip(*partes)]
+
+    def agrupar(self, mascara: np.ndarray, especificacao: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        linhas = np.flatnonzero(mascara)
+        chave = self.chave_grupo(linhas, especificacao["_id"])
+        if chave is None:
+            return None
+        grupos, ids = chave
+        resultado = [{"_id": grupo_id} for grupo_id in ids]
+        for campo, acumulador in especificacao.items():
+            if campo == "_id":
+                continue
+            operador, expressao = next(iter(acumulador.items()))
+            fonte = expressao[1:] if isinstance(expressao, str) and expressao.startswith("$") else None
+            if operador == "$sum" and fonte in NUMERICOS:
+                # bincount soma na ordem das linhas, como o interpretador em memória
+                somas = np.bincount(grupos, weights=self.numeros[fonte][linhas], minlength=len(ids))
+                valores = somas.astype(np.int64).tolist() if NUMERICOS[fonte] is np.int64 else somas.tolist()
+            elif operador == "$last" and fonte in TEXTOS:
+                # Última linha de cada grupo: primeira ocorrência na ordem invertida
+                ultimas = linhas[len(linhas) - 1 - np.unique(grupos[::-1], return_index=True)[1]]
+                valores = [self.textos[fonte][i] for i in ultimas.tolist()]
+            else:
+                return None
+            for grupo, valor in zip(resultado, valores):
+                grupo[campo] = valor
+        # Grupos na ordem em que aparecem nas linhas, como no interpretador: o que for somado
+        # depois (vendas por categoria) sai igual bit a bit
+        primeiras = np.unique(grupos, return_index=True)[1]
+        return [resultado[i] for i in np.argsort(primeiras, kind="stable").tolist()]
+
+    def documentos(self, mascara: np.ndarray) -> List[Dict[str, Any]]:
+        linhas = np.flatnonzero(mascara)
+        colunas = {campo: [self.vocabularios[campo].valores[codigo] for codigo in self.codigos[campo][linhas].tolist()]
+                   for campo in CODIFICADOS}
+        colunas.update({campo: coluna[linhas].tolist() for campo, coluna in self.numeros.items()})
+        colunas.update({campo: [coluna[i] for i in linhas.tolist()] for campo, coluna in self.textos.items()})
+        return [dict(zip(colunas, valores)) for valores in zip(*colunas.values())]
+
+    def executar(self, mascara: np.ndarray, pipeline: List[Dict[str, Any]],
+                 colecoes: Dict[str, Callable[[], List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        for posicao, estagio in enumerate(pipeline):
+            nome, especificacao = next(iter(estagio.items()))
+            if nome == "$match" and self.vetorizavel(especificacao):
+                mascara = mascara & self.filtrar(especificacao)
+                continue
+            if nome == "$facet":
+                return [{campo: self.executar(mascara, sub, colecoes) for campo, sub in especificacao.items()}]
+            if nome == "$group":
+                grupos = self.agrupar(mascara, especificacao)
+                if grupos is not None:
+                    return executar_pipeline(grupos, pipeline[posicao + 1:], colecoes)
+            return executar_pipeline(self.documentos(mascara), pipeline[posicao:], colecoes)
+        return self.documentos(mascara)
+
+
+class MotorColunar:
+    def __init__(self, ttl: float, ler_linhas: Callable[[], AsyncIterator[Dict[str, Any]]],
+                 ler_produtos: Callable[[], List[Dict[str, Any]]]):
+        self.ttl = ttl
+        self.ler_linhas = ler_linhas
+        self.ler_produtos = ler_produtos  # para o $lookup de vendas por categoria
+        self.tabela: Optional[TabelaVendas] = None
+        self.carregada_em: Optional[float] = None
+        self.escritas = 0
+        self.lock = asyncio.Lock()
+
+    def registrar(self, acumulado: Dict[tuple, Dict[str, Any]]):
+        # Chamado depois de gravar o rollup; sem cópia carregada só conta a escrita
+        self.escritas += 1
+        if self.tabela is not None:
+            self.tabela.aplicar(acumulado)
+
+    def invalidar(self):
+        # Rollup reconstruído: a próxima consulta recarrega tudo
+        self.carregada_em = None
+
+    async def garantir_atualizada(self):
+        if self.carregada_em is not None and time.monotonic() - self.carregada_em < self.ttl:
+            return
+        async with self.lock:
+            if self.carregada_em is None or time.monotonic() - self.carregada_em >= self.ttl:
+                await self.carregar()
+
+    async def carregar(self):
+        for _ in range(TENTATIVAS_CARGA):
+            escritas = self.escritas
+            inicio = time.perf_counter()
+            tabela = TabelaVendas([linha async for linha in self.ler_linhas()])
+            if self.escritas == escritas:
+                break
+            # Venda gravada durante a leitura pode ter entrado ou não na cópia nova: fica a
+            # atual, que já recebeu a venda, e a recarga é refeita na próxima consulta
+            if self.tabela is not None:
+                return
+        else:
+            logger.warning("Rollup mudou durante todas as cargas do motor colunar; usando a última")
+        self.tabela = tabela
+        self.carregada_em = time.monotonic()
+        logger.info(f"Motor colunar carregado: {tabela.n} linhas em {time.perf_counter() - inicio:.2f}s")
+
+    async def agregar(self, filtro: Dict[str, Any], pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        await self.garantir_atualizada()
+        tabela = self.tabela
+        return tabela.executar(tabela.ativa[:tabela.n], [{"$match": filtro}, *pipeline], {"produtos": self.ler_produtos})
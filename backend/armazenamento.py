@@ -0,0 +1,1155 @@
+"""Camada de armazenamento do backend.
+
+As rotas de server.py falam com os repositórios deste módulo em vez de usar o
+Motor diretamente. Dois backends, escolhidos pela variável ARMAZENAMENTO:
+
+- mongo (padrão): MongoDB via Motor, as mesmas consultas de antes;
+- memoria: tudo em dicionários no próprio processo, para rodar a API inteira
+  (e benchmarks) numa máquina sem MongoDB. Os dados somem ao reiniciar.
+
+Filtros de pedidos/vendas e os pipelines de analytics continuam no dialeto do
+MongoDB; o backend em memória avalia só o subconjunto usado em server.py
+(ver corresponde e executar_pipeline). Erros de chave duplicada saem como as
+exceções do pymongo nos dois backends.
+"""
+import bisect
+import heapq
+import itertools
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DESCENDING, DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+# versao (relógio da sincronização incremental) só é lida por alteracoes, para o token
+# Chaves de busca dos clientes: gravadas junto do cliente, mas não saem da API
+CAMPOS_BUSCA_CLIENTE = ['telefone_normalizado', 'telefone_local', 'email_normalizado', 'email_dominio',
+                        'nome_normalizado', 'busca_nome']
+PROJECAO_CLIENTE = {"_id": 0, "versao": 0, **{campo: 0 for campo in CAMPOS_BUSCA_CLIENTE}}
+
+# expira_em (data BSON do índice TTL) é só para o MongoDB apagar jobs antigos
+PROJECAO_JOB = {"_id": 0, "expira_em": 0}
+JOBS_ATIVOS = ["na_fila", "processando"]
+
+# baixas_recentes é controle interno da baixa de estoque, não sai da API
+PROJECAO_PRODUTO = {"_id": 0, "versao": 0, "baixas_recentes": 0}
+MAX_BAIXAS_RECENTES = 50
+
+ORDEM_PEDIDOS = [("data_pedido", DESCENDING), ("id", DESCENDING)]
+# dia/mes (baldes inteiros no fuso da loja) servem ao rollup e aos agrupamentos e
+# estoque_baixado à exclusão (devolver ou não o estoque): não saem da API.
+# itens_sem_estoque sai de propósito, é campo do modelo Pedido
+CAMPOS_INTERNOS_PEDIDO = ('dia', 'mes', 'estoque_baixado')
+PROJECAO_PEDIDO = {"_id": 0, **{campo: 0 for campo in CAMPOS_INTERNOS_PEDIDO}}
+
+
+def chave_pedido(pedido: Dict[str, Any]) -> tuple:
+    return (pedido['data_pedido'], pedido['id'])
+
+
+class RelogioVersoes:
+    # Versão de sincronização (?since=) gravada em toda escrita de cliente/produto:
+    # microssegundos desde a época, sempre crescente dentro do processo. Uma escrita
+    # em lote usa uma versão só; processos na mesma máquina compartilham o relógio
+    def __init__(self):
+        self.ultima = 0
+
+    def proxima(self) -> int:
+        self.ultima = max(self.ultima + 1, time.time_ns() // 1000)
+        return self.ultima
+
+    @staticmethod
+    def em(instante: float) -> int:
+        return int(instante * 1_000_000)
+
+
+relogio_versoes = RelogioVersoes()
+
+
+def projetar(doc: Dict[str, Any], campos: Optional[List[str]] = None, sem: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    if campos is not None:
+        return {campo: doc[campo] for campo in campos if campo in doc}
+    return {campo: valor for campo, valor in doc.items() if campo not in sem}
+
+
+# MongoDB
+class MongoClientes:
+    def __init__(self, db):
+        self.colecao = db.clientes
+
+    async def inserir(self, cliente: Dict[str, Any]):
+        cliente['versao'] = relogio_versoes.proxima()
+        await self.colecao.insert_one(cliente)
+        cliente.pop('_id', None)
+        cliente.pop('versao', None)
+
+    async def listar(self, limite: int) -> List[Dict[str, Any]]:
+        return await self.colecao.find({}, PROJECAO_CLIENTE).to_list(limite)
+
+    async def alteracoes(self, versao: int, depois_de: Optional[str], limite: int) -> List[Dict[str, Any]]:
+        return await alteracoes_mongo(self.colecao, PROJECAO_CLIENTE, versao, depois_de, limite)
+
+    async def buscar(self, nome: str, prefixos: List[str], digitos: str, email: str, dominio: str,
+                     limite: int) -> List[Dict[str, Any]]:
+        # Cada condição é servida por um índice: prefixos do nome, prefixo do telefone (com
+        # e sem DDD), do email e do domínio do email
+        condicoes = []
+        if nome:
+            condicoes.append({"busca_nome": {"$all": prefixos}})
+        if digitos:
+            condicoes.append({"telefone_normalizado": {"$regex": f"^{digitos}"}})
+            condicoes.append({"telefone_local": {"$regex": f"^{digitos}"}})
+        if ' ' not in email:
+            condicoes.append({"email_normalizado": {"$regex": f"^{re.escape(email)}"}})
+        if dominio and ' ' not in dominio:
+            condicoes.append({"email_dominio": {"$regex": f"^{re.escape(dominio)}"}})
+        if not condicoes:
+            return []
+
+        # Relevância: match exato > nome começando pelo termo > demais
+        relevancia = [
+            {"$cond": [{"$eq": ["$nome_normalizado", nome]}, 4, 0]},
+            {"$cond": [{"$eq": [{"$indexOfCP": [{"$ifNull": ["$nome_normalizado", ""]}, nome]}, 0]}, 2, 0]},
+            {"$cond": [{"$eq": ["$email_normalizado", email]}, 4, 0]},
+        ]
+        if digitos:
+            relevancia.append({"$cond": [{"$in": [digitos, ["$telefone_normalizado", "$telefone_local"]]}, 4, 0]})
+
+        return await self.colecao.aggregate([
+            {"$match": {"$or": condicoes}},
+            {"$addFields": {"_relevancia": {"$add": relevancia}}},
+            {"$sort": {"_relevancia": -1, "nome_normalizado": 1}},
+            {"$limit": limite},
+            {"$project": {**PROJECAO_CLIENTE, "_relevancia": 0}},
+        ]).to_list(limite)
+
+    def exportar(self, campos: Optional[List[str]], tamanho_lote: int) -> AsyncIterator[Dict[str, Any]]:
+        projecao = PROJECAO_CLIENTE if campos is None else {"_id": 0, **{campo: 1 for campo in campos}}
+        return self.colecao.find({}, projecao).sort("id", 1).batch_size(tamanho_lote)
+
+    async def obter(self, cliente_id: str) -> Optional[Dict[str, Any]]:
+        return await self.colecao.find_one({"id": cliente_id}, PROJECAO_CLIENTE)
+
+    async def obter_muitos(self, cliente_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        # Uma consulta $in para o lote inteiro; retorna {id: cliente} dos encontrados
+        if not cliente_ids:
+            return {}
+        clientes = await self.colecao.find({"id": {"$in": cliente_ids}}, PROJECAO_CLIENTE).to_list(None)
+        return {cliente["id"]: cliente for cliente in clientes}
+
+    async def atualizar(self, cliente_id: str, campos: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await self.colecao.find_one_and_update(
+            {"id": cliente_id},
+            {"$set": {**campos, "versao": relogio_versoes.proxima()}},
+            projection=PROJECAO_CLIENTE,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def excluir(self, cliente_id: str) -> bool:
+        result = await self.colecao.delete_one({"id": cliente_id})
+        return result.deleted_count > 0
+
+    async def gravar_por_telefone(self, clientes: List[Dict[str, Any]]) -> Tuple[int, int, Dict[int, str]]:
+        # Um upsert por telefone: cliente novo ganha id/data_cadastro, existente é atualizado.
+        # Retorna (inseridos, atualizados, {posição: erro})
+        versao = relogio_versoes.proxima()
+        operacoes = [
+            UpdateOne(
+                {'telefone_normalizado': cliente['telefone_normalizado']},
+                {
+                    '$set': {**cliente, 'versao': versao},
+                    '$setOnInsert': {
+                        'id': str(ObjectId()),
+                        'data_cadastro': datetime.now(timezone.utc).isoformat()
+                    }
+                },
+                upsert=True
+            )
+            for cliente in clientes
+        ]
+        falhas = {}
+        try:
+            result = (await self.colecao.bulk_write(operacoes, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+            for erro in result.get('writeErrors', []):
+                falhas[erro['index']] = erro.get('errmsg', 'Erro ao gravar cliente')
+        return result.get('nUpserted', 0), result.get('nMatched', 0), falhas
+
+
+class MongoProdutos:
+    def __init__(self, db):
+        self.colecao = db.produtos
+
+    async def listar(self) -> List[Dict[str, Any]]:
+        return await self.colecao.find({}, PROJECAO_PRODUTO).to_list(None)
+
+    async def alteracoes(self, versao: int, depois_de: Optional[str], limite: int) -> List[Dict[str, Any]]:
+        return await alteracoes_mongo(self.colecao, PROJECAO_PRODUTO, versao, depois_de, limite)
+
+    async def inserir_muitos(self, produtos: List[Dict[str, Any]]):
+        versao = relogio_versoes.proxima()
+        for produto in produtos:
+            produto['versao'] = versao
+        try:
+            await self.colecao.insert_many(produtos)
+        finally:
+            for produto in produtos:
+                produto.pop('_id', None)
+                produto.pop('versao', None)
+
+    async def maior_cp(self) -> Optional[int]:
+        ultimo = await self.colecao.find_one({"cp": {"$type": "number"}}, {"_id": 0, "cp": 1}, sort=[("cp", -1)])
+        return ultimo["cp"] if ultimo else None
+
+    async def atualizar(self, produto_id: str, campos: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await self.colecao.find_one_and_update(
+            {"id": produto_id},
+            {"$set": {**campos, "versao": relogio_versoes.proxima()}},
+            projection=PROJECAO_PRODUTO,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def excluir(self, produto_id: str) -> bool:
+        result = await self.colecao.delete_one({"id": produto_id})
+        return result.deleted_count > 0
+
+    async def baixar_estoque(self, pedido_id: str, quantidades: Dict[str, float]) -> Dict[str, float]:
+        # Um único bulk_write com $inc condicionado a estoque suficiente ($gte) por produto.
+        # Cada baixa aplicada deixa o id do pedido em baixas_recentes (lista limitada): só
+        # quando algum produto fica sem estoque é feita uma leitura extra para saber quais valeram
+        versao = relogio_versoes.proxima()
+        operacoes = [
+            UpdateOne(
+                {"id": produto_id, "estoque_atual": {"$gte": quantidade}},
+                {
+                    "$inc": {"estoque_atual": -quantidade},
+                    "$set": {"versao": versao},
+                    "$push": {"baixas_recentes": {"$each": [pedido_id], "$slice": -MAX_BAIXAS_RECENTES}},
+                },
+            )
+            for produto_id, quantidade in quantidades.items()
+        ]
+        if not operacoes:
+            return {}
+
+        result = await self.colecao.bulk_write(operacoes, ordered=False)
+        if result.matched_count == len(operacoes):
+            return dict(quantidades)
+
+        aplicadas = await self.colecao.find(
+            {"id": {"$in": list(quantidades)}, "baixas_recentes": pedido_id}, {"_id": 0, "id": 1}
+        ).to_list(None)
+        ids_aplicados = {p["id"] for p in aplicadas}
+        return {pid: q for pid, q in quantidades.items() if pid in ids_aplicados}
+
+    async def estoques(self, produto_ids: List[str]) -> Dict[str, Any]:
+        produtos = await self.colecao.find(
+            {"id": {"$in": produto_ids}}, {"_id": 0, "id": 1, "estoque_atual": 1}
+        ).to_list(None)
+        return {produto["id"]: produto.get("estoque_atual") for produto in produtos}
+
+    async def repor_estoque(self, quantidades: Dict[str, float]):
+        if not quantidades:
+            return
+        versao = relogio_versoes.proxima()
+        await self.colecao.bulk_write(
+            [
+                UpdateOne({"id": pid}, {"$inc": {"estoque_atual": q}, "$set": {"versao": versao}})
+                for pid, q in quantidades.items()
+            ],
+            ordered=False,
+        )
+
+
+def filtro_alteracoes(versao: int, depois_de: Optional[str]) -> Dict[str, Any]:
+    # Documentos depois de (versao, depois_de); depois_de None pula a versão inteira
+    if depois_de is None:
+        return {"versao": {"$gt": versao}}
+    return {"$or": [{"versao": {"$gt": versao}}, {"versao": versao, "id": {"$gt": depois_de}}]}
+
+
+async def alteracoes_mongo(colecao, projecao: Dict[str, Any], versao: int, depois_de: Optional[str],
+                           limite: int) -> List[Dict[str, Any]]:
+    # Documentos alterados depois da posição, em ordem de (versao, id) (índice versao_id);
+    # aqui versao vem junto, é dela e do id que sai o token
+    projecao = {campo: valor for campo, valor in projecao.items() if campo != "versao"}
+    return await (
+        colecao.find(filtro_alteracoes(versao, depois_de), projecao)
+        .sort([("versao", 1), ("id", 1)])
+        .to_list(limite)
+    )
+
+
+class MongoExclusoes:
+    # Registro das exclusões de clientes/produtos para a sincronização incremental.
+    # O índice TTL de expira_em apaga os registros depois da retenção
+    def __init__(self, db):
+        self.colecao = db.exclusoes
+
+    async def registrar(self, colecao: str, item_id: str, expira_em: datetime):
+        await self.colecao.insert_one({
+            "colecao": colecao,
+            "id": item_id,
+            "versao": relogio_versoes.proxima(),
+            "expira_em": expira_em,
+        })
+
+    async def listar(self, colecao: str, desde: int) -> List[str]:
+        exclusoes = await self.colecao.find(
+            {"colecao": colecao, "versao": {"$gt": desde}}, {"_id": 0, "id": 1}
+        ).sort("versao", 1).to_list(None)
+        return [exclusao["id"] for exclusao in exclusoes]
+
+
+class MongoContadores:
+    # Sequências atômicas via find_one_and_update($inc): um único round trip reserva
+    # um bloco inteiro de valores, sem corrida entre processos
+    def __init__(self, db):
+        self.colecao = db.counters
+
+    async def alocar(self, nome: str, quantidade: int = 1) -> range:
+        contador = await self.colecao.find_one_and_update(
+            {"_id": nome},
+            {"$inc": {"seq": quantidade}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return range(contador["seq"] - quantidade + 1, contador["seq"] + 1)
+
+    async def semear(self, nome: str, minimo: int):
+        # $max: nunca volta o contador, então pode rodar a qualquer momento
+        await self.colecao.update_one({"_id": nome}, {"$max": {"seq": minimo}}, upsert=True)
+
+
+class MongoPedidos:
+    def __init__(self, db):
+        self.colecao = db.pedidos
+        self.arquivo = db.pedidos_arquivo
+
+    async def inserir(self, pedido: Dict[str, Any]):
+        await self.colecao.insert_one(pedido)
+        pedido.pop('_id', None)
+
+    async def inserir_muitos(self, pedidos: List[Dict[str, Any]]) -> Dict[int, str]:
+        # ordered=False: o resto do lote é gravado; retorna {posição: erro} das que falharam
+        falhas = {}
+        try:
+            await self.colecao.insert_many(pedidos, ordered=False)
+        except BulkWriteError as e:
+            for erro in e.details.get('writeErrors', []):
+                falhas[erro['index']] = erro.get('errmsg', 'Erro ao gravar pedido')
+        for pedido in pedidos:
+            pedido.pop('_id', None)
+        return falhas
+
+    async def _tem_arquivo(self) -> bool:
+        # Contagem pelos metadados: com o arquivamento desligado o arquivo fica vazio e
+        # as leituras não pagam a segunda coleção
+        return await self.arquivo.estimated_document_count() > 0
+
+    async def listar(self, filtro: Dict[str, Any], pular: int, limite: int) -> List[Dict[str, Any]]:
+        if not await self._tem_arquivo():
+            return await (
+                self.colecao.find(filtro, PROJECAO_PEDIDO).sort(ORDEM_PEDIDOS).skip(pular).limit(limite).to_list(limite)
+            )
+        # pedidos e pedidos_arquivo numa agregação só: o servidor ordena a união e corta
+        # a página, sem trazer pular + limite de cada coleção para cá
+        return await self.colecao.aggregate([
+            {"$match": filtro},
+            {"$unionWith": {"coll": self.arquivo.name, "pipeline": [{"$match": filtro}]}},
+            {"$sort": dict(ORDEM_PEDIDOS)},
+            *([{"$skip": pular}] if pular else []),
+            {"$limit": limite},
+            {"$project": PROJECAO_PEDIDO},
+        ]).to_list(limite)
+
+    async def contar(self, filtro: Dict[str, Any]) -> int:
+        # Sem filtros usa a contagem estimada (metadados das coleções)
+        colecoes = (self.colecao, self.arquivo) if await self._tem_arquivo() else (self.colecao,)
+        total = 0
+        for colecao in colecoes:
+            total += await (colecao.count_documents(filtro) if filtro else colecao.estimated_document_count())
+        return total
+
+    async def exportar(self, filtro: Dict[str, Any], campos: Optional[List[str]], tamanho_lote: int) -> AsyncIterator[Dict[str, Any]]:
+        # Intercala os dois cursores pela chave da ordem, que vai na projeção mesmo fora de campos
+        if campos is None:
+            projecao = PROJECAO_PEDIDO
+        else:
+            projecao = {"_id": 0, "data_pedido": 1, "id": 1, **{campo: 1 for campo in campos}}
+        principal, arquivo = [
+            colecao.find(filtro, projecao).sort(ORDEM_PEDIDOS).batch_size(tamanho_lote)
+            for colecao in (self.colecao, self.arquivo)
+        ]
+        atual, arquivado = await anext(principal, None), await anext(arquivo, None)
+        while atual is not None or arquivado is not None:
+            if arquivado is None or (atual is not None and chave_pedido(atual) > chave_pedido(arquivado)):
+                pedido, atual = atual, await anext(principal, None)
+            else:
+                pedido, arquivado = arquivado, await anext(arquivo, None)
+            yield pedido if campos is None else projetar(pedido, campos)
+
+    async def obter(self, pedido_id: str) -> Optional[Dict[str, Any]]:
+        return await self.colecao.find_one({"id": pedido_id}, PROJECAO_PEDIDO)
+
+    async def obter_arquivado(self, pedido_id: str) -> Optional[Dict[str, Any]]:
+        return await self.arquivo.find_one({"id": pedido_id}, PROJECAO_PEDIDO)
+
+    async def ids_existentes(self, pedido_ids: List[str]) -> set:
+        # Inclui os arquivados: um caixa que reenvia um pedido antigo não o duplica
+        if not pedido_ids:
+            return set()
+        pedidos = await self.colecao.find({"id": {"$in": pedido_ids}}, {"_id": 0, "id": 1}).to_list(None)
+        existentes = {pedido["id"] for pedido in pedidos}
+        restantes = [pedido_id for pedido_id in pedido_ids if pedido_id not in existentes]
+        if restantes:
+            arquivados = await self.arquivo.find({"id": {"$in": restantes}}, {"_id": 0, "id": 1}).to_list(None)
+            existentes.update(pedido["id"] for pedido in arquivados)
+        return existentes
+
+    async def meses_anteriores(self, antes_de: datetime) -> List[int]:
+        return sorted(await self.colecao.distinct("mes", {"data_pedido": {"$lt": antes_de}}))
+
+    async def arquivar(self, filtro: Dict[str, Any], limite: int) -> int:
+        # Copia um lote para pedidos_arquivo e só então apaga da coleção principal. Se cair
+        # no meio, a próxima rodada copia de novo (duplicados ignorados) e apaga
+        # Do mais antigo para o mais novo: o índice data_pedido_id é percorrido ao contrário
+        pedidos = await self.colecao.find(filtro, {"_id": 0}).sort("data_pedido", 1).limit(limite).to_list(limite)
+        if not pedidos:
+            return 0
+        try:
+            await self.arquivo.insert_many(pedidos, ordered=False)
+        except BulkWriteError as e:
+            if any(erro.get('code') != 11000 for erro in e.details.get('writeErrors', [])):
+                raise
+        await self.colecao.delete_many({"id": {"$in": [pedido["id"] for pedido in pedidos]}})
+        return len(pedidos)
+
+    async def excluir(self, pedido_id: str) -> Optional[Dict[str, Any]]:
+        # Retorna o pedido excluído (para desfazer rollup e estoque) ou None
+        return await self.colecao.find_one_and_delete({"id": pedido_id}, projection={"_id": 0})
+
+    async def timeline(self, filtro: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # Série por pedido: lê direto de pedidos e pedidos_arquivo, projetando só o necessário
+        return await self.colecao.aggregate([
+            {"$match": filtro},
+            {"$unionWith": {"coll": self.arquivo.name, "pipeline": [{"$match": filtro}]}},
+            {"$sort": {"data_pedido": 1}},
+            {"$project": {"_id": 0, "dia": 1, "valor": "$valor_total"}},
+        ]).to_list(None)
+
+
+class MongoFechamentos:
+    # Fechamentos mensais: gravados uma vez e nunca alterados; um ajuste posterior do
+    # mesmo mês entra como outro documento (sequencia seguinte)
+    def __init__(self, db):
+        self.colecao = db.fechamentos_mensais
+
+    async def listar(self, mes_inicio: Optional[int] = None, mes_fim: Optional[int] = None) -> List[Dict[str, Any]]:
+        faixa = {}
+        if mes_inicio is not None:
+            faixa["$gte"] = mes_inicio
+        if mes_fim is not None:
+            faixa["$lte"] = mes_fim
+        filtro = {"mes": faixa} if faixa else {}
+        return await self.colecao.find(filtro, {"_id": 0}).sort([("mes", 1), ("sequencia", 1)]).to_list(None)
+
+    async def inserir(self, fechamento: Dict[str, Any]) -> bool:
+        # False: outro processo gravou a mesma sequência antes (índice único)
+        try:
+            await self.colecao.insert_one(fechamento)
+        except DuplicateKeyError:
+            return False
+        finally:
+            fechamento.pop('_id', None)
+        return True
+
+
+class MongoVendas:
+    # Rollup vendas_diarias: uma linha por (dia, produto_id, cliente_id)
+    def __init__(self, db):
+        self.colecao = db.vendas_diarias
+
+    async def aplicar(self, acumulado: Dict[tuple, Dict[str, Any]]):
+        operacoes = []
+        for (dia, produto_id, cliente_id), linha in acumulado.items():
+            chave = {"dia": dia, "produto_id": produto_id, "cliente_id": cliente_id}
+            operacoes.append(UpdateOne(chave, {
+                "$inc": {"valor": linha["valor"], "quantidade": linha["quantidade"], "pedidos": linha["pedidos"]},
+                "$set": {"mes": linha["mes"], "produto_nome": linha["produto_nome"], "cliente_nome": linha["cliente_nome"]},
+            }, upsert=True))
+            if linha["pedidos"] < 0:
+                # Remove a linha quando o último pedido dela foi excluído
+                operacoes.append(DeleteOne({**chave, "pedidos": {"$lte": 0}}))
+
+        await self.colecao.bulk_write(operacoes, ordered=True)
+
+    async def agregar(self, filtro: Dict[str, Any], pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return await self.colecao.aggregate([{"$match": filtro}, *pipeline]).to_list(None)
+
+    def exportar(self, tamanho_lote: int) -> AsyncIterator[Dict[str, Any]]:
+        # Rollup inteiro, para a cópia do motor colunar (analytics_colunar.py)
+        return self.colecao.find({}, {"_id": 0}).batch_size(tamanho_lote)
+
+
+class MongoJobs:
+    # Estado dos jobs em segundo plano (importações CSV), consultado por GET /api/jobs/{id}
+    def __init__(self, db):
+        self.colecao = db.jobs
+
+    async def criar(self, job: Dict[str, Any]):
+        await self.colecao.insert_one(job)
+        job.pop('_id', None)
+
+    async def obter(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.colecao.find_one({"id": job_id}, PROJECAO_JOB)
+
+    async def atualizar(self, job_id: str, campos: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Retorna o job atualizado: quem grava o progresso enxerga um cancelamento pedido por outro processo
+        return await self.colecao.find_one_and_update(
+            {"id": job_id},
+            {"$set": campos},
+            projection=PROJECAO_JOB,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def solicitar_cancelamento(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self.colecao.find_one_and_update(
+            {"id": job_id, "status": {"$in": JOBS_ATIVOS}},
+            {"$set": {"cancelamento_solicitado": True}},
+            projection=PROJECAO_JOB,
+            return_document=ReturnDocument.AFTER,
+        )
+        return job if job is not None else await self.obter(job_id)
+
+    async def interromper_abandonados(self, antes_de: str, campos: Dict[str, Any]) -> int:
+        result = await self.colecao.update_many(
+            {"status": {"$in": JOBS_ATIVOS}, "atualizado_em": {"$lt": antes_de}},
+            {"$set": campos},
+        )
+        return result.modified_count
+
+
+# Memória
+# Tudo roda no event loop, sem await no meio de uma escrita, então cada método é atômico.
+# As leituras devolvem cópias rasas, como um driver devolveria documentos novos.
+def erro_duplicado(indice: str, valor: Any) -> DuplicateKeyError:
+    return DuplicateKeyError(f"E11000 duplicate key error index: {indice} dup key: {valor!r}", 11000)
+
+
+class MemoriaClientes:
+    def __init__(self):
+        self.por_id: Dict[str, Dict[str, Any]] = {}
+        self.por_telefone: Dict[str, str] = {}  # telefone_normalizado -> id (índice único parcial)
+
+    def _checar_telefone(self, cliente: Dict[str, Any], cliente_id: Optional[str]):
+        telefone = cliente.get('telefone_normalizado')
+        if telefone and self.por_telefone.get(telefone, cliente_id) != cliente_id:
+            raise erro_duplicado('telefone_normalizado_unico', telefone)
+
+    def _gravar(self, cliente: Dict[str, Any]):
+        anterior = self.por_id.get(cliente['id'])
+        if anterior and anterior.get('telefone_normalizado'):
+            self.por_telefone.pop(anterior['telefone_normalizado'], None)
+        self.por_id[cliente['id']] = cliente
+        if cliente.get('telefone_normalizado'):
+            self.por_telefone[cliente['telefone_normalizado']] = cliente['id']
+
+    def _publico(self, cliente: Dict[str, Any], campos: Optional[List[str]] = None) -> Dict[str, Any]:
+        return projetar(cliente, campos, sem=('versao', *CAMPOS_BUSCA_CLIENTE))
+
+    async def inserir(self, cliente: Dict[str, Any]):
+        if cliente['id'] in self.por_id:
+            raise erro_duplicado('id_unico', cliente['id'])
+        self._checar_telefone(cliente, None)
+        self._gravar({**cliente, 'versao': relogio_versoes.proxima()})
+
+    async def listar(self, limite: int) -> List[Dict[str, Any]]:
+        resultado = []
+        for cliente in self.por_id.values():
+            if len(resultado) >= limite:
+                break
+            resultado.append(self._publico(cliente))
+        return resultado
+
+    async def alteracoes(self, versao: int, depois_de: Optional[str], limite: int) -> List[Dict[str, Any]]:
+        return [
+            projetar(cliente, None, sem=tuple(CAMPOS_BUSCA_CLIENTE))
+            for cliente in alteracoes_memoria(self.por_id.values(), versao, depois_de, limite)
+        ]
+
+    async def buscar(self, nome: str, prefixos: List[str], digitos: str, email: str, dominio: str,
+                     limite: int) -> List[Dict[str, Any]]:
+        encontrados = []
+        for cliente in self.por_id.values():
+            busca_nome = cliente.get('busca_nome') or []
+            telefone = cliente.get('telefone_normalizado') or ''
+            local = cliente.get('telefone_local') or ''
+            email_cliente = cliente.get('email_normalizado') or ''
+            dominio_cliente = cliente.get('email_dominio') or ''
+            if not (
+                (nome and all(prefixo in busca_nome for prefixo in prefixos))
+                or (digitos and (telefone.startswith(digitos) or local.startswith(digitos)))
+                or (' ' not in email and cliente.get('email_normalizado') is not None and email_cliente.startswith(email))
+                or (dominio and ' ' not in dominio and cliente.get('email_dominio') is not None and dominio_cliente.startswith(dominio))
+            ):
+                continue
+            nome_cliente = cliente.get('nome_normalizado')
+            relevancia = (
+                (4 if nome_cliente == nome else 0)
+                + (2 if (nome_cliente or '').startswith(nome) else 0)
+                + (4 if cliente.get('email_normalizado') == email else 0)
+                + (4 if digitos and digitos in (telefone, local) else 0)
+            )
+            encontrados.append((relevancia, cliente))
+
+        encontrados.sort(key=lambda item: chave_ordem(item[1].get('nome_normalizado')))
+        encontrados.sort(key=lambda item: item[0], reverse=True)
+        return [self._publico(cliente) for _, cliente in encontrados[:limite]]
+
+    async def exportar(self, campos: Optional[List[str]], tamanho_lote: int) -> AsyncIterator[Dict[str, Any]]:
+        for cliente_id in sorted(self.por_id):
+            cliente = self.por_id.get(cliente_id)
+            if cliente is not None:
+                yield self._publico(cliente, campos)
+
+    async def obter(self, cliente_id: str) -> Optional[Dict[str, Any]]:
+        cliente = self.por_id.get(cliente_id)
+        return self._publico(cliente) if cliente is not None else None
+
+    async def obter_muitos(self, cliente_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return {
+            cliente_id: self._publico(self.por_id[cliente_id])
+            for cliente_id in cliente_ids if cliente_id in self.por_id
+        }
+
+    async def atualizar(self, cliente_id: str, campos: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        cliente = self.por_id.get(cliente_id)
+        if cliente is None:
+            return None
+        self._checar_telefone(campos, cliente_id)
+        atualizado = {**cliente, **campos, 'versao': relogio_versoes.proxima()}
+        self._gravar(atualizado)
+        return self._publico(atualizado)
+
+    async def excluir(self, cliente_id: str) -> bool:
+        cliente = self.por_id.pop(cliente_id, None)
+        if cliente is None:
+            return False
+        if cliente.get('telefone_normalizado'):
+            self.por_telefone.pop(cliente['telefone_normalizado'], None)
+        return True
+
+    async def gravar_por_telefone(self, clientes: List[Dict[str, Any]]) -> Tuple[int, int, Dict[int, str]]:
+        inseridos = atualizados = 0
+        versao = relogio_versoes.proxima()
+        for cliente in clientes:
+            cliente_id = self.por_telefone.get(cliente['telefone_normalizado'])
+            if cliente_id is not None:
+                self._gravar({**self.por_id[cliente_id], **cliente, 'versao': versao})
+                atualizados += 1
+            else:
+                self._gravar({
+                    **cliente,
+                    'versao': versao,
+                    'id': str(ObjectId()),
+                    'data_cadastro': datetime.now(timezone.utc).isoformat(),
+                })
+                inseridos += 1
+        return inseridos, atualizados, {}
+
+
+class MemoriaProdutos:
+    def __init__(self):
+        self.por_id: Dict[str, Dict[str, Any]] = {}
+        self.cps: Dict[int, str] = {}  # cp -> id (índice único parcial)
+
+    async def listar(self) -> List[Dict[str, Any]]:
+        return [projetar(produto, None, sem=('versao',)) for produto in self.por_id.values()]
+
+    async def alteracoes(self, versao: int, depois_de: Optional[str], limite: int) -> List[Dict[str, Any]]:
+        return [dict(produto) for produto in alteracoes_memoria(self.por_id.values(), versao, depois_de, limite)]
+
+    async def inserir_muitos(self, produtos: List[Dict[str, Any]]):
+        # Como o insert_many ordenado: para no primeiro duplicado, os anteriores ficam gravados
+        versao = relogio_versoes.proxima()
+        for posicao, produto in enumerate(produtos):
+            duplicado = None
+            if produto['id'] in self.por_id:
+                duplicado = ('id_unico', produto['id'])
+            elif isinstance(produto.get('cp'), (int, float)) and produto['cp'] in self.cps:
+                duplicado = ('cp_unico', produto['cp'])
+            if duplicado:
+                erro = erro_duplicado(*duplicado)
+                raise BulkWriteError({
+                    'writeErrors': [{'index': posicao, 'code': 11000, 'errmsg': str(erro)}],
+                    'nInserted': posicao,
+                })
+            self.por_id[produto['id']] = {**produto, 'versao': versao}
+            if isinstance(produto.get('cp'), (int, float)):
+                self.cps[produto['cp']] = produto['id']
+
+    async def maior_cp(self) -> Optional[int]:
+        return max(self.cps, default=None)
+
+    async def atualizar(self, produto_id: str, campos: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        produto = self.por_id.get(produto_id)
+        if produto is None:
+            return None
+        produto.update(campos, versao=relogio_versoes.proxima())
+        return projetar(produto, None, sem=('versao',))
+
+    async def excluir(self, produto_id: str) -> bool:
+        produto = self.por_id.pop(produto_id, None)
+        if produto is None:
+            return False
+        if self.cps.get(produto.get('cp')) == produto_id:
+            del self.cps[produto['cp']]
+        return True
+
+    async def baixar_estoque(self, pedido_id: str, quantidades: Dict[str, float]) -> Dict[str, float]:
+        baixadas = {}
+        versao = relogio_versoes.proxima()
+        for produto_id, quantidade in quantidades.items():
+            produto = self.por_id.get(produto_id)
+            estoque = produto.get('estoque_atual') if produto else None
+            if isinstance(estoque, (int, float)) and estoque >= quantidade:
+                produto['estoque_atual'] = estoque - quantidade
+                produto['versao'] = versao
+                baixadas[produto_id] = quantidade
+        return baixadas
+
+    async def estoques(self, produto_ids: List[str]) -> Dict[str, Any]:
+        return {
+            produto_id: self.por_id[produto_id].get('estoque_atual')
+            for produto_id in produto_ids if produto_id in self.por_id
+        }
+
+    async def repor_estoque(self, quantidades: Dict[str, float]):
+        versao = relogio_versoes.proxima()
+        for produto_id, quantidade in quantidades.items():
+            produto = self.por_id.get(produto_id)
+            if produto is not None:
+                produto['estoque_atual'] = (produto.get('estoque_atual') or 0) + quantidade
+                produto['versao'] = versao
+
+
+def alteracoes_memoria(docs, versao: int, depois_de: Optional[str], limite: int) -> List[Dict[str, Any]]:
+    filtro = filtro_alteracoes(versao, depois_de)
+    alterados = [doc for doc in docs if isinstance(doc.get('versao'), int) and corresponde(doc, filtro)]
+    alterados.sort(key=lambda doc: (doc['versao'], doc['id']))
+    return alterados[:limite]
+
+
+class MemoriaExclusoes:
+    def __init__(self):
+        self.registros: List[Dict[str, Any]] = []
+
+    async def registrar(self, colecao: str, item_id: str, expira_em: datetime):
+        agora = datetime.now(timezone.utc)
+        # Sem TTL aqui: os registros vencidos saem a cada exclusão nova
+        self.registros = [registro for registro in self.registros if registro["expira_em"] > agora]
+        self.registros.append({
+            "colecao": colecao,
+            "id": item_id,
+            "versao": relogio_versoes.proxima(),
+            "expira_em": expira_em,
+        })
+
+    async def listar(self, colecao: str, desde: int) -> List[str]:
+        return [
+            registro["id"] for registro in self.registros
+            if registro["colecao"] == colecao and registro["versao"] > desde
+        ]
+
+
+class MemoriaContadores:
+    def __init__(self):
+        self.valores: Dict[str, int] = {}
+
+    async def alocar(self, nome: str, quantidade: int = 1) -> range:
+        self.valores[nome] = self.valores.get(nome, 0) + quantidade
+        return range(self.valores[nome] - quantidade + 1, self.valores[nome] + 1)
+
+    async def semear(self, nome: str, minimo: int):
+        self.valores[nome] = max(self.valores.get(nome, minimo), minimo)
+
+
+class MemoriaPedidos:
+    def __init__(self):
+        self.por_id: Dict[str, Dict[str, Any]] = {}
+        self.ordem: List[Tuple[datetime, str]] = []  # (data_pedido, id) crescente; lido de trás para frente
+        self.arquivo: Dict[str, Dict[str, Any]] = {}
+        self.ordem_arquivo: List[Tuple[datetime, str]] = []
+
+    def _gravar(self, pedido: Dict[str, Any]):
+        self.por_id[pedido['id']] = dict(pedido)
+        bisect.insort(self.ordem, (pedido['data_pedido'], pedido['id']))
+
+    def _em_ordem(self, filtro: Dict[str, Any]):
+        # Principais e arquivados intercalados, como a listagem do MongoDB
+        for _, pedido_id in heapq.merge(reversed(self.ordem), reversed(self.ordem_arquivo), reverse=True):
+            pedido = self.por_id.get(pedido_id) or self.arquivo[pedido_id]
+            if corresponde(pedido, filtro):
+                yield pedido
+
+    async def inserir(self, pedido: Dict[str, Any]):
+        if pedido['id'] in self.por_id:
+            raise erro_duplicado('id_unico', pedido['id'])
+        self._gravar(pedido)
+
+    async def inserir_muitos(self, pedidos: List[Dict[str, Any]]) -> Dict[int, str]:
+        falhas = {}
+        for posicao, pedido in enumerate(pedidos):
+            if pedido['id'] in self.por_id:
+                falhas[posicao] = str(erro_duplicado('id_unico', pedido['id']))
+                continue
+            self._gravar(pedido)
+        return falhas
+
+    async def listar(self, filtro: Dict[str, Any], pular: int, limite: int) -> List[Dict[str, Any]]:
+        resultado = []
+        for pedido in self._em_ordem(filtro):
+            if pular:
+                pular -= 1
+                continue
+            resultado.append(projetar(pedido, None, sem=CAMPOS_INTERNOS_PEDIDO))
+            if len(resultado) >= limite:
+                break
+        return resultado
+
+    async def contar(self, filtro: Dict[str, Any]) -> int:
+        if not filtro:
+            return len(self.por_id) + len(self.arquivo)
+        return sum(1 for pedido in itertools.chain(self.por_id.values(), self.arquivo.values()) if corresponde(pedido, filtro))
+
+    async def exportar(self, filtro: Dict[str, Any], campos: Optional[List[str]], tamanho_lote: int) -> AsyncIterator[Dict[str, Any]]:
+        # Materializa a ordem antes: escritas durante a exportação não afetam o iterador
+        for pedido in list(self._em_ordem(filtro)):
+            yield projetar(pedido, campos, sem=CAMPOS_INTERNOS_PEDIDO)
+
+    async def obter(self, pedido_id: str) -> Optional[Dict[str, Any]]:
+        pedido = self.por_id.get(pedido_id)
+        return projetar(pedido, None, sem=CAMPOS_INTERNOS_PEDIDO) if pedido is not None else None
+
+    async def obter_arquivado(self, pedido_id: str) -> Optional[Dict[str, Any]]:
+        pedido = self.arquivo.get(pedido_id)
+        return projetar(pedido, None, sem=CAMPOS_INTERNOS_PEDIDO) if pedido is not None else None
+
+    async def ids_existentes(self, pedido_ids: List[str]) -> set:
+        return {pedido_id for pedido_id in pedido_ids if pedido_id in self.por_id or pedido_id in self.arquivo}
+
+    async def meses_anteriores(self, antes_de: datetime) -> List[int]:
+        return sorted({pedido['mes'] for pedido in self.por_id.values() if pedido['data_pedido'] < antes_de})
+
+    async def arquivar(self, filtro: Dict[str, Any], limite: int) -> int:
+        movidos = set()
+        for _, pedido_id in self.ordem:
+            if len(movidos) >= limite:
+                break
+            if corresponde(self.por_id[pedido_id], filtro):
+                movidos.add(pedido_id)
+        for pedido_id in movidos:
+            pedido = self.por_id.pop(pedido_id)
+            self.arquivo[pedido_id] = pedido
+            bisect.insort(self.ordem_arquivo, (pedido['data_pedido'], pedido_id))
+        if movidos:
+            self.ordem = [chave for chave in self.ordem if chave[1] not in movidos]
+        return len(movidos)
+
+    async def excluir(self, pedido_id: str) -> Optional[Dict[str, Any]]:
+        pedido = self.por_id.pop(pedido_id, None)
+        if pedido is None:
+            return None
+        posicao = bisect.bisect_left(self.ordem, (pedido['data_pedido'], pedido_id))
+        del self.ordem[posicao]
+        return pedido
+
+    async def timeline(self, filtro: Dict[str, Any]) -> List[Dict[str, Any]]:
+        pedidos = [pedido for pedido in itertools.chain(self.por_id.values(), self.arquivo.values()) if corresponde(pedido, filtro)]
+        pedidos.sort(key=lambda pedido: chave_ordem(pedido.get('data_pedido')))
+        return [{"dia": pedido['dia'], "valor": pedido.get('valor_total')} for pedido in pedidos]
+
+
+class MemoriaFechamentos:
+    def __init__(self):
+        self.fechamentos: List[Dict[str, Any]] = []
+
+    async def listar(self, mes_inicio: Optional[int] = None, mes_fim: Optional[int] = None) -> List[Dict[str, Any]]:
+        selecionados = [
+            dict(fechamento) for fechamento in self.fechamentos
+            if (mes_inicio is None or fechamento["mes"] >= mes_inicio) and (mes_fim is None or fechamento["mes"] <= mes_fim)
+        ]
+        return sorted(selecionados, key=lambda fechamento: (fechamento["mes"], fechamento["sequencia"]))
+
+    async def inserir(self, fechamento: Dict[str, Any]) -> bool:
+        if any(f["mes"] == fechamento["mes"] and f["sequencia"] == fechamento["sequencia"] for f in self.fechamentos):
+            return False
+        self.fechamentos.append(dict(fechamento))
+        return True
+
+
+class MemoriaVendas:
+    def __init__(self, produtos: MemoriaProdutos):
+        self.linhas: Dict[tuple, Dict[str, Any]] = {}
+        self.produtos = produtos  # para o $lookup de vendas por categoria
+
+    async def aplicar(self, acumulado: Dict[tuple, Dict[str, Any]]):
+        for chave, linha in acumulado.items():
+            dia, produto_id, cliente_id = chave
+            atual = self.linhas.setdefault(chave, {
+                "dia": dia, "mes": linha["mes"], "produto_id": produto_id, "cliente_id": cliente_id,
+                "valor": 0, "quantidade": 0, "pedidos": 0,
+            })
+            atual["valor"] += linha["valor"]
+            atual["quantidade"] += linha["quantidade"]
+            atual["pedidos"] += linha["pedidos"]
+            atual["produto_nome"] = linha["produto_nome"]
+            atual["cliente_nome"] = linha["cliente_nome"]
+            if linha["pedidos"] < 0 and atual["pedidos"] <= 0:
+                del self.linhas[chave]
+
+    async def agregar(self, filtro: Dict[str, Any], pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        linhas = [linha for linha in self.linhas.values() if corresponde(linha, filtro)]
+        colecoes = {"produtos": lambda: list(self.produtos.por_id.values())}
+        return executar_pipeline(linhas, pipeline, colecoes)
+
+    async def exportar(self, tamanho_lote: int) -> AsyncIterator[Dict[str, Any]]:
+        for linha in list(self.linhas.values()):
+            yield linha
+
+
+# Avaliação em memória do subconjunto da linguagem de consulta do MongoDB usado pelo
+# servidor. Qualquer coisa fora dele falha alto em vez de responder diferente do Mongo.
+def chave_ordem(valor: Any) -> tuple:
+    # Ordem entre tipos do MongoDB, restrita aos tipos usados aqui: null < números < strings < datas
+    if valor is None:
+        return (0, 0)
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return (1, valor)
+    if isinstance(valor, str):
+        return (2, valor)
+    if isinstance(valor, datetime):
+        return (3, valor)
+    return (4, str(valor))
+
+
+def valor_caminho(doc: Any, caminho: str) -> Any:
+    valor = doc
+    for parte in caminho.split('.'):
+        if isinstance(valor, list):
+            valor = [item.get(parte) for item in valor if isinstance(item, dict)]
+        elif isinstance(valor, dict):
+            valor = valor.get(parte)
+        else:
+            return None
+    return valor
+
+
+def comparar(valor: Any, esperado: Any, operador: Callable[[Any, Any], bool]) -> bool:
+    if valor is None or esperado is None or chave_ordem(valor)[0] != chave_ordem(esperado)[0]:
+        return False
+    return operador(valor, esperado)
+
+
+def igual(valor: Any, esperado: Any) -> bool:
+    if isinstance(valor, list) and not isinstance(esperado, list):
+        return esperado in valor
+    return valor == esperado
+
+
+OPERADORES = {
+    "$gt": lambda v, e: comparar(v, e, lambda a, b: a > b),
+    "$gte": lambda v, e: comparar(v, e, lambda a, b: a >= b),
+    "$lt": lambda v, e: comparar(v, e, lambda a, b: a < b),
+    "$lte": lambda v, e: comparar(v, e, lambda a, b: a <= b),
+    "$ne": lambda v, e: not igual(v, e),
+    "$in": lambda v, e: any(igual(v, item) for item in e),
+    "$nin": lambda v, e: not any(igual(v, item) for item in e),
+}
+
+
+def corresponde(doc: Dict[str, Any], filtro: Dict[str, Any]) -> bool:
+    for campo, condicao in filtro.items():
+        if campo == "$or":
+            if not any(corresponde(doc, sub) for sub in condicao):
+                return False
+        elif campo == "$and":
+            if not all(corresponde(doc, sub) for sub in condicao):
+                return False
+        else:
+            valor = valor_caminho(doc, campo)
+            if isinstance(condicao, dict) and condicao and all(op.startswith("$") for op in condicao):
+                for operador, esperado in condicao.items():
+                    if operador not in OPERADORES:
+                        raise NotImplementedError(f"Operador {operador} não suportado no armazenamento em memória")
+                    if not OPERADORES[operador](valor, esperado):
+                        return False
+            elif not igual(valor, condicao):
+                return False
+    return True
+
+
+def avaliar(doc: Dict[str, Any], expressao: Any) -> Any:
+    if isinstance(expressao, str) and expressao.startswith("$"):
+        return valor_caminho(doc, expressao[1:])
+    if isinstance(expressao, dict):
+        if len(expressao) == 1 and next(iter(expressao)).startswith("$"):
+            operador, argumentos = next(iter(expressao.items()))
+            if operador == "$substrBytes":
+                texto, inicio, tamanho = avaliar(doc, argumentos[0]), argumentos[1], argumentos[2]
+                return (texto or "").encode("utf-8")[inicio:inicio + tamanho].decode("utf-8", "ignore")
+            if operador == "$ifNull":
+                valor = avaliar(doc, argumentos[0])
+                return valor if valor is not None else avaliar(doc, argumentos[1])
+            if operador == "$arrayElemAt":
+                lista, posicao = avaliar(doc, argumentos[0]), argumentos[1]
+                return lista[posicao] if isinstance(lista, list) and -len(lista) <= posicao < len(lista) else None
+            raise NotImplementedError(f"Expressão {operador} não suportada no armazenamento em memória")
+        return {campo: avaliar(doc, valor) for campo, valor in expressao.items()}
+    return expressao
+
+
+def hashavel(valor: Any) -> Any:
+    if isinstance(valor, dict):
+        return tuple((campo, hashavel(v)) for campo, v in valor.items())
+    if isinstance(valor, list):
+        return tuple(hashavel(v) for v in valor)
+    return valor
+
+
+def agrupar(docs: List[Dict[str, Any]], especificacao: Dict[str, Any]) -> List[Dict[str, Any]]:
+    acumuladores = [(campo, *next(iter(acc.items()))) for campo, acc in especificacao.items() if campo != "_id"]
+    grupos: Dict[Any, Dict[str, Any]] = {}
+    for doc in docs:
+        grupo_id = avaliar(doc, especificacao["_id"])
+        grupo = grupos.get(hashavel(grupo_id))
+        if grupo is None:
+            grupo = grupos[hashavel(grupo_id)] = {"_id": grupo_id}
+            for campo, operador, _ in acumuladores:
+                grupo[campo] = 0 if operador == "$sum" else None
+        for campo, operador, expressao in acumuladores:
+            valor = avaliar(doc, expressao)
+            if operador == "$sum":
+                if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                    grupo[campo] += valor
+            elif operador == "$last":
+                grupo[campo] = valor
+            else:
+                raise NotImplementedError(f"Acumulador {operador} não suportado no armazenamento em memória")
+    return list(grupos.values())
+
+
+def ordenar(docs: List[Dict[str, Any]], especificacao: Dict[str, int]) -> List[Dict[str, Any]]:
+    # Ordenações estáveis da última chave para a primeira
+    for campo, direcao in reversed(list(especificacao.items())):
+        docs = sorted(docs, key=lambda doc: chave_ordem(valor_caminho(doc, campo)), reverse=direcao < 0)
+    return docs
+
+
+def executar_pipeline(docs: List[Dict[str, Any]], pipeline: List[Dict[str, Any]], colecoes: Dict[str, Callable[[], List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    for estagio in pipeline:
+        nome, especificacao = next(iter(estagio.items()))
+        if nome == "$match":
+            docs = [doc for doc in docs if corresponde(doc, especificacao)]
+        elif nome == "$group":
+            docs = agrupar(docs, especificacao)
+        elif nome == "$sort":
+            docs = ordenar(docs, especificacao)
+        elif nome == "$limit":
+            docs = docs[:especificacao]
+        elif nome == "$lookup":
+            estrangeiros: Dict[Any, List[Dict[str, Any]]] = {}
+            for estrangeiro in colecoes[especificacao["from"]]():
+                estrangeiros.setdefault(hashavel(valor_caminho(estrangeiro, especificacao["foreignField"])), []).append(estrangeiro)
+            docs = [
+                {**doc, especificacao["as"]: estrangeiros.get(hashavel(valor_caminho(doc, especificacao["localField"])), [])}
+                for doc in docs
+            ]
+        elif nome == "$facet":
+            docs = [{campo: executar_pipeline(docs, sub, colecoes) for campo, sub in especificacao.items()}]
+        else:
+            raise NotImplementedError(f"Estágio {nome} não suportado no armazenamento em memória")
+    return docs
+
+
+class MemoriaJobs:
+    def __init__(self):
+        self.por_id: Dict[str, Dict[str, Any]] = {}
+
+    async def criar(self, job: Dict[str, Any]):
+        if job['id'] in self.por_id:
+            raise erro_duplicado('id_unico', job['id'])
+        self.por_id[job['id']] = dict(job)
+
+    async def obter(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.por_id.get(job_id)
+        return projetar(job, None, sem=('expira_em',)) if job is not None else None
+
+    async def atualizar(self, job_id: str, campos: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        job = self.por_id.get(job_id)
+        if job is None:
+            return None
+        job.update(campos)
+        return projetar(job, None, sem=('expira_em',))
+
+    async def solicitar_cancelamento(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.por_id.get(job_id)
+        if job is not None and job['status'] in JOBS_ATIVOS:
+            job['cancelamento_solicitado'] = True
+        return await self.obter(job_id)
+
+    async def interromper_abandonados(self, antes_de: str, campos: Dict[str, Any]) -> int:
+        abandonados = [
+            job for job in self.por_id.values()
+            if job['status'] in JOBS_ATIVOS and job['atualizado_em'] < antes_de
+        ]
+        for job in abandonados:
+            job.update(campos)
+        return len(abandonados)
+
+
+class Repositorios:
+    def __init__(self, nome: str, clientes, produtos, contadores, pedidos, vendas, jobs, exclusoes, fechamentos):
+        self.nome = nome
+        self.clientes = clientes
+        self.produtos = produtos
+        self.contadores = contadores
+        self.pedidos = pedidos
+        self.vendas = vendas
+        self.jobs = jobs
+        self.exclusoes = exclusoes
+        self.fechamentos = fechamentos
+
+
+def repositorios_mongo(db) -> Repositorios:
+    return Repositorios(
+        "mongo",
+        clientes=MongoClientes(db),
+        produtos=MongoProdutos(db),
+        contadores=MongoContadores(db),
+        pedidos=MongoPedidos(db),
+        vendas=MongoVendas(db),
+        jobs=MongoJobs(db),
+        exclusoes=MongoExclusoes(db),
+        fechamentos=MongoFechamentos(db),
+    )
+
+
+def repositorios_memoria() -> Repositorios:
+    produtos = MemoriaProdutos()
+    return Repositorios(
+        "memoria",
+        clientes=MemoriaClientes(),
+        produtos=produtos,
+        contadores=MemoriaContadores(),
+        pedidos=MemoriaPedidos(),
+        vendas=MemoriaVendas(produtos),
+        jobs=MemoriaJobs(),
+        exclusoes=MemoriaExclusoes(),
+        fechamentos=MemoriaFechamentos(),
+    )
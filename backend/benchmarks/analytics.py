@@ -0,0 +1,139 @@
+"""Compara os motores de analytics (ANALYTICS_MOTOR=banco x colunar) rota a rota.
+
+Popula o armazenamento com benchmarks/dados.py, chama cada rota de analytics
+com o cache desligado, alternando entre o motor atual (agregação no MongoDB ou
+no interpretador do armazenamento em memória) e o colunar, e confere que as
+respostas são iguais. Mede também a carga inicial da cópia colunar e a
+atualização incremental depois de um lote de pedidos.
+
+Uso (a partir de backend/; ARMAZENAMENTO=memoria dispensa o MongoDB):
+
+    ARMAZENAMENTO=memoria python benchmarks/analytics.py --pedidos 100000
+    python benchmarks/analytics.py --sem-popular --repeticoes 20
+
+Com MongoDB, sem --sem-popular, os dados são gravados no banco do .env: use um banco descartável.
+"""
+import argparse
+import asyncio
+import logging
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+from benchmarks import dados  # noqa: E402
+
+
+def rotas(dias: int) -> List[Tuple[str, str, Dict[str, Any]]]:
+    hoje = datetime.now(timezone.utc).date()
+    mes = {"dataInicio": (hoje - timedelta(days=30)).isoformat(), "dataFim": hoje.isoformat()}
+    tudo = {"dataInicio": (hoje - timedelta(days=dias)).isoformat(), "dataFim": hoje.isoformat()}
+    return [
+        ("resumo", "/api/analytics/resumo", {}),
+        ("resumo_30_dias", "/api/analytics/resumo", mes),
+        ("vendas_por_dia", "/api/analytics/vendas-por-dia", tudo),
+        ("vendas_por_mes", "/api/analytics/vendas-por-mes", {"ano": hoje.year}),
+        ("vendas_por_produto", "/api/analytics/vendas-por-produto", {}),
+        ("top_produtos", "/api/analytics/top-produtos", mes),
+        ("vendas_por_categoria", "/api/analytics/vendas-por-categoria", {}),
+        ("produtos_por_mes", "/api/analytics/produtos-por-mes", tudo),
+        ("dashboard", "/api/analytics/dashboard", {}),
+        ("dashboard_30_dias", "/api/analytics/dashboard", mes),
+    ]
+
+
+def iguais(a: Any, b: Any) -> bool:
+    # O MongoDB não garante a ordem das somas: floats comparados com tolerância
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(iguais(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return isinstance(b, list) and len(a) == len(b) and all(iguais(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+
+async def medir(cliente: httpx.AsyncClient, motor: str, caminho: str, parametros: Dict[str, Any], repeticoes: int):
+    server.ANALYTICS_MOTOR = motor
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resposta = await cliente.get(caminho, params=parametros)
+        resposta.raise_for_status()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resposta.json()
+
+
+async def executar(args) -> bool:
+    await server.startup_db_client()
+    if not args.sem_popular:
+        inicio = time.perf_counter()
+        populacao = await dados.popular(args.clientes, args.produtos, args.pedidos, args.dias, args.semente)
+        print(f"Dados: {populacao} em {time.perf_counter() - inicio:.1f}s", file=sys.stderr)
+
+    inicio = time.perf_counter()
+    await server.motor_colunar.carregar()
+    print(f"Carga da cópia colunar: {server.motor_colunar.tabela.n} linhas em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+    # Sem cache as rotas medem a agregação, não o dicionário
+    server.cache_analytics.ttl = 0
+    falhou = False
+    transporte = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://analytics", timeout=None) as cliente:
+        print(f"\n{'rota':<22} {'banco (ms)':>11} {'colunar (ms)':>13} {'ganho':>7}  iguais")
+        for nome, caminho, parametros in rotas(args.dias):
+            for motor in ("banco", "colunar"):
+                await medir(cliente, motor, caminho, parametros, 1)  # aquecimento
+            tempo_banco, corpo_banco = await medir(cliente, "banco", caminho, parametros, args.repeticoes)
+            tempo_colunar, corpo_colunar = await medir(cliente, "colunar", caminho, parametros, args.repeticoes)
+            ok = iguais(corpo_banco, corpo_colunar)
+            falhou = falhou or not ok
+            print(f"{nome:<22} {tempo_banco:>11.2f} {tempo_colunar:>13.2f} {tempo_banco / tempo_colunar:>6.1f}x  {'sim' if ok else 'NÃO'}")
+
+    # Atualização incremental: o acumulado de um lote novo aplicado só na cópia colunar (o rollup não muda)
+    rnd = random.Random(args.semente + 1)
+    produtos = list(server.catalogo.por_id.values())
+    clientes = [cliente async for cliente in server.repos.clientes.exportar(None, dados.LOTE)]
+    lote = list(dados.gerar_pedidos(args.lote, clientes, produtos, args.dias, rnd))
+    vendas = {}
+    for pedido in lote:
+        server.acumular_vendas_diarias(vendas, pedido)
+    inicio = time.perf_counter()
+    server.motor_colunar.registrar(vendas)
+    print(f"\nAtualização incremental: {args.lote} pedidos ({len(vendas)} linhas do rollup) em "
+          f"{(time.perf_counter() - inicio) * 1000:.2f} ms")
+    return not falhou
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clientes", type=int, default=5_000)
+    parser.add_argument("--produtos", type=int, default=150)
+    parser.add_argument("--pedidos", type=int, default=50_000)
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--repeticoes", type=int, default=10, help="requisições por rota e motor")
+    parser.add_argument("--lote", type=int, default=1000, help="pedidos na medição da atualização incremental")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--sem-popular", action="store_true", help="usa os dados já gravados no banco")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.sem_popular and server.repos.nome == "memoria":
+        sys.exit("--sem-popular não faz sentido com ARMAZENAMENTO=memoria")
+
+    try:
+        ok = asyncio.run(executar(args))
+    finally:
+        if server.client is not None:
+            server.client.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Benchmark de carga da API, dentro do processo (httpx + ASGITransport sobre server.app).
+
+Popula o armazenamento com benchmarks/dados.py, dispara as rotas mais pesadas
+com N requisições concorrentes e mede p50/p95/p99 e vazão por cenário. O
+resultado vai para um JSON; --comparar mostra a variação contra uma execução
+anterior.
+
+Uso (a partir de backend/; ARMAZENAMENTO=memoria dispensa o MongoDB):
+
+    ARMAZENAMENTO=memoria python benchmarks/carga.py --pedidos 50000
+    python benchmarks/carga.py --sem-popular --comparar benchmarks/resultados/anterior.json
+
+Com MongoDB, sem --sem-popular, os dados são gravados no banco do .env: use um banco descartável.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+from benchmarks import dados  # noqa: E402
+
+RESULTADOS = Path(__file__).resolve().parent / "resultados"
+
+Requisicao = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicao - inferior)
+
+
+async def medir(cliente: httpx.AsyncClient, requisicao: Requisicao, total: int, concorrencia: int) -> Dict[str, Any]:
+    latencias: List[float] = []
+    erros = 0
+    bytes_recebidos = 0
+    proxima = 0
+
+    async def trabalhador():
+        nonlocal erros, bytes_recebidos, proxima
+        while proxima < total:
+            indice = proxima
+            proxima += 1
+            inicio = time.perf_counter()
+            resposta = await requisicao(cliente, indice)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            bytes_recebidos += len(resposta.content)
+            if resposta.status_code >= 400:
+                erros += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+    duracao = time.perf_counter() - inicio
+
+    return {
+        "requisicoes": total,
+        "erros": erros,
+        "p50_ms": round(percentil(latencias, 50), 3),
+        "p95_ms": round(percentil(latencias, 95), 3),
+        "p99_ms": round(percentil(latencias, 99), 3),
+        "media_ms": round(statistics.fmean(latencias), 3),
+        "vazao_rps": round(total / duracao, 1),
+        "bytes_por_resposta": bytes_recebidos // total,
+    }
+
+
+def cenarios(args, semente: int) -> Dict[str, Dict[str, Any]]:
+    # Cada cenário: requisição, quantas vezes e se o cache de analytics fica ligado
+    rnd = random.Random(semente)
+    hoje = datetime.now(timezone.utc).date()
+
+    def periodo():
+        fim = hoje - timedelta(days=rnd.randrange(args.dias))
+        inicio = fim - timedelta(days=rnd.choice([7, 30, 90]))
+        return {"dataInicio": inicio.isoformat(), "dataFim": fim.isoformat()}
+
+    def get(caminho: str, parametros: Optional[Callable[[], Dict[str, Any]]] = None, headers=None) -> Requisicao:
+        async def requisicao(cliente, indice):
+            return await cliente.get(caminho, params=parametros() if parametros else None, headers=headers)
+        return requisicao
+
+    def importar(caminho: str, gerar_csv: Callable[[], bytes]) -> Requisicao:
+        async def requisicao(cliente, indice):
+            # aguardar: mede a importação inteira, não só a criação do job
+            return await cliente.post(caminho, params={"aguardar": "true"},
+                                      files={"file": (f"carga_{indice}.csv", gerar_csv(), "text/csv")})
+        return requisicao
+
+    async def percorrer_cursor(cliente, indice):
+        # Lê 10 páginas seguidas pelo cursor, como a tela de pedidos rolando
+        resposta = await cliente.get("/api/pedidos", params={"pageSize": 50})
+        for _ in range(9):
+            cursor = resposta.json().get("nextCursor")
+            if not cursor:
+                break
+            resposta = await cliente.get("/api/pedidos", params={"pageSize": 50, "after": cursor})
+        return resposta
+
+    total_paginas = max(1, args.pedidos // 50)
+    n = args.requisicoes
+    return {
+        "analytics_resumo": {"requisicao": get("/api/analytics/resumo", periodo), "total": n, "cache": False},
+        "analytics_vendas_por_dia": {"requisicao": get("/api/analytics/vendas-por-dia", periodo), "total": n, "cache": False},
+        "analytics_top_produtos": {"requisicao": get("/api/analytics/top-produtos", periodo), "total": n, "cache": False},
+        "analytics_dashboard": {"requisicao": get("/api/analytics/dashboard", periodo), "total": n, "cache": False},
+        "analytics_dashboard_cache": {"requisicao": get("/api/analytics/dashboard"), "total": n, "cache": True},
+        "pedidos_pagina_1": {"requisicao": get("/api/pedidos", lambda: {"pageSize": 50}), "total": n, "cache": False},
+        "pedidos_pagina_profunda": {
+            "requisicao": get("/api/pedidos", lambda: {"pageSize": 50, "page": rnd.randint(1, total_paginas)}),
+            "total": n, "cache": False,
+        },
+        "pedidos_cursor_10_paginas": {"requisicao": percorrer_cursor, "total": max(1, n // 10), "cache": False},
+        "pedidos_por_periodo": {"requisicao": get("/api/pedidos", lambda: {"pageSize": 50, **periodo()}), "total": n, "cache": False},
+        "clientes_lista": {"requisicao": get("/api/clientes", lambda: {"limit": 100}), "total": n, "cache": False},
+        "clientes_busca": {
+            "requisicao": get("/api/clientes", lambda: {"search": rnd.choice(dados.PRIMEIROS_NOMES)[:3]}),
+            "total": n, "cache": False,
+        },
+        "produtos_lista": {"requisicao": get("/api/produtos"), "total": n, "cache": False},
+        "import_csv_clientes": {
+            "requisicao": importar("/api/clientes/import-csv", lambda: dados.csv_clientes(args.linhas_csv, rnd)),
+            "total": max(1, n // 20), "cache": False,
+        },
+        "import_csv_pedidos": {
+            "requisicao": importar("/api/pedidos/import-csv", lambda: dados.csv_pedidos(args.linhas_csv, args.dias, rnd)),
+            "total": max(1, n // 20), "cache": False,
+        },
+    }
+
+
+def imprimir(resultados: Dict[str, Dict[str, Any]], anterior: Optional[Dict[str, Any]]):
+    print(f"{'cenário':<28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'erros':>6}" + ("  p95 vs anterior" if anterior else ""))
+    for nome, r in resultados.items():
+        linha = f"{nome:<28} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['vazao_rps']:>9.1f} {r['erros']:>6}"
+        base = (anterior or {}).get(nome)
+        if base and base.get("p95_ms"):
+            linha += f"  {(r['p95_ms'] / base['p95_ms'] - 1) * 100:+.1f}%"
+        print(linha)
+
+
+async def executar(args) -> Dict[str, Any]:
+    # ASGITransport não dispara os eventos de startup: índices/migrações/catálogo aqui
+    await server.startup_db_client()
+
+    populacao = None
+    if not args.sem_popular:
+        inicio = time.perf_counter()
+        populacao = await dados.popular(args.clientes, args.produtos, args.pedidos, args.dias, args.semente)
+        populacao["segundos"] = round(time.perf_counter() - inicio, 1)
+        print(f"Dados: {populacao}", file=sys.stderr)
+
+    ttl_original = server.cache_analytics.ttl
+    resultados = {}
+    transporte = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://carga", timeout=None) as cliente:
+        for nome, cenario in cenarios(args, args.semente).items():
+            if args.cenarios and nome not in args.cenarios:
+                continue
+            # Sem cache os cenários de analytics medem a agregação, não o dicionário
+            server.cache_analytics.ttl = ttl_original if cenario["cache"] else 0
+            server.cache_analytics.invalidar()
+            await medir(cliente, cenario["requisicao"], min(3, cenario["total"]), 1)  # aquecimento
+            resultados[nome] = await medir(cliente, cenario["requisicao"], cenario["total"], args.concorrencia)
+            print(f"  {nome}: p95 {resultados[nome]['p95_ms']:.2f} ms", file=sys.stderr)
+    server.cache_analytics.ttl = ttl_original
+
+    return {
+        "data": datetime.now(timezone.utc).isoformat(),
+        "armazenamento": server.repos.nome,
+        "serializacao_rapida": server.SERIALIZACAO_RAPIDA,
+        "analytics_motor": server.ANALYTICS_MOTOR,
+        "python": platform.python_version(),
+        "parametros": {
+            campo: getattr(args, campo)
+            for campo in ("clientes", "produtos", "pedidos", "dias", "requisicoes", "concorrencia", "linhas_csv", "semente")
+        },
+        "populacao": populacao,
+        "cenarios": resultados,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clientes", type=int, default=5_000)
+    parser.add_argument("--produtos", type=int, default=150)
+    parser.add_argument("--pedidos", type=int, default=20_000)
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--requisicoes", type=int, default=200, help="requisições por cenário")
+    parser.add_argument("--concorrencia", type=int, default=10)
+    parser.add_argument("--linhas-csv", type=int, default=500, help="linhas por arquivo nos cenários de importação")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--cenarios", nargs="*", help="roda só os cenários citados")
+    parser.add_argument("--sem-popular", action="store_true", help="usa os dados já gravados no banco")
+    parser.add_argument("--saida", type=Path, help="arquivo JSON (padrão: benchmarks/resultados/carga-<data>.json)")
+    parser.add_argument("--comparar", type=Path, help="JSON de uma execução anterior")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # uma linha por requisição atrapalha a leitura
+    if args.sem_popular and server.repos.nome == "memoria":
+        sys.exit("--sem-popular não faz sentido com ARMAZENAMENTO=memoria")
+
+    anterior = json.loads(args.comparar.read_text())["cenarios"] if args.comparar else None
+
+    try:
+        relatorio = asyncio.run(executar(args))
+    finally:
+        if server.client is not None:
+            server.client.close()
+
+    saida = args.saida or RESULTADOS / f"carga-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False))
+
+    imprimir(relatorio["cenarios"], anterior)
+    print(f"\nResultado salvo em {saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Gerador de dados sintéticos: clientes, produtos e pedidos com itens.
+
+Os pedidos se espalham por um período configurável, com mais movimento no fim
+de semana e no horário comercial, produtos populares (distribuição de Zipf) e
+clientes frequentes. A mesma semente gera sempre os mesmos dados.
+
+Uso (a partir de backend/, grava no armazenamento configurado no .env):
+
+    python benchmarks/dados.py --clientes 100000 --produtos 300 --pedidos 1000000 --dias 365
+
+benchmarks/carga.py usa as mesmas funções para popular o armazenamento em memória.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+LOTE = 1000
+
+PRIMEIROS_NOMES = [
+    "Ana", "Maria", "José", "João", "Antônio", "Francisca", "Carlos", "Paulo", "Pedro", "Lucas",
+    "Luiz", "Marcos", "Luís", "Gabriel", "Rafael", "Márcia", "Daniel", "Marcelo", "Bruno", "Eduardo",
+    "Juliana", "Fernanda", "Patrícia", "Aline", "Sandra", "Camila", "Amanda", "Bruna", "Jéssica", "Letícia",
+]
+SOBRENOMES = [
+    "Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+    "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa",
+]
+RUAS = ["Rua das Flores", "Av. Brasil", "Rua São João", "Rua XV de Novembro", "Av. Paulista", "Rua da Feira"]
+
+# (tipo, porcionamento, qtd_porcionamento, faixa de preço, nomes)
+CATALOGO = [
+    ("Fruta", "kg", 1, (4, 18), ["Maçã", "Banana", "Laranja", "Mamão", "Manga", "Uva", "Pera", "Abacaxi", "Melancia", "Limão"]),
+    ("Verdura", "maço", 1, (2, 6), ["Alface", "Couve", "Rúcula", "Agrião", "Cheiro-verde", "Espinafre", "Salsa", "Coentro"]),
+    ("Legume", "kg", 1, (3, 12), ["Tomate", "Batata", "Cebola", "Cenoura", "Abobrinha", "Chuchu", "Beterraba", "Pepino"]),
+    ("Legume", "bandeja", 0.5, (5, 15), ["Vagem", "Quiabo", "Jiló", "Pimentão", "Berinjela"]),
+    ("Outros", "unidade", 1, (3, 25), ["Ovos (dúzia)", "Mel", "Queijo Minas", "Rapadura", "Farinha de mandioca"]),
+]
+VARIEDADES = ["", " orgânico", " especial", " graúdo", " da roça", " hidropônico"]
+
+
+def gerar_produtos(quantidade: int, rnd: random.Random) -> List[Dict[str, Any]]:
+    produtos = []
+    while len(produtos) < quantidade:
+        tipo, porcionamento, qtd, (minimo, maximo), nomes = rnd.choice(CATALOGO)
+        variedade = VARIEDADES[len(produtos) // 60 % len(VARIEDADES)]
+        produtos.append({
+            "nome": f"{rnd.choice(nomes)}{variedade}",
+            "tipo": tipo,
+            "porcionamento": porcionamento,
+            "qtd_porcionamento": qtd,
+            "valor_unitario": round(rnd.uniform(minimo, maximo), 2),
+            "estoque_atual": float(rnd.randint(0, 500)),
+        })
+    return produtos
+
+
+def gerar_clientes(quantidade: int, rnd: random.Random) -> Iterator[Dict[str, Any]]:
+    for indice in range(quantidade):
+        nome = f"{rnd.choice(PRIMEIROS_NOMES)} {rnd.choice(SOBRENOMES)} {rnd.choice(SOBRENOMES)}"
+        # Telefones únicos: DDD + 9 + número sequencial embaralhado
+        numero = (indice * 7919) % 100_000_000
+        yield {
+            "nome": nome,
+            "telefone": f"({rnd.choice([11, 19, 21, 31, 41])}) 9{numero // 10000:04d}-{numero % 10000:04d}",
+            "email": f"{server.normalizar_texto(nome).replace(' ', '.')}{indice}@exemplo.com" if rnd.random() < 0.4 else None,
+            "endereco": f"{rnd.choice(RUAS)}, {rnd.randint(1, 2000)}" if rnd.random() < 0.7 else None,
+            "sexo": rnd.choice(["M", "F", None]),
+            "observacao": None,
+        }
+
+
+def quantidade_item(produto: Dict[str, Any], rnd: random.Random) -> float:
+    if produto["porcionamento"] == "kg":
+        return rnd.choice([0.25, 0.5, 0.75, 1, 1, 1.5, 2, 3])
+    return float(rnd.choice([1, 1, 1, 2, 2, 3, 6]))
+
+
+def gerar_pedidos(
+    quantidade: int,
+    clientes: List[Dict[str, Any]],
+    produtos: List[Dict[str, Any]],
+    dias: int,
+    rnd: random.Random,
+) -> Iterator[Dict[str, Any]]:
+    fim = datetime.now(timezone.utc).replace(microsecond=0)
+    inicio = fim - timedelta(days=dias)
+    # Popularidade de Zipf para produtos; 20% dos clientes fazem ~80% das compras identificadas
+    pesos_produtos = [1 / (posicao + 1) for posicao in range(len(produtos))]
+    frequentes = clientes[:max(1, len(clientes) // 5)]
+
+    for _ in range(quantidade):
+        dia = inicio + timedelta(days=rnd.randrange(dias))
+        if dia.weekday() < 5 and rnd.random() < 0.3:
+            dia += timedelta(days=5 - dia.weekday())  # puxa parte do movimento para o sábado
+        data_pedido = dia.replace(hour=rnd.choice(range(7, 20)), minute=rnd.randrange(60), second=rnd.randrange(60),
+                                  microsecond=rnd.randrange(1_000_000))
+        if data_pedido > fim:
+            data_pedido -= timedelta(days=7)
+
+        cliente = None
+        if clientes and rnd.random() < 0.7:
+            cliente = rnd.choice(frequentes) if rnd.random() < 0.8 else rnd.choice(clientes)
+
+        itens = []
+        for produto in rnd.choices(produtos, weights=pesos_produtos, k=rnd.randint(1, 8)):
+            quantidade_produto = quantidade_item(produto, rnd)
+            itens.append({
+                "produto_id": produto["id"],
+                "produto_nome": produto["nome"],
+                "quantidade": quantidade_produto,
+                "valor_unitario": produto["valor_unitario"],
+                "valor_total": round(quantidade_produto * produto["valor_unitario"], 2),
+            })
+
+        yield {
+            "id": str(server.ObjectId()),
+            **server.campos_data_pedido(data_pedido),
+            "cliente_id": cliente["id"] if cliente else None,
+            "cliente_nome": cliente["nome"] if cliente else None,
+            "cliente_telefone": cliente["telefone"] if cliente else None,
+            "cliente_endereco": cliente.get("endereco") if cliente else None,
+            "total_itens": sum(item["quantidade"] for item in itens),
+            "valor_total": round(sum(item["valor_total"] for item in itens), 2),
+            "observacao": None,
+            "itens": itens,
+        }
+
+
+def csv_clientes(quantidade: int, rnd: random.Random) -> bytes:
+    # Mesmo layout aceito por POST /api/clientes/import-csv
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\n')
+    writer.writerow(server.CAMPOS_CSV_CLIENTES)
+    for cliente in gerar_clientes(quantidade, rnd):
+        writer.writerow(['' if cliente[campo] is None else cliente[campo] for campo in server.CAMPOS_CSV_CLIENTES])
+    return buffer.getvalue().encode('utf-8')
+
+
+def csv_pedidos(quantidade: int, dias: int, rnd: random.Random) -> bytes:
+    # Mesmo layout aceito por POST /api/pedidos/import-csv (sem itens)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\n')
+    writer.writerow(server.CAMPOS_CSV_PEDIDOS)
+    fim = datetime.now(timezone.utc).date()
+    for _ in range(quantidade):
+        writer.writerow([
+            (fim - timedelta(days=rnd.randrange(dias))).isoformat(),
+            f"{rnd.choice(PRIMEIROS_NOMES)} {rnd.choice(SOBRENOMES)}",
+            '',
+            rnd.randint(1, 8),
+            f"{rnd.uniform(5, 200):.2f}".replace('.', ','),
+            '',
+        ])
+    return buffer.getvalue().encode('utf-8')
+
+
+async def popular(clientes: int, produtos: int, pedidos: int, dias: int, semente: int = 42, progresso: bool = False) -> Dict[str, int]:
+    # Grava pelo mesmo caminho das rotas (repositórios, contador de cp, rollup)
+    rnd = random.Random(semente)
+
+    produtos_dict = [{**produto, "id": str(server.ObjectId())} for produto in gerar_produtos(produtos, rnd)]
+    for inicio in range(0, len(produtos_dict), LOTE):
+        await server.inserir_produtos(produtos_dict[inicio:inicio + LOTE])
+
+    lote = []
+    for cliente in gerar_clientes(clientes, rnd):
+        cliente.update(server.chaves_busca_cliente(cliente))
+        lote.append(cliente)
+        if len(lote) >= LOTE:
+            await server.repos.clientes.gravar_por_telefone(lote)
+            lote = []
+    if lote:
+        await server.repos.clientes.gravar_por_telefone(lote)
+    clientes_dict = [cliente async for cliente in server.repos.clientes.exportar(None, LOTE)]
+
+    lote = []
+    gravados = 0
+    for pedido in gerar_pedidos(pedidos, clientes_dict, produtos_dict, dias, rnd):
+        lote.append(pedido)
+        if len(lote) >= LOTE:
+            gravados += await gravar_pedidos(lote)
+            lote = []
+            if progresso and gravados % (LOTE * 50) == 0:
+                print(f"  {gravados} pedidos", file=sys.stderr)
+    gravados += await gravar_pedidos(lote)
+
+    await server.catalogo.carregar()
+    return {"clientes": len(clientes_dict), "produtos": len(produtos_dict), "pedidos": gravados}
+
+
+async def gravar_pedidos(lote: List[Dict[str, Any]]) -> int:
+    if not lote:
+        return 0
+    falhas = await server.repos.pedidos.inserir_muitos(lote)
+    vendas = {}
+    for posicao, pedido in enumerate(lote):
+        if posicao not in falhas:
+            server.acumular_vendas_diarias(vendas, pedido)
+    await server.aplicar_vendas_diarias(vendas)
+    return len(lote) - len(falhas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clientes", type=int, default=10_000)
+    parser.add_argument("--produtos", type=int, default=200)
+    parser.add_argument("--pedidos", type=int, default=100_000)
+    parser.add_argument("--dias", type=int, default=365, help="período coberto pelos pedidos, até hoje")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    if server.repos.nome == "memoria":
+        sys.exit("ARMAZENAMENTO=memoria: os dados sumiriam com o processo. Use benchmarks/carga.py.")
+
+    async def executar():
+        await server.startup_db_client()
+        inicio = time.perf_counter()
+        totais = await popular(args.clientes, args.produtos, args.pedidos, args.dias, args.semente, progresso=True)
+        print(f"Gravados {totais} em {time.perf_counter() - inicio:.1f}s")
+
+    try:
+        asyncio.run(executar())
+    finally:
+        if server.client is not None:
+            server.client.close()
+
+
+if __name__ == "__main__":
+    main()
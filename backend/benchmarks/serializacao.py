@@ -0,0 +1,128 @@
+"""Compara a serialização padrão (response_model + json) com o caminho rápido
+(projetor + orjson) nas rotas de lista, e confere que os bytes são iguais.
+
+Uso (a partir de backend/, com o mesmo .env do servidor; não acessa o banco):
+
+    python benchmarks/serializacao.py [--itens 1000] [--repeticoes 50]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+import server  # noqa: E402
+
+NOMES = ["Maçã Fuji", "Alface Crespa", "Pão de Queijo", "Limão Tahiti", "Açaí", "Mandioca"]
+
+
+def gerar_clientes(n):
+    return [{
+        "id": f"c{i}",
+        "nome": f"{random.choice(NOMES)} {i}",
+        "telefone": f"119{random.randint(10000000, 99999999)}",
+        "email": random.choice([None, f"cliente{i}@exemplo.com"]),
+        "endereco": "Rua José, 12 — \"fundos\"",
+        "data_cadastro": "2024-05-01T12:00:00+00:00",
+        # sexo/observacao ausentes: saem como null pelo default do modelo
+    } for i in range(n)]
+
+
+def gerar_produtos(n):
+    return [{
+        "id": f"p{i}",
+        "cp": i + 1,
+        "nome": random.choice(NOMES),
+        "tipo": random.choice(["Fruta", "Verdura", "Legume"]),
+        "porcionamento": "kg",
+        "qtd_porcionamento": random.choice([1, 0.5, 0.25]),
+        "valor_unitario": random.choice([10, 4.99, round(random.uniform(1, 50), 2)]),
+        "estoque_atual": random.choice([0, 12.5, 3]),
+    } for i in range(n)]
+
+
+def gerar_pedidos(n):
+    pedidos = []
+    for i in range(n):
+        itens = [{
+            "produto_id": f"p{j}",
+            "produto_nome": random.choice(NOMES),
+            "quantidade": random.choice([1, 2, 0.75]),
+            "valor_unitario": 4.99,
+            "valor_total": round(4.99 * random.choice([1, 2, 0.75]), 2),
+        } for j in range(random.randint(1, 6))]
+        pedidos.append({
+            "id": f"o{i}",
+            "data_pedido": datetime(2024, 5, 1, 12, 0, 0, 123000, tzinfo=timezone.utc),
+            "cliente_id": f"c{i % 50}",
+            "cliente_nome": random.choice(NOMES),
+            "total_itens": len(itens),
+            "valor_total": round(sum(item["valor_total"] for item in itens), 2),
+            "observacao": None,
+            "itens": itens,
+        })
+    return {"pedidos": pedidos, "totalCount": n, "pageSize": n, "nextCursor": None, "page": 1}
+
+
+def medir(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        corpo = funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, corpo
+
+
+def caminho_padrao(modelo):
+    # O mesmo que o FastAPI faz numa rota com response_model
+    campo = create_response_field(name="Response", type_=modelo, mode="serialization")
+    loop = asyncio.new_event_loop()
+
+    def serializar(docs):
+        conteudo = loop.run_until_complete(serialize_response(field=campo, response_content=docs))
+        return JSONResponse(conteudo).body
+
+    return serializar
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--itens", type=int, default=1000)
+    parser.add_argument("--repeticoes", type=int, default=50)
+    args = parser.parse_args()
+
+    casos = [
+        ("clientes", caminho_padrao(List[server.Cliente]),
+         lambda docs: server.RespostaJSONRapida([server.projetar_cliente(d) for d in docs]).body,
+         gerar_clientes(args.itens)),
+        ("produtos", caminho_padrao(List[server.Produto]),
+         lambda docs: server.RespostaJSONRapida([server.projetar_produto(d) for d in docs]).body,
+         gerar_produtos(args.itens)),
+        ("pedidos", lambda docs: JSONResponse(jsonable_encoder(docs)).body,
+         lambda docs: server.RespostaJSONRapida(docs).body,
+         gerar_pedidos(args.itens)),
+    ]
+
+    print(f"{'rota':<10} {'padrão (ms)':>12} {'rápido (ms)':>12} {'ganho':>7}  bytes iguais")
+    falhou = False
+    for nome, padrao, rapido, docs in casos:
+        tempo_padrao, corpo_padrao = medir(lambda: padrao(docs), args.repeticoes)
+        tempo_rapido, corpo_rapido = medir(lambda: rapido(docs), args.repeticoes)
+        iguais = corpo_padrao == corpo_rapido
+        falhou = falhou or not iguais
+        print(f"{nome:<10} {tempo_padrao:>12.2f} {tempo_rapido:>12.2f} {tempo_padrao / tempo_rapido:>6.1f}x  {'sim' if iguais else 'NÃO'}")
+
+    server.client.close()
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == "__main__":
+    main()
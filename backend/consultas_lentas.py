@@ -0,0 +1,196 @@
+"""Captura de consultas lentas com o plano de execução.
+
+O MonitorComandos (metricas.py) entrega aqui todo comando de leitura que passou
+de SLOW_QUERY_MS. A consulta vai para uma fila e uma tarefa em segundo plano
+roda o mesmo comando com explain("executionStats"), resume o plano (COLLSCAN
+ou IXSCAN, índices usados, documentos examinados x retornados) e grava tudo
+na coleção capada slow_queries, lida por GET /api/diagnostics/slow-queries.
+
+O listener roda nas threads do Motor: observar() só copia o comando e agenda
+no loop. Consultas com o mesmo formato (mesmos campos e operadores, valores
+quaisquer) reaproveitam o plano por SLOW_QUERY_INTERVALO_EXPLAIN segundos,
+para uma rota lenta não dobrar a carga do banco com explains repetidos.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from bson import json_util
+
+logger = logging.getLogger(__name__)
+
+COLECAO = "slow_queries"
+# O explain nunca executa escritas: um findAndModify lento é explicado (plano e
+# executionStats) sem alterar documento. aggregate com $out/$merge fica de fora mesmo
+# assim (ver observar), por precaução
+EXPLICAVEIS = {"find", "aggregate", "count", "distinct", "findAndModify"}
+CAMPOS_FILTRO = {"find": "filter", "count": "query", "distinct": "query", "findAndModify": "query"}
+# Campos de sessão/roteamento que o driver acrescenta e o explain não aceita dentro do comando
+CAMPOS_DRIVER = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern", "apiVersion",
+                 "apiStrict", "apiDeprecationErrors"}
+
+
+def para_json(valor: Any) -> Any:
+    # Regex, ObjectId, datas etc. viram JSON estendido relaxado: o registro sai na API sem conversão
+    return json.loads(json_util.dumps(valor, json_options=json_util.RELAXED_JSON_OPTIONS))
+
+
+def forma(valor: Any) -> Any:
+    # Mesmo formato = mesmas chaves e operadores; valores trocados por marcadores
+    if isinstance(valor, dict):
+        return {chave: forma(v) for chave, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        formas = [forma(v) for v in valor]
+        # Pipelines e $or contam estágio a estágio; listas de valores ($in) contam como uma só
+        return formas if any(isinstance(v, (dict, list, tuple)) for v in valor) else formas[:1]
+    return type(valor).__name__
+
+
+def resumir_plano(explain: Dict[str, Any]) -> Dict[str, Any]:
+    # find devolve queryPlanner/executionStats no topo; aggregate, dentro de stages[0].$cursor
+    planner = procurar(explain, "queryPlanner") or {}
+    stats = procurar(explain, "executionStats") or {}
+    estagios: List[str] = []
+    indices: List[str] = []
+
+    def percorrer(no: Any):
+        if isinstance(no, dict):
+            if isinstance(no.get("stage"), str):
+                estagios.append(no["stage"])
+                if no.get("indexName"):
+                    indices.append(no["indexName"])
+            for filho in no.values():
+                percorrer(filho)
+        elif isinstance(no, list):
+            for filho in no:
+                percorrer(filho)
+
+    percorrer(planner.get("winningPlan"))
+    return {
+        "estagios": estagios,
+        "indices": list(dict.fromkeys(indices)),
+        "collscan": "COLLSCAN" in estagios,
+        "docs_examinados": stats.get("totalDocsExamined"),
+        "chaves_examinadas": stats.get("totalKeysExamined"),
+        "retornados": stats.get("nReturned"),
+        "tempo_execucao_ms": stats.get("executionTimeMillis"),
+    }
+
+
+def procurar(valor: Any, chave: str) -> Optional[Dict[str, Any]]:
+    if isinstance(valor, dict):
+        if isinstance(valor.get(chave), dict):
+            return valor[chave]
+        valores = valor.values()
+    elif isinstance(valor, list):
+        valores = valor
+    else:
+        return None
+    for filho in valores:
+        encontrado = procurar(filho, chave)
+        if encontrado is not None:
+            return encontrado
+    return None
+
+
+class CapturaConsultasLentas:
+    def __init__(self, limite_ms: float, intervalo_explain: float, tamanho_fila: int):
+        self.limite = limite_ms / 1000
+        self.intervalo_explain = intervalo_explain
+        self.fila: Optional[asyncio.Queue] = None
+        self.tamanho_fila = tamanho_fila
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.tarefa: Optional[asyncio.Task] = None
+        self.db = None
+        self.planos: Dict[str, tuple] = {}  # forma -> (quando, plano)
+        self.descartadas = 0
+
+    def interessa(self, nome: str) -> bool:
+        return self.loop is not None and nome in EXPLICAVEIS
+
+    def iniciar(self, db):
+        if self.limite <= 0:
+            return
+        self.db = db
+        self.loop = asyncio.get_running_loop()
+        self.fila = asyncio.Queue(self.tamanho_fila)
+        self.tarefa = self.loop.create_task(self.processar())
+
+    async def parar(self):
+        self.loop = None
+        if self.tarefa is not None:
+            self.tarefa.cancel()
+            try:
+                await self.tarefa
+            except asyncio.CancelledError:
+                pass
+            self.tarefa = None
+
+    def observar(self, banco: str, colecao: str, nome: str, comando: Dict[str, Any], duracao: float, documentos: int,
+                 rota: Optional[str]):
+        # Chamado na thread do Motor: nada de I/O aqui
+        loop = self.loop
+        if loop is None or duracao < self.limite or colecao == COLECAO or banco != self.db.name:
+            return
+        if nome == "aggregate" and any("$out" in estagio or "$merge" in estagio for estagio in comando.get("pipeline", [])):
+            return
+        consulta = {
+            chave: valor for chave, valor in comando.items()
+            if not chave.startswith("$") and chave not in CAMPOS_DRIVER
+        }
+        registro = {
+            "data": datetime.now(timezone.utc).isoformat(),
+            "colecao": colecao,
+            "comando": nome,
+            "rota": rota,
+            "duracao_ms": round(duracao * 1000, 2),
+            "documentos_retornados": documentos,
+        }
+        try:
+            loop.call_soon_threadsafe(self.enfileirar, consulta, registro)
+        except RuntimeError:  # loop já fechado
+            pass
+
+    def enfileirar(self, consulta: Dict[str, Any], registro: Dict[str, Any]):
+        try:
+            self.fila.put_nowait((consulta, registro))
+        except asyncio.QueueFull:
+            self.descartadas += 1
+
+    async def processar(self):
+        while True:
+            consulta, registro = await self.fila.get()
+            try:
+                await self.gravar(consulta, registro)
+            except Exception:
+                logger.exception("Falha ao registrar consulta lenta")
+
+    async def gravar(self, consulta: Dict[str, Any], registro: Dict[str, Any]):
+        nome = registro["comando"]
+        registro["filtro"] = para_json(consulta.get("pipeline") if nome == "aggregate" else consulta.get(CAMPOS_FILTRO[nome]))
+        registro["ordenacao"] = para_json(consulta.get("sort"))
+        registro["limite"] = consulta.get("limit")
+
+        chave = json.dumps([registro["colecao"], nome, forma(consulta)], sort_keys=True)
+        agora = time.monotonic()
+        em_cache = self.planos.get(chave)
+        if em_cache is not None and agora - em_cache[0] < self.intervalo_explain:
+            registro["plano"] = em_cache[1]
+            registro["plano_reaproveitado"] = True
+        else:
+            try:
+                explain = await self.db.command({"explain": consulta, "verbosity": "executionStats"})
+                registro["plano"] = resumir_plano(explain)
+                self.planos[chave] = (agora, registro["plano"])
+            except Exception as e:
+                registro["plano"] = None
+                registro["erro_explain"] = str(e)
+            registro["plano_reaproveitado"] = False
+            # Formatos antigos saem do cache para ele não crescer sem limite
+            if len(self.planos) > 1000:
+                self.planos = {k: v for k, v in self.planos.items() if agora - v[0] < self.intervalo_explain}
+
+        await self.db[COLECAO].insert_one(registro)
@@ -0,0 +1,167 @@
+"""Jobs em segundo plano (hoje: importações CSV).
+
+A rota cria o job (status na_fila), agenda uma tarefa no event loop e responde
+na hora com o id. No máximo IMPORT_JOBS_CONCORRENCIA jobs rodam ao mesmo tempo
+por processo; os demais esperam na fila. O estado fica na coleção jobs (ou no
+armazenamento em memória) e é lido por GET /api/jobs/{id}:
+
+    na_fila -> processando -> concluido | falhou | cancelado
+
+O cancelamento é cooperativo: DELETE /api/jobs/{id} marca o job e a tarefa
+para no próximo lote gravado (um job ainda na fila deste processo é cancelado
+na hora). Como o progresso é gravado a cada lote, o pedido de cancelamento
+chega também quando o job roda em outro processo. Jobs que ficaram ativos sem
+progresso por JOB_ABANDONADO_SEGUNDOS (processo reiniciado no meio) são
+marcados como interrompido no startup.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+FINAIS = ("concluido", "falhou", "cancelado", "interrompido")
+
+
+class JobCancelado(Exception):
+    pass
+
+
+def agora_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Progresso:
+    # Entregue à função do job: grava linhas processadas, resumo e vazão a cada lote
+    def __init__(self, executor: "ExecutorJobs", job_id: str):
+        self.executor = executor
+        self.job_id = job_id
+        self.inicio = time.monotonic()
+
+    async def atualizar(self, linhas: int, resumo: Dict[str, Any], final: bool = False):
+        decorrido = time.monotonic() - self.inicio
+        job = await self.executor.repositorio.atualizar(self.job_id, {
+            "linhas_processadas": linhas,
+            "resumo": resumo,
+            "linhas_por_segundo": round(linhas / decorrido, 1) if decorrido > 0 else None,
+            "atualizado_em": agora_iso(),
+        })
+        # No último lote já está tudo gravado: o job conclui mesmo com cancelamento pedido
+        if not final and job is not None and job.get("cancelamento_solicitado"):
+            raise JobCancelado()
+        # Sem I/O de verdade no meio (armazenamento em memória) o job não soltaria o loop
+        await asyncio.sleep(0)
+
+
+class ExecutorJobs:
+    def __init__(self, repositorio, concorrencia: int, retencao_dias: float):
+        self.repositorio = repositorio
+        self.semaforo = asyncio.Semaphore(concorrencia)
+        self.retencao = timedelta(days=retencao_dias)
+        self.tarefas: Dict[str, asyncio.Task] = {}
+        self.iniciados: set = set()  # tarefas que chegaram a rodar (as demais morrem sem passar pelo except)
+
+    async def enfileirar(self, tipo: str, descricao: Dict[str, Any],
+                         executar: Callable[[Progresso], Awaitable[Dict[str, Any]]],
+                         ao_terminar: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+        criado_em = agora_iso()
+        job = {
+            "id": str(ObjectId()),
+            "tipo": tipo,
+            **descricao,
+            "status": "na_fila",
+            "criado_em": criado_em,
+            "atualizado_em": criado_em,
+            "iniciado_em": None,
+            "concluido_em": None,
+            "linhas_processadas": 0,
+            "linhas_por_segundo": None,
+            "resumo": None,
+            "erro": None,
+            "cancelamento_solicitado": False,
+        }
+        await self.repositorio.criar(job)
+        tarefa = asyncio.create_task(self.rodar(job["id"], executar))
+        self.tarefas[job["id"]] = tarefa
+
+        def terminou(_):
+            self.tarefas.pop(job["id"], None)
+            self.iniciados.discard(job["id"])
+            if ao_terminar is not None:
+                ao_terminar()
+        tarefa.add_done_callback(terminou)
+        return job
+
+    async def rodar(self, job_id: str, executar):
+        self.iniciados.add(job_id)
+        try:
+            async with self.semaforo:
+                job = await self.repositorio.atualizar(job_id, {
+                    "status": "processando",
+                    "iniciado_em": agora_iso(),
+                    "atualizado_em": agora_iso(),
+                })
+                if job is None or job.get("cancelamento_solicitado"):
+                    raise JobCancelado()
+                progresso = Progresso(self, job_id)
+                resumo = await executar(progresso)
+                await self.finalizar(job_id, "concluido", resumo=resumo, progresso=progresso)
+        except (JobCancelado, asyncio.CancelledError):
+            await self.finalizar(job_id, "cancelado")
+        except Exception as e:
+            logger.exception(f"Job {job_id} falhou")
+            await self.finalizar(job_id, "falhou", erro=getattr(e, "detail", None) or str(e))
+
+    async def finalizar(self, job_id: str, status: str, resumo: Optional[Dict[str, Any]] = None,
+                        erro: Optional[str] = None, progresso: Optional[Progresso] = None):
+        campos = {
+            "status": status,
+            "concluido_em": agora_iso(),
+            "atualizado_em": agora_iso(),
+            "expira_em": datetime.now(timezone.utc) + self.retencao,
+        }
+        if resumo is not None:
+            campos["resumo"] = resumo
+        if erro is not None:
+            campos["erro"] = erro
+        if progresso is not None:
+            campos["duracao_segundos"] = round(time.monotonic() - progresso.inicio, 3)
+        await self.repositorio.atualizar(job_id, campos)
+
+    async def cancelar(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self.repositorio.solicitar_cancelamento(job_id)
+        if job is None or job["status"] in FINAIS:
+            return job
+        tarefa = self.tarefas.get(job_id)
+        if job["status"] == "na_fila" and tarefa is not None:
+            await self.interromper([job_id])
+            job = await self.repositorio.obter(job_id)
+        return job
+
+    async def interromper(self, job_ids):
+        iniciados = {job_id for job_id in job_ids if job_id in self.iniciados}
+        tarefas = [self.tarefas[job_id] for job_id in job_ids if job_id in self.tarefas]
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        # Tarefa cancelada antes de começar não passa pelo except de rodar
+        for job_id in job_ids:
+            if job_id not in iniciados:
+                await self.finalizar(job_id, "cancelado")
+
+    async def interromper_abandonados(self, segundos: float) -> int:
+        limite = (datetime.now(timezone.utc) - timedelta(seconds=segundos)).isoformat()
+        return await self.repositorio.interromper_abandonados(limite, {
+            "status": "interrompido",
+            "erro": "Processo reiniciado durante o job; envie o arquivo novamente",
+            "concluido_em": agora_iso(),
+            "expira_em": datetime.now(timezone.utc) + self.retencao,
+        })
+
+    async def parar(self):
+        # Shutdown: os jobs deste processo terminam como cancelado
+        await self.interromper(list(self.tarefas))
@@ -0,0 +1,53 @@
+"""Comandos de manutenção do backend.
+
+Uso (a partir de backend/, com o mesmo .env do servidor):
+
+    python manage.py rebuild-vendas-diarias
+    python manage.py arquivar-pedidos
+"""
+import argparse
+import asyncio
+
+import server
+
+
+async def rebuild_vendas_diarias(args):
+    linhas = await server.rebuild_vendas_diarias()
+    print(f"vendas_diarias reconstruída: {linhas} linhas")
+
+
+async def arquivar_pedidos(args):
+    if server.ARQUIVO_HORIZONTE_MESES <= 0:
+        print("Arquivamento desligado: defina ARQUIVO_HORIZONTE_MESES (por exemplo 24)")
+        return
+    # O índice único de fechamentos_mensais precisa existir mesmo sem o servidor ter subido
+    if server.db is not None:
+        await server.garantir_indices()
+    resumo = await server.arquivar_pedidos()
+    print(f"{resumo['pedidos_arquivados']} pedidos arquivados, {resumo['fechamentos']} fechamentos gravados"
+          f" ({', '.join(resumo['meses']) or 'nenhum mês além do horizonte'})")
+
+
+COMANDOS = {
+    "rebuild-vendas-diarias": (rebuild_vendas_diarias, "Recalcula o rollup vendas_diarias a partir dos pedidos"),
+    "arquivar-pedidos": (arquivar_pedidos, "Fecha e arquiva os meses além de ARQUIVO_HORIZONTE_MESES"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manutenção do backend da quitanda")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    for nome, (_, ajuda) in COMANDOS.items():
+        subparsers.add_parser(nome, help=ajuda)
+
+    args = parser.parse_args()
+    comando, _ = COMANDOS[args.comando]
+    try:
+        asyncio.run(comando(args))
+    finally:
+        if server.client is not None:
+            server.client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Métricas do backend no formato texto do Prometheus (GET /metrics).
+
+Três fontes:
+
+- MiddlewareMetricas: por rota (o template, ex. /api/pedidos/{pedido_id}),
+  contagem por status, histograma de latência, requisições em andamento e
+  tamanho das respostas;
+- MonitorComandos: CommandListener do pymongo ligado ao AsyncIOMotorClient,
+  com tempo, documentos retornados e falhas por coleção e comando;
+- RotaMedida: route_class do api_router, marca início e fim do endpoint.
+
+Com isso cada resposta sai com um cabeçalho Server-Timing separando banco
+(db), cálculo em Python (compute, o endpoint menos o banco) e serialização
+(serialize, do fim do endpoint até o início da resposta), e as mesmas fases
+são somadas por rota em http_request_phase_seconds_total.
+
+O Motor roda o pymongo num pool de threads copiando o contexto, então o
+listener enxerga o TemposRequisicao da requisição que disparou o comando.
+"""
+import bisect
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_MONGO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+BUCKETS_TAMANHO = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+SEM_ROTA = "(sem rota)"  # 404 e rotas fora do roteador: um rótulo só, sem explodir a cardinalidade
+
+
+class Histograma:
+    def __init__(self, limites: Tuple[float, ...]):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)  # a última posição é o +Inf
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.contagens[bisect.bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+class TemposRequisicao:
+    def __init__(self):
+        self.db: List[float] = []  # segundos de cada comando; list.append é seguro entre threads
+        self.inicio_endpoint: Optional[float] = None
+        self.fim_endpoint: Optional[float] = None
+        self.db_endpoint = 0.0
+        self.rota: Optional[str] = None
+
+    def fases(self, agora: float) -> Dict[str, float]:
+        if self.inicio_endpoint is None:
+            return {}
+        fim = self.fim_endpoint if self.fim_endpoint is not None else agora
+        return {
+            "db": self.db_endpoint,
+            "compute": max(fim - self.inicio_endpoint - self.db_endpoint, 0.0),
+            "serialize": max(agora - fim, 0.0),
+        }
+
+
+tempos_requisicao: ContextVar[Optional[TemposRequisicao]] = ContextVar("tempos_requisicao", default=None)
+
+
+class Metricas:
+    def __init__(self):
+        # Um lock só: o listener do Mongo roda nas threads do Motor
+        self.lock = threading.Lock()
+        self.requisicoes: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.latencia: Dict[Tuple[str, str], Histograma] = {}
+        self.tamanho: Dict[Tuple[str, str], Histograma] = {}
+        self.fases: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.em_andamento: Dict[str, int] = defaultdict(int)
+        self.comandos: Dict[Tuple[str, str], Histograma] = {}
+        self.documentos: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.falhas: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    def registrar_requisicao(self, metodo: str, rota: str, status: int, duracao: float, tamanho: int, fases: Dict[str, float]):
+        with self.lock:
+            self.requisicoes[(metodo, rota, str(status))] += 1
+            histograma(self.latencia, (metodo, rota), BUCKETS_LATENCIA).observar(duracao)
+            histograma(self.tamanho, (metodo, rota), BUCKETS_TAMANHO).observar(tamanho)
+            for fase, segundos in fases.items():
+                self.fases[(rota, fase)] += segundos
+
+    def registrar_comando(self, colecao: str, comando: str, duracao: float, documentos: int, falhou: bool):
+        with self.lock:
+            histograma(self.comandos, (colecao, comando), BUCKETS_MONGO).observar(duracao)
+            self.documentos[(colecao, comando)] += documentos
+            if falhou:
+                self.falhas[(colecao, comando)] += 1
+
+    def entrar(self, rota: str):
+        with self.lock:
+            self.em_andamento[rota] += 1
+
+    def sair(self, rota: str):
+        with self.lock:
+            self.em_andamento[rota] -= 1
+
+    def exportar(self) -> str:
+        linhas: List[str] = []
+        with self.lock:
+            contador(linhas, "http_requests_total", "Requisições HTTP por rota e status",
+                     ("method", "route", "status"), self.requisicoes)
+            histogramas(linhas, "http_request_duration_seconds", "Latência das requisições HTTP",
+                        ("method", "route"), self.latencia)
+            histogramas(linhas, "http_response_size_bytes", "Tamanho do corpo das respostas HTTP",
+                        ("method", "route"), self.tamanho)
+            contador(linhas, "http_request_phase_seconds_total", "Tempo acumulado por fase (db, compute, serialize)",
+                     ("route", "phase"), self.fases)
+            contador(linhas, "http_requests_in_flight", "Requisições em andamento por rota",
+                     ("route",), self.em_andamento, tipo="gauge")
+            histogramas(linhas, "mongodb_command_duration_seconds", "Duração dos comandos no MongoDB",
+                        ("collection", "command"), self.comandos)
+            contador(linhas, "mongodb_command_documents_returned_total", "Documentos devolvidos pelos comandos",
+                     ("collection", "command"), self.documentos)
+            contador(linhas, "mongodb_command_failures_total", "Comandos que falharam",
+                     ("collection", "command"), self.falhas)
+        return "\n".join(linhas) + "\n"
+
+
+def histograma(tabela: Dict[tuple, Histograma], chave: tuple, limites: Tuple[float, ...]) -> Histograma:
+    atual = tabela.get(chave)
+    if atual is None:
+        atual = tabela[chave] = Histograma(limites)
+    return atual
+
+
+def rotulos(nomes: Tuple[str, ...], valores: tuple) -> str:
+    pares = []
+    for nome, valor in zip(nomes, valores):
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pares.append(f'{nome}="{valor}"')
+    return ",".join(pares)
+
+
+def numero(valor: float) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def contador(linhas: List[str], nome: str, ajuda: str, nomes: Tuple[str, ...], valores: Dict[tuple, float], tipo: str = "counter"):
+    linhas.append(f"# HELP {nome} {ajuda}")
+    linhas.append(f"# TYPE {nome} {tipo}")
+    for chave, valor in sorted(valores.items()):
+        chave = chave if isinstance(chave, tuple) else (chave,)
+        linhas.append(f"{nome}{{{rotulos(nomes, chave)}}} {numero(valor)}")
+
+
+def histogramas(linhas: List[str], nome: str, ajuda: str, nomes: Tuple[str, ...], valores: Dict[tuple, Histograma]):
+    linhas.append(f"# HELP {nome} {ajuda}")
+    linhas.append(f"# TYPE {nome} histogram")
+    for chave, h in sorted(valores.items()):
+        base = rotulos(nomes, chave)
+        acumulado = 0
+        for limite, quantidade in zip(h.limites + (float("inf"),), h.contagens):
+            acumulado += quantidade
+            le = "+Inf" if limite == float("inf") else numero(limite)
+            linhas.append(f'{nome}_bucket{{{base},le="{le}"}} {acumulado}')
+        linhas.append(f"{nome}_sum{{{base}}} {numero(h.soma)}")
+        linhas.append(f"{nome}_count{{{base}}} {h.total}")
+
+
+metricas = Metricas()
+
+
+class MiddlewareMetricas:
+    # Middleware ASGI puro: mede até o último byte, inclusive respostas em streaming
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tempos = TemposRequisicao()
+        token = tempos_requisicao.set(tempos)
+        inicio = time.perf_counter()
+        status = 500
+        tamanho = 0
+        fases: Dict[str, float] = {}
+
+        async def enviar(mensagem):
+            nonlocal status, tamanho, fases
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+                agora = time.perf_counter()
+                fases = tempos.fases(agora)
+                valores = [f"{fase};dur={segundos * 1000:.2f}" for fase, segundos in fases.items()]
+                valores.append(f"total;dur={(agora - inicio) * 1000:.2f}")
+                mensagem["headers"] = list(mensagem.get("headers", [])) + [(b"server-timing", ", ".join(valores).encode())]
+            elif mensagem["type"] == "http.response.body":
+                tamanho += len(mensagem.get("body", b""))
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            tempos_requisicao.reset(token)
+            if tempos.rota is not None:
+                metricas.sair(tempos.rota)
+            rota = scope.get("route")
+            metricas.registrar_requisicao(
+                scope["method"],
+                getattr(rota, "path", SEM_ROTA),
+                status,
+                time.perf_counter() - inicio,
+                tamanho,
+                fases,
+            )
+
+
+def medir_endpoint(endpoint: Callable[..., Any], path: str) -> Callable[..., Any]:
+    # app.include_router recria as rotas com o endpoint já medido: não embrulha de novo
+    if getattr(endpoint, "medido", False):
+        return endpoint
+
+    # functools.wraps preserva a assinatura que o FastAPI inspeciona para os parâmetros
+    @functools.wraps(endpoint)
+    async def medido(*args, **kwargs):
+        tempos = tempos_requisicao.get()
+        if tempos is None:
+            return await endpoint(*args, **kwargs)
+        tempos.rota = path
+        metricas.entrar(path)
+        tempos.inicio_endpoint = time.perf_counter()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            tempos.fim_endpoint = time.perf_counter()
+            tempos.db_endpoint = sum(tempos.db)
+    medido.medido = True
+    return medido
+
+
+class RotaMedida(APIRoute):
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs):
+        super().__init__(path, medir_endpoint(endpoint, path), **kwargs)
+
+
+class MonitorComandos(monitoring.CommandListener):
+    def __init__(self):
+        self.pendentes: Dict[Tuple[Any, int], Tuple[str, str, Optional[Dict[str, Any]]]] = {}
+        self.captura = None  # consultas_lentas.CapturaConsultasLentas, ligada no startup
+
+    def started(self, event):
+        colecao = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            colecao = event.command.get("collection")
+        if not isinstance(colecao, str):
+            colecao = "-"  # comandos de admin/sessão
+        # O comando só fica guardado (por referência) se a captura de lentas puder precisar dele
+        comando = event.command if self.captura is not None and self.captura.interessa(event.command_name) else None
+        self.pendentes[(event.connection_id, event.request_id)] = (colecao, event.command_name, comando)
+
+    def succeeded(self, event):
+        self.finalizar(event, documentos_retornados(event.reply), False)
+
+    def failed(self, event):
+        self.finalizar(event, 0, True)
+
+    def finalizar(self, event, documentos: int, falhou: bool):
+        colecao, nome, comando = self.pendentes.pop((event.connection_id, event.request_id), ("-", event.command_name, None))
+        duracao = event.duration_micros / 1_000_000
+        metricas.registrar_comando(colecao, nome, duracao, documentos, falhou)
+        tempos = tempos_requisicao.get()
+        if tempos is not None:
+            tempos.db.append(duracao)
+        if comando is not None and not falhou:
+            self.captura.observar(event.database_name, colecao, nome, comando, duracao, documentos,
+                                  tempos.rota if tempos is not None else None)
+
+
+def documentos_retornados(resposta: Dict[str, Any]) -> int:
+    cursor = resposta.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if "value" in resposta:  # findAndModify
+        return 0 if resposta["value"] is None else 1
+    return 0
+
+
+monitor_comandos = MonitorComandos()
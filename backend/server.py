@@ -1,28 +1,69 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Query, UploadFile, File, Request, Response
 from dotenv import load_dotenv
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
+import asyncio
 import logging
+import time
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timezone, timedelta
+from pydantic import BaseModel, Field, ConfigDict, ValidationError, field_serializer
+from typing import List, Optional, Dict, Any, BinaryIO, Callable, Awaitable, Union, get_args, get_origin
+from datetime import date, datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
 from bson import ObjectId
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+import base64
 import csv
 import io
+import json
+import orjson
+import re
+import shutil
+import tempfile
+import unicodedata
+from analytics_colunar import MotorColunar
+from armazenamento import relogio_versoes, repositorios_memoria, repositorios_mongo
+from metricas import MiddlewareMetricas, RotaMedida, metricas, monitor_comandos
+from consultas_lentas import CapturaConsultasLentas
+from jobs import ExecutorJobs
+from transmissao import TransmissaoAnalytics
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Armazenamento: ARMAZENAMENTO=memoria roda sem MongoDB (dados só no processo, para
+# testes de carga locais). Índices, migrações e o rebuild do rollup são só do MongoDB.
+ARMAZENAMENTO = os.environ.get('ARMAZENAMENTO', 'mongo')
+if ARMAZENAMENTO == 'memoria':
+    client = None
+    db = None
+    repos = repositorios_memoria()
+else:
+    # MongoDB connection
+    mongo_url = os.environ['MONGO_URL']
+    # monitor_comandos alimenta /metrics e a fase db do Server-Timing; tz_aware devolve
+    # as datas (pedidos.data_pedido) em UTC com fuso, como são gravadas
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[monitor_comandos])
+    db = client[os.environ['DB_NAME']]
+    repos = repositorios_mongo(db)
+
+# Consultas acima de SLOW_QUERY_MS (0 desliga) vão com o explain para a coleção capada
+# slow_queries; ver consultas_lentas.py e GET /api/diagnostics/slow-queries
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_MAX_REGISTROS = int(os.environ.get('SLOW_QUERY_MAX_REGISTROS', '1000'))
+consultas_lentas = CapturaConsultasLentas(
+    SLOW_QUERY_MS,
+    float(os.environ.get('SLOW_QUERY_INTERVALO_EXPLAIN', '60')),
+    tamanho_fila=200,
+)
+monitor_comandos.captura = consultas_lentas
 
 app = FastAPI()
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=RotaMedida)
 
 # Models
 class Cliente(BaseModel):
@@ -73,7 +114,7 @@ class ItemPedido(BaseModel):
 class Pedido(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: Optional[str] = None
-    data_pedido: str
+    data_pedido: datetime
     cliente_id: Optional[str] = None
     cliente_nome: Optional[str] = None
     cliente_telefone: Optional[str] = None
@@ -82,6 +123,12 @@ class Pedido(BaseModel):
     valor_total: float
     observacao: Optional[str] = None
     itens: List[ItemPedido]
+    itens_sem_estoque: Optional[List[str]] = None  # produto_ids vendidos sem estoque suficiente
+    
+    @field_serializer('data_pedido')
+    def serializar_data_pedido(self, data_pedido: datetime) -> str:
+        # Mesmo texto do jsonable_encoder e do orjson (+00:00, não Z) em todas as rotas
+        return data_pedido.isoformat()
 
 class PedidoCreate(BaseModel):
     cliente_id: Optional[str] = None
@@ -90,32 +137,331 @@ class PedidoCreate(BaseModel):
     observacao: Optional[str] = None
     itens: List[ItemPedido]
 
+class PedidoLote(PedidoCreate):
+    # Pedido feito no caixa sem conexão: o id gerado no caixa torna o reenvio idempotente
+    # e data_pedido guarda a hora da venda (sem fuso = fuso da loja; ausente = agora)
+    id: Optional[str] = Field(None, min_length=1, max_length=64)
+    data_pedido: Optional[datetime] = None
+
+# Serialização rápida das listas grandes (opt-in: SERIALIZACAO_RAPIDA=1)
+# Os documentos já foram validados na escrita. Em vez de revalidar item a item pelo
+# response_model, montamos o mesmo dict que ele produziria (campos na ordem do modelo,
+# defaults, int -> float) e codificamos com orjson. A saída é a mesma byte a byte,
+# exceto floats que o json do Python escreve em notação científica (1e+16 vs 1e16).
+# Comparação e tempos: python benchmarks/serializacao.py
+SERIALIZACAO_RAPIDA = os.environ.get('SERIALIZACAO_RAPIDA', '0') == '1'
+
+class RespostaJSONRapida(Response):
+    media_type = "application/json"
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+def conversor_campo(tipo: Any) -> Optional[Callable[[Any], Any]]:
+    argumentos = [a for a in get_args(tipo) if a is not type(None)]
+    if get_origin(tipo) is Union and len(argumentos) == 1:  # Optional[X]
+        tipo = argumentos[0]
+    if tipo is float:
+        return lambda valor: float(valor) if type(valor) is int else valor
+    if tipo is int:
+        return lambda valor: int(valor) if type(valor) is float else valor
+    if get_origin(tipo) is list:
+        (item,) = get_args(tipo)
+        if isinstance(item, type) and issubclass(item, BaseModel):
+            projetar_item = projetor(item)
+            return lambda valor: [projetar_item(i) for i in valor]
+    return None
+
+def projetor(modelo: type) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    campos = [
+        (nome, campo.get_default(call_default_factory=True), conversor_campo(campo.annotation))
+        for nome, campo in modelo.model_fields.items()
+    ]
+    
+    def projetar(doc: Dict[str, Any]) -> Dict[str, Any]:
+        resultado = {}
+        for nome, padrao, converter in campos:
+            valor = doc.get(nome, padrao)
+            resultado[nome] = converter(valor) if converter is not None and valor is not None else valor
+        return resultado
+    
+    return projetar
+
+projetar_cliente = projetor(Cliente)
+projetar_produto = projetor(Produto)
+
+def resposta_lista(docs: List[Dict[str, Any]], projetar: Callable[[Dict[str, Any]], Dict[str, Any]], headers: Optional[Dict[str, str]] = None):
+    # Sem SERIALIZACAO_RAPIDA os docs seguem pelo caminho padrão (response_model)
+    if not SERIALIZACAO_RAPIDA:
+        return docs
+    return RespostaJSONRapida([projetar(doc) for doc in docs], headers=headers)
+
+# Importação CSV: o upload é lido linha a linha do arquivo temporário do Starlette
+# e gravado em lotes, então a memória não cresce com o tamanho do arquivo
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+MAX_ERROS_DETALHADOS = 10  # Limitar a 10 erros para não sobrecarregar resposta
+
+def novo_resumo_importacao() -> Dict[str, Any]:
+    return {'importados': 0, 'falhas': 0, 'erros_detalhados': []}
+
+def registrar_falha(resumo: Dict[str, Any], linha: int, erro: Any):
+    resumo['falhas'] += 1
+    if len(resumo['erros_detalhados']) < MAX_ERROS_DETALHADOS:
+        resumo['erros_detalhados'].append({
+            'linha': linha,
+            'erro': str(erro)
+        })
+
+# Importações em segundo plano: a rota salva o upload, cria o job e responde 202 com o
+# id; o progresso sai em GET /api/jobs/{id}. ?aguardar=true mantém a importação dentro
+# da requisição (scripts, benchmarks). Ver jobs.py
+executor_jobs = ExecutorJobs(
+    repos.jobs,
+    concorrencia=int(os.environ.get('IMPORT_JOBS_CONCORRENCIA', '2')),
+    retencao_dias=float(os.environ.get('JOBS_RETENCAO_DIAS', '7')),
+)
+JOB_ABANDONADO_SEGUNDOS = float(os.environ.get('JOB_ABANDONADO_SEGUNDOS', '600'))
+
+def salvar_upload(arquivo: BinaryIO) -> str:
+    # O arquivo temporário do Starlette é fechado no fim da requisição
+    with tempfile.NamedTemporaryFile(prefix='importacao-', suffix='.csv', delete=False) as destino:
+        shutil.copyfileobj(arquivo, destino, 1024 * 1024)
+        return destino.name
+
+async def iniciar_importacao(
+    file: UploadFile,
+    response: Response,
+    tipo: str,
+    importar: Callable[..., Awaitable[Dict[str, Any]]],
+    batch_size: int,
+    aguardar: bool,
+):
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="Arquivo deve ser CSV")
+    
+    if aguardar:
+        return await importar(file.file, batch_size)
+    
+    caminho = await asyncio.to_thread(salvar_upload, file.file)
+    
+    async def executar(progresso):
+        with open(caminho, 'rb') as arquivo:
+            return await importar(arquivo, batch_size, progresso)
+    
+    job = await executor_jobs.enfileirar(
+        tipo,
+        {"arquivo": file.filename, "tamanho_bytes": os.path.getsize(caminho)},
+        executar,
+        ao_terminar=lambda: os.remove(caminho),
+    )
+    response.status_code = 202
+    return job
+
+def ler_linhas_csv(arquivo: BinaryIO):
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    try:
+        # start=2 porque linha 1 é cabeçalho
+        yield from enumerate(csv.DictReader(texto, delimiter=';'), start=2)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Arquivo deve estar codificado em UTF-8")
+    finally:
+        texto.detach()  # Não fechar o arquivo do upload junto com o wrapper
+
+# Exportação: as linhas saem do cursor do repositório direto para um StreamingResponse,
+# em CSV (mesmo layout ';' aceito pela importação) ou NDJSON
+EXPORT_BATCH_SIZE = 500
+CAMPOS_CSV_CLIENTES = ['nome', 'telefone', 'email', 'endereco', 'sexo', 'observacao']
+CAMPOS_CSV_PEDIDOS = ['data_pedido', 'cliente_nome', 'cliente_telefone', 'total_itens', 'valor_total', 'observacao']
+
+def valor_exportacao(valor: Any) -> Any:
+    # Datas saem em ISO 8601, o mesmo texto da API (e aceito de volta pela importação)
+    return valor.isoformat() if isinstance(valor, datetime) else str(valor)
+
+async def gerar_exportacao(docs, formato: str, campos: List[str]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\n')
+    if formato == 'csv':
+        # Cabeçalho sai antes da primeira consulta ao banco
+        writer.writerow(campos)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    
+    linhas = 0
+    async for doc in docs:
+        if formato == 'csv':
+            writer.writerow(['' if doc.get(campo) is None else valor_exportacao(doc[campo]) for campo in campos])
+        else:
+            buffer.write(json.dumps(doc, ensure_ascii=False, default=valor_exportacao))
+            buffer.write('\n')
+        linhas += 1
+        # A primeira linha sai sozinha (o download começa sem esperar um lote do cursor),
+        # as demais em blocos de EXPORT_BATCH_SIZE
+        if linhas == 1 or linhas % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def resposta_exportacao(docs, formato: str, campos: List[str], nome: str) -> StreamingResponse:
+    media_type = 'text/csv; charset=utf-8' if formato == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(
+        gerar_exportacao(docs, formato, campos),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{nome}.{formato}"'},
+    )
+
+# Sincronização incremental das listas de clientes e produtos (?since=<token>)
+# Toda escrita grava no documento a versão de armazenamento.relogio_versoes e toda
+# exclusão deixa um registro em exclusoes por SYNC_RETENCAO_DIAS. Com since, a lista
+# devolve só os documentos alterados depois do token, os ids excluídos e o próximo
+# token. since=0, ou um token mais velho que a retenção, devolve a lista inteira com
+# completo=true: o front descarta a cópia local.
+# O token é "base" ou "base-versao-id": tudo até base já foi entregue, e base nunca passa
+# de SYNC_MARGEM_SEGUNDOS antes de agora, para uma escrita que já tirou a versão mas
+# ainda não gravou não ficar para trás. versao-id é o último documento da página atual:
+# as escritas em lote dão a mesma versão a vários documentos, então a página seguinte
+# continua pelo par (versao, id), nunca só pela versão. O que passou da base volta
+# repetido na próxima sincronização e o front só sobrescreve pelo id.
+SYNC_RETENCAO_DIAS = float(os.environ.get('SYNC_RETENCAO_DIAS', '30'))
+SYNC_MARGEM_SEGUNDOS = 5
+
+async def registrar_exclusao(colecao: str, item_id: str):
+    expira_em = datetime.now(timezone.utc) + timedelta(days=SYNC_RETENCAO_DIAS)
+    await repos.exclusoes.registrar(colecao, item_id, expira_em)
+
+def ler_token_sincronizacao(token: str) -> tuple:
+    # (base, versao, id): id None continua depois de todos os documentos da versão;
+    # "base-versao" é o formato antigo e recomeça a própria versão (o front sobrescreve)
+    partes = token.split('-', 2)
+    try:
+        base = int(partes[0])
+        versao = int(partes[1]) if len(partes) > 1 else base
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Token inválido")
+    depois_de = partes[2] if len(partes) == 3 else '' if len(partes) == 2 else None
+    if versao < base or (len(partes) == 3 and not depois_de):
+        raise HTTPException(status_code=400, detail="Token inválido")
+    return base, versao, depois_de
+
+async def resposta_sincronizacao(colecao: str, repositorio, since: str, limite: int,
+                                 projetar: Callable[[Dict[str, Any]], Dict[str, Any]]):
+    base, versao, depois_de = ler_token_sincronizacao(since)
+    agora = time.time()
+    completo = base < relogio_versoes.em(agora - SYNC_RETENCAO_DIAS * 86400)
+    if completo:
+        base, versao, depois_de = 0, 0, None
+    excluidos = [] if completo else await repos.exclusoes.listar(colecao, base)
+    corte = relogio_versoes.em(agora - SYNC_MARGEM_SEGUNDOS)
+    
+    docs = await repositorio.alteracoes(versao, depois_de, limite + 1)
+    tem_mais = len(docs) > limite
+    if tem_mais:
+        docs = docs[:limite]
+        versao, depois_de = docs[-1]["versao"], docs[-1]["id"]
+        # A versão do último documento pode ter mais documentos na próxima página:
+        # entregue por inteiro só está o que veio antes dela
+        base = max(base, min(versao - 1, corte))
+        token = f"{base}-{versao}-{depois_de}"
+    else:
+        base = max(base, corte)
+        token = str(base)
+    
+    return RespostaJSONRapida({
+        "itens": [projetar(doc) for doc in docs],
+        "excluidos": excluidos,
+        "token": token,
+        "temMais": tem_mais,
+        "completo": completo,
+    })
+
 # Routes - Clientes
+# O telefone só com dígitos é a chave de deduplicação dos clientes (índice único)
+def normalizar_telefone(telefone: Optional[str]) -> str:
+    return ''.join(c for c in telefone or '' if c.isdigit())
+
+# Chaves de busca: nome sem acentos em minúsculas (e seus prefixos por palavra),
+# telefone só com dígitos (inteiro e sem o 55/DDD), email em minúsculas e o domínio
+# do email, todas indexadas e consultadas por prefixo
+MAX_PREFIXO_BUSCA = 15
+
+def telefone_local(digitos: str) -> str:
+    # Sem o 55 e o DDD: busca por "98888-7777" acha "(11) 98888-7777".
+    # 11 e 13 dígitos são celular (9 no número local), 10 e 12 fixo (8)
+    if len(digitos) < 10:
+        return digitos
+    return digitos[-9:] if len(digitos) in (11, 13) else digitos[-8:]
+
+def dominio_email(email: str) -> str:
+    return email.rpartition('@')[2]
+
+def normalizar_texto(texto: Optional[str]) -> str:
+    sem_acentos = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', sem_acentos.lower()).split())
+
+def prefixos_busca(texto: str) -> List[str]:
+    prefixos = set()
+    for palavra in normalizar_texto(texto).split():
+        for tamanho in range(1, min(len(palavra), MAX_PREFIXO_BUSCA) + 1):
+            prefixos.add(palavra[:tamanho])
+    return sorted(prefixos)
+
+def chaves_busca_cliente(cliente: Dict[str, Any]) -> Dict[str, Any]:
+    telefone = normalizar_telefone(cliente.get('telefone'))
+    email = (cliente.get('email') or '').strip().lower() or None
+    return {
+        'telefone_normalizado': telefone,
+        'telefone_local': telefone_local(telefone) or None,
+        'email_normalizado': email,
+        'email_dominio': dominio_email(email) if email else None,
+        'nome_normalizado': normalizar_texto(cliente.get('nome')),
+        'busca_nome': prefixos_busca(cliente.get('nome')),
+    }
+
 @api_router.post("/clientes", response_model=Cliente)
 async def create_cliente(cliente: ClienteCreate):
     cliente_dict = cliente.model_dump()
+    cliente_dict.update(chaves_busca_cliente(cliente_dict))
     cliente_dict['data_cadastro'] = datetime.now(timezone.utc).isoformat()
     cliente_dict['id'] = str(ObjectId())
-    await db.clientes.insert_one(cliente_dict)
+    try:
+        await repos.clientes.inserir(cliente_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Já existe um cliente com este telefone")
     return Cliente(**cliente_dict)
 
 @api_router.get("/clientes", response_model=List[Cliente])
-async def get_clientes(search: Optional[str] = None):
-    query = {}
-    if search:
-        query = {
-            "$or": [
-                {"nome": {"$regex": search, "$options": "i"}},
-                {"telefone": {"$regex": search, "$options": "i"}},
-                {"email": {"$regex": search, "$options": "i"}}
-            ]
-        }
-    clientes = await db.clientes.find(query, {"_id": 0}).to_list(1000)
-    return clientes
+async def get_clientes(
+    search: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=1000),
+    since: Optional[str] = None,
+):
+    if since is not None:
+        return await resposta_sincronizacao("clientes", repos.clientes, since, limit, projetar_cliente)
+    
+    termo = (search or '').strip()
+    if not termo:
+        return resposta_lista(await repos.clientes.listar(limit), projetar_cliente)
+    
+    nome = normalizar_texto(termo)
+    prefixos = [palavra[:MAX_PREFIXO_BUSCA] for palavra in nome.split()]
+    email = termo.lower()
+    # "gmail.com" ou "@gmail.com" buscam pelo domínio; com algo antes do @, pelo email
+    dominio = email[1:] if email.startswith('@') else ('' if '@' in email else email)
+    clientes = await repos.clientes.buscar(nome, prefixos, normalizar_telefone(termo), email, dominio, limit)
+    return resposta_lista(clientes, projetar_cliente)
+
+@api_router.get("/clientes/export")
+async def export_clientes(formato: str = Query("csv", pattern="^(csv|ndjson)$")):
+    campos = None if formato == 'ndjson' else CAMPOS_CSV_CLIENTES
+    docs = repos.clientes.exportar(campos, EXPORT_BATCH_SIZE)
+    return resposta_exportacao(docs, formato, CAMPOS_CSV_CLIENTES, "clientes")
 
 @api_router.get("/clientes/{cliente_id}", response_model=Cliente)
 async def get_cliente(cliente_id: str):
-    cliente = await db.clientes.find_one({"id": cliente_id}, {"_id": 0})
+    cliente = await repos.clientes.obter(cliente_id)
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     return cliente
@@ -123,286 +469,999 @@ async def get_cliente(cliente_id: str):
 @api_router.put("/clientes/{cliente_id}", response_model=Cliente)
 async def update_cliente(cliente_id: str, cliente: ClienteCreate):
     cliente_dict = cliente.model_dump()
-    result = await db.clientes.update_one({"id": cliente_id}, {"$set": cliente_dict})
-    if result.matched_count == 0:
+    cliente_dict.update(chaves_busca_cliente(cliente_dict))
+    try:
+        updated_cliente = await repos.clientes.atualizar(cliente_id, cliente_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Já existe um cliente com este telefone")
+    if not updated_cliente:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
-    updated_cliente = await db.clientes.find_one({"id": cliente_id}, {"_id": 0})
     return updated_cliente
 
 @api_router.delete("/clientes/{cliente_id}")
 async def delete_cliente(cliente_id: str):
-    result = await db.clientes.delete_one({"id": cliente_id})
-    if result.deleted_count == 0:
+    if not await repos.clientes.excluir(cliente_id):
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
+    await registrar_exclusao("clientes", cliente_id)
     return {"message": "Cliente excluído com sucesso"}
 
-@api_router.post("/clientes/import-csv")
-async def import_clientes_csv(file: UploadFile = File(...)):
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Arquivo deve ser CSV")
+def parse_linha_cliente(row: Dict[str, str]) -> Dict[str, Any]:
+    # Validar campos obrigatórios
+    if not row.get('nome') or not row.get('telefone'):
+        raise ValueError("Campos obrigatórios faltando: nome, telefone")
+    
+    if not normalizar_telefone(row['telefone']):
+        raise ValueError(f"Telefone inválido: {row['telefone'].strip()}")
+    
+    # Validar email se fornecido
+    email = (row.get('email') or '').strip()
+    if email and '@' not in email:
+        raise ValueError(f"Email inválido: {email}")
     
-    # Ler conteúdo do arquivo
-    contents = await file.read()
-    decoded = contents.decode('utf-8')
-    csv_reader = csv.DictReader(io.StringIO(decoded), delimiter=';')
+    # Validar sexo se fornecido
+    sexo = (row.get('sexo') or '').strip().upper()
+    if sexo and sexo not in ['M', 'F', 'OUTRO']:
+        raise ValueError(f"Sexo inválido: {sexo}. Use M, F ou Outro")
     
-    importados = 0
-    falhas = 0
-    erros_detalhados = []
+    cliente = {
+        'nome': row['nome'].strip(),
+        'telefone': row['telefone'].strip(),
+        'email': email if email else None,
+        'endereco': (row.get('endereco') or '').strip() or None,
+        'sexo': sexo if sexo else None,
+        'observacao': (row.get('observacao') or '').strip() or None,
+    }
+    cliente.update(chaves_busca_cliente(cliente))
+    return cliente
+
+async def gravar_lote_clientes(lote: Dict[str, tuple], resumo: Dict[str, Any]):
+    if not lote:
+        return
+    
+    # Um upsert por telefone: cliente novo ganha id/data_cadastro, existente é atualizado
+    linhas = [linha for linha, _ in lote.values()]
+    inseridos, atualizados, falhas = await repos.clientes.gravar_por_telefone([cliente for _, cliente in lote.values()])
+    for posicao, erro in falhas.items():
+        registrar_falha(resumo, linhas[posicao], erro)
+    
+    resumo['inseridos'] += inseridos
+    resumo['atualizados'] += atualizados
+    resumo['importados'] = resumo['inseridos'] + resumo['atualizados']
+
+async def importar_clientes(arquivo: BinaryIO, batch_size: int, progresso=None) -> Dict[str, Any]:
+    resumo = novo_resumo_importacao()
+    resumo.update({'inseridos': 0, 'atualizados': 0, 'duplicados_no_arquivo': 0})
+    vistos = set()
+    lote = {}
+    
+    linhas = 0
     
     # Cabeçalhos esperados: nome;telefone;email;endereco;sexo;observacao
-    for idx, row in enumerate(csv_reader, start=2):  # start=2 porque linha 1 é cabeçalho
+    for idx, row in ler_linhas_csv(arquivo):
+        linhas = idx - 1
         try:
-            # Validar campos obrigatórios
-            if not row.get('nome') or not row.get('telefone'):
-                raise ValueError("Campos obrigatórios faltando: nome, telefone")
-            
-            # Validar email se fornecido
-            email = row.get('email', '').strip()
-            if email and '@' not in email:
-                raise ValueError(f"Email inválido: {email}")
-            
-            # Validar sexo se fornecido
-            sexo = row.get('sexo', '').strip().upper()
-            if sexo and sexo not in ['M', 'F', 'OUTRO']:
-                raise ValueError(f"Sexo inválido: {sexo}. Use M, F ou Outro")
-            
-            # Criar cliente
-            cliente_dict = {
-                'id': str(ObjectId()),
-                'nome': row['nome'].strip(),
-                'telefone': row['telefone'].strip(),
-                'email': email if email else None,
-                'endereco': row.get('endereco', '').strip() or None,
-                'sexo': sexo if sexo else None,
-                'observacao': row.get('observacao', '').strip() or None,
-                'data_cadastro': datetime.now(timezone.utc).isoformat()
-            }
-            
-            await db.clientes.insert_one(cliente_dict)
-            importados += 1
-            
+            cliente = parse_linha_cliente(row)
         except Exception as e:
-            falhas += 1
-            erros_detalhados.append({
-                'linha': idx,
-                'erro': str(e)
-            })
+            registrar_falha(resumo, idx, e)
+            continue
+        
+        # Telefone repetido no arquivo: vale a última linha
+        chave = cliente['telefone_normalizado']
+        if chave in vistos:
+            resumo['duplicados_no_arquivo'] += 1
+        vistos.add(chave)
+        lote[chave] = (idx, cliente)
+        
+        if len(lote) >= batch_size:
+            await gravar_lote_clientes(lote, resumo)
+            lote = {}
+            if progresso:
+                await progresso.atualizar(linhas, resumo)
     
-    return {
-        'importados': importados,
-        'falhas': falhas,
-        'erros_detalhados': erros_detalhados[:10]  # Limitar a 10 erros
-    }
+    await gravar_lote_clientes(lote, resumo)
+    if progresso:
+        await progresso.atualizar(linhas, resumo, final=True)
+    
+    return resumo
+
+@api_router.post("/clientes/import-csv")
+async def import_clientes_csv(
+    response: Response,
+    file: UploadFile = File(...),
+    batchSize: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10000),
+    aguardar: bool = False,
+):
+    return await iniciar_importacao(file, response, "importacao_clientes", importar_clientes, batchSize, aguardar)
+
+# Catálogo de produtos em memória
+# O catálogo é pequeno e muda pouco: fica carregado no processo, indexado por id, cp
+# e nome normalizado, e é atualizado pelas próprias rotas de escrita de produtos.
+# A versão entra no ETag para o PDV fazer GET condicional (304). Como é por processo,
+# uma recarga completa acontece a cada CATALOGO_TTL_SEGUNDOS para cobrir escritas
+# feitas por outro processo.
+CATALOGO_TTL_SEGUNDOS = float(os.environ.get('CATALOGO_TTL_SEGUNDOS', '300'))
+
+class CatalogoProdutos:
+    def __init__(self):
+        self.por_id: Dict[str, Dict[str, Any]] = {}
+        self.por_cp: Dict[int, Dict[str, Any]] = {}
+        self.nomes: Dict[str, str] = {}  # id -> nome normalizado
+        self.ordenados: Optional[List[Dict[str, Any]]] = None
+        self.instancia = str(ObjectId())  # ETags de outro processo/boot nunca coincidem
+        self.versao = 0
+        self.carregado_em: Optional[float] = None
+        self.lock = asyncio.Lock()
+    
+    def etag(self, variante: str = "") -> str:
+        # variante: o que além da versão muda a resposta (o corte da lista por ?limit=)
+        return f'"catalogo-{self.instancia}-{self.versao}{variante}"'
+    
+    async def carregar(self):
+        produtos = await repos.produtos.listar()
+        self.por_id, self.por_cp, self.nomes = {}, {}, {}
+        for produto in produtos:
+            self._indexar(produto)
+        self.ordenados = None
+        self.versao += 1
+        self.carregado_em = time.monotonic()
+        logger.info(f"Catálogo de produtos carregado: {len(produtos)} produtos")
+    
+    async def garantir_atualizado(self):
+        if self.carregado_em is not None and time.monotonic() - self.carregado_em < CATALOGO_TTL_SEGUNDOS:
+            return
+        async with self.lock:
+            if self.carregado_em is None or time.monotonic() - self.carregado_em >= CATALOGO_TTL_SEGUNDOS:
+                await self.carregar()
+    
+    def _indexar(self, produto: Dict[str, Any]):
+        self.por_id[produto["id"]] = produto
+        if produto.get("cp") is not None:
+            self.por_cp[produto["cp"]] = produto
+        self.nomes[produto["id"]] = normalizar_texto(produto.get("nome"))
+    
+    def atualizar(self, produto: Dict[str, Any]):
+        self.remover(produto["id"])
+        self._indexar(produto)
+        self.ordenados = None
+        self.versao += 1
+    
+    def remover(self, produto_id: str):
+        anterior = self.por_id.pop(produto_id, None)
+        if anterior is None:
+            return
+        if self.por_cp.get(anterior.get("cp")) is anterior:
+            del self.por_cp[anterior["cp"]]
+        self.nomes.pop(produto_id, None)
+        self.ordenados = None
+        self.versao += 1
+    
+    def ajustar_estoque(self, deltas: Dict[str, float]):
+        # Espelha no cache o $inc já aplicado no banco, sem recarregar o produto
+        for produto_id, delta in deltas.items():
+            produto = self.por_id.get(produto_id)
+            if produto is not None:
+                produto["estoque_atual"] = (produto.get("estoque_atual") or 0) + delta
+        if deltas:
+            self.versao += 1
+    
+    def listar(self, search: Optional[str] = None, tipo: Optional[str] = None) -> List[Dict[str, Any]]:
+        if self.ordenados is None:
+            self.ordenados = sorted(self.por_id.values(), key=lambda p: (p.get("cp") is not None, p.get("cp") or 0))
+        termo = normalizar_texto(search)
+        return [
+            p for p in self.ordenados
+            if (not termo or termo in self.nomes[p["id"]]) and (not tipo or p.get("tipo") == tipo)
+        ]
+
+catalogo = CatalogoProdutos()
+
+def nao_modificado(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+def resposta_catalogo(request: Request, response: Response, valor, projetar: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+                      variante: str = ""):
+    # Usado pelas rotas de leitura: 304 se o cliente já tem esta versão do catálogo.
+    # no-cache faz o navegador sempre revalidar, então o axios recebe o 304 de forma transparente
+    etag = catalogo.etag(variante)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if nao_modificado(request, etag):
+        return Response(status_code=304, headers=headers)
+    if projetar is not None and SERIALIZACAO_RAPIDA:
+        return resposta_lista(valor, projetar, headers)
+    response.headers.update(headers)
+    return valor
+
+# Cache das respostas de analytics
+# Chave: endpoint + parâmetros já validados. Toda escrita em pedidos passa por
+# aplicar_vendas_diarias, que invalida o cache inteiro (nova geração); o TTL limita
+# a defasagem quando quem escreve é outro processo (ex.: manage.py)
+ANALYTICS_CACHE_TTL_SEGUNDOS = float(os.environ.get('ANALYTICS_CACHE_TTL_SEGUNDOS', '300'))
+ANALYTICS_CACHE_MAX_ENTRADAS = int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRADAS', '256'))
+
+class CacheAnalytics:
+    def __init__(self, ttl: float, max_entradas: int):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.entradas: "OrderedDict[tuple, tuple]" = OrderedDict()  # chave -> (criado_em, etag, valor), LRU no fim
+        self.geracao = 0
+        self.instancia = str(ObjectId())
+        self.sequencia = 0
+    
+    def invalidar(self):
+        self.geracao += 1
+        self.entradas.clear()
+    
+    async def obter(self, chave: tuple, calcular: Callable[[], Awaitable[Any]]):
+        entrada = self.entradas.get(chave)
+        if entrada is not None and time.monotonic() - entrada[0] < self.ttl:
+            self.entradas.move_to_end(chave)
+            return entrada[1], entrada[2]
+        
+        geracao = self.geracao
+        valor = await calcular()
+        self.sequencia += 1
+        etag = f'"analytics-{self.instancia}-{self.sequencia}"'
+        # Se houve escrita durante o cálculo, o resultado já nasce velho: não guarda
+        if geracao == self.geracao:
+            self.entradas[chave] = (time.monotonic(), etag, valor)
+            self.entradas.move_to_end(chave)
+            while len(self.entradas) > self.max_entradas:
+                self.entradas.popitem(last=False)
+        return etag, valor
+
+cache_analytics = CacheAnalytics(ANALYTICS_CACHE_TTL_SEGUNDOS, ANALYTICS_CACHE_MAX_ENTRADAS)
+
+async def resposta_analytics(request: Request, response: Response, chave: tuple, calcular: Callable[[], Awaitable[Any]]):
+    etag, valor = await cache_analytics.obter(chave, calcular)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if nao_modificado(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return valor
+
+# Motor de analytics: com ANALYTICS_MOTOR=colunar as agregações do rollup (rotas de
+# analytics, dashboard ao vivo e fechamento mensal) rodam numa cópia colunar do rollup
+# em memória, com numpy (ver analytics_colunar.py); "banco", o padrão, agrega no MongoDB
+# (ou no interpretador do armazenamento em memória). Comparação: benchmarks/analytics.py
+ANALYTICS_MOTOR = os.environ.get('ANALYTICS_MOTOR', 'banco')
+ANALYTICS_COLUNAR_TTL_SEGUNDOS = float(os.environ.get('ANALYTICS_COLUNAR_TTL_SEGUNDOS', '60'))
+
+motor_colunar = MotorColunar(
+    ANALYTICS_COLUNAR_TTL_SEGUNDOS,
+    lambda: repos.vendas.exportar(EXPORT_BATCH_SIZE),
+    lambda: list(catalogo.por_id.values()),
+)
+
+# Estoque
+# A baixa de um pedido é atômica por produto e condicionada a estoque suficiente,
+# então o estoque nunca fica negativo (no MongoDB, um único bulk_write; ver
+# armazenamento.MongoProdutos.baixar_estoque).
+# ESTOQUE_MODO: "sinalizar" registra os itens sem estoque no pedido;
+# "rejeitar" desfaz as baixas e recusa o pedido com 409
+ESTOQUE_MODO = os.environ.get('ESTOQUE_MODO', 'sinalizar')
+
+def quantidades_por_produto(itens: List[Dict[str, Any]]) -> Dict[str, float]:
+    quantidades: Dict[str, float] = {}
+    for item in itens:
+        quantidades[item["produto_id"]] = quantidades.get(item["produto_id"], 0) + item["quantidade"]
+    return quantidades
+
+async def baixar_estoque(pedido_id: str, quantidades: Dict[str, float]):
+    # Retorna (quantidades baixadas, produto_ids sem estoque suficiente)
+    baixadas = await repos.produtos.baixar_estoque(pedido_id, quantidades)
+    catalogo.ajustar_estoque({pid: -q for pid, q in baixadas.items()})
+    return baixadas, [pid for pid in quantidades if pid not in baixadas]
+
+async def repor_estoque(quantidades: Dict[str, float]):
+    if not quantidades:
+        return
+    await repos.produtos.repor_estoque(quantidades)
+    catalogo.ajustar_estoque(quantidades)
+
+# Contadores (coleção counters)
+CONTADOR_CP = "produtos_cp"
+
+async def semear_contador_cp():
+    ultimo_cp = await repos.produtos.maior_cp()
+    if ultimo_cp is not None:
+        await repos.contadores.semear(CONTADOR_CP, ultimo_cp)
+
+async def inserir_produtos(produtos: List[Dict[str, Any]]):
+    # Reserva os cps em bloco; se algum já existir (cadastro feito fora da API),
+    # ressemeia o contador a partir do maior cp e tenta de novo com os que faltaram
+    pendentes = produtos
+    for tentativa in range(3):
+        for produto, cp in zip(pendentes, await repos.contadores.alocar(CONTADOR_CP, len(pendentes))):
+            produto['cp'] = cp
+        try:
+            await repos.produtos.inserir_muitos(pendentes)
+            break
+        except BulkWriteError as e:
+            if tentativa == 2 or any(erro.get('code') != 11000 for erro in e.details.get('writeErrors', [])):
+                raise
+            pendentes = pendentes[e.details.get('nInserted', 0):]
+            await semear_contador_cp()
+    
+    for produto in produtos:
+        catalogo.atualizar(produto)
 
 # Routes - Produtos (Protegidas)
+# Teto da lista de produtos: padrão e máximo de ?limit=, com ou sem since
+MAX_PRODUTOS_LISTA = 1000
+
 @api_router.post("/produtos", response_model=Produto)
 async def create_produto(produto: ProdutoCreate):
-    last_produto = await db.produtos.find_one({}, {"_id": 0, "cp": 1}, sort=[("cp", -1)])
-    next_cp = (last_produto["cp"] + 1) if last_produto and "cp" in last_produto else 1
-    
     produto_dict = produto.model_dump()
-    produto_dict['cp'] = next_cp
     produto_dict['id'] = str(ObjectId())
-    await db.produtos.insert_one(produto_dict)
+    await inserir_produtos([produto_dict])
     return Produto(**produto_dict)
 
+@api_router.post("/produtos/batch", response_model=List[Produto])
+async def create_produtos_batch(produtos: List[ProdutoCreate]):
+    if not produtos:
+        return []
+    produtos_dict = [{**produto.model_dump(), 'id': str(ObjectId())} for produto in produtos]
+    await inserir_produtos(produtos_dict)
+    return produtos_dict
+
 @api_router.get("/produtos", response_model=List[Produto])
-async def get_produtos(search: Optional[str] = None, tipo: Optional[str] = None):
-    query = {}
-    if search:
-        query["nome"] = {"$regex": search, "$options": "i"}
-    if tipo:
-        query["tipo"] = tipo
-    produtos = await db.produtos.find(query, {"_id": 0}).sort("cp", 1).to_list(1000)
-    return produtos
+async def get_produtos(
+    request: Request,
+    response: Response,
+    search: Optional[str] = None,
+    tipo: Optional[str] = None,
+    since: Optional[str] = None,
+    limit: int = Query(MAX_PRODUTOS_LISTA, ge=1, le=MAX_PRODUTOS_LISTA),
+):
+    if since is not None:
+        # Direto do repositório: o catálogo deste processo pode não ter as escritas dos outros
+        return await resposta_sincronizacao("produtos", repos.produtos, since, limit, projetar_produto)
+    await catalogo.garantir_atualizado()
+    # O corte entra no ETag: a mesma versão do catálogo com outro limit é outra resposta
+    return resposta_catalogo(request, response, catalogo.listar(search, tipo)[:limit], projetar_produto, f"-{limit}")
 
 @api_router.get("/produtos/cp/{cp}", response_model=Produto)
-async def get_produto_by_cp(cp: int):
-    produto = await db.produtos.find_one({"cp": cp}, {"_id": 0})
+async def get_produto_by_cp(cp: int, request: Request, response: Response):
+    await catalogo.garantir_atualizado()
+    produto = catalogo.por_cp.get(cp)
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
-    return produto
+    return resposta_catalogo(request, response, produto)
 
 @api_router.get("/produtos/{produto_id}", response_model=Produto)
-async def get_produto(produto_id: str):
-    produto = await db.produtos.find_one({"id": produto_id}, {"_id": 0})
+async def get_produto(produto_id: str, request: Request, response: Response):
+    await catalogo.garantir_atualizado()
+    produto = catalogo.por_id.get(produto_id)
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
-    return produto
+    return resposta_catalogo(request, response, produto)
 
 @api_router.put("/produtos/{produto_id}", response_model=Produto)
 async def update_produto(produto_id: str, produto: ProdutoCreate):
     produto_dict = produto.model_dump()
-    result = await db.produtos.update_one({"id": produto_id}, {"$set": produto_dict})
-    if result.matched_count == 0:
+    updated_produto = await repos.produtos.atualizar(produto_id, produto_dict)
+    if not updated_produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
-    updated_produto = await db.produtos.find_one({"id": produto_id}, {"_id": 0})
+    catalogo.atualizar(updated_produto)
+    cache_analytics.invalidar()  # vendas por categoria usa o tipo do produto
     return updated_produto
 
 @api_router.delete("/produtos/{produto_id}")
 async def delete_produto(produto_id: str):
-    result = await db.produtos.delete_one({"id": produto_id})
-    if result.deleted_count == 0:
+    if not await repos.produtos.excluir(produto_id):
         raise HTTPException(status_code=404, detail="Produto não encontrado")
+    await registrar_exclusao("produtos", produto_id)
+    catalogo.remover(produto_id)
+    cache_analytics.invalidar()
     return {"message": "Produto excluído com sucesso"}
 
+# Datas dos pedidos
+# data_pedido é gravada como data do BSON (UTC, precisão de milissegundos) junto com os
+# baldes inteiros dia (AAAAMMDD) e mes (AAAAMM) no fuso da loja, usados pelo rollup e
+# pelos agrupamentos. Trocar FUSO_HORARIO não recalcula os pedidos já gravados.
+FUSO_HORARIO = ZoneInfo(os.environ.get('FUSO_HORARIO', 'America/Sao_Paulo'))
+
+def dia_local(data: datetime) -> int:
+    local = data.astimezone(FUSO_HORARIO)
+    return local.year * 10000 + local.month * 100 + local.day
+
+def campos_data_pedido(data: datetime) -> Dict[str, Any]:
+    # Sem fuso = fuso da loja, a mesma regra da importação e dos filtros
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=FUSO_HORARIO)
+    data = data.astimezone(timezone.utc)
+    data = data.replace(microsecond=data.microsecond // 1000 * 1000)
+    dia = dia_local(data)
+    return {'data_pedido': data, 'dia': dia, 'mes': dia // 100}
+
+def texto_dia(dia: int) -> str:
+    return f"{dia // 10000:04d}-{dia // 100 % 100:02d}-{dia % 100:02d}"
+
+def texto_mes(mes: int) -> str:
+    return f"{mes // 100:04d}-{mes % 100:02d}"
+
+# Clientes antigos mandam o dia como meia-noite UTC (toISOString de uma data)
+MEIA_NOITE_UTC = re.compile(r'(\d{4}-\d{2}-\d{2})T00:00:00(?:\.0+)?(?:Z|\+00:00)')
+
+def ler_data_filtro(texto: str) -> tuple:
+    # Retorna (instante, só_data). AAAA-MM-DD é a meia-noite no fuso da loja; data com
+    # horário vale como o instante informado (sem fuso = fuso da loja), exceto a meia-noite
+    # UTC, lida como o dia AAAA-MM-DD para esses clientes não pegarem 21:00 do dia anterior
+    meia_noite = MEIA_NOITE_UTC.fullmatch(texto)
+    if meia_noite:
+        texto = meia_noite.group(1)
+    try:
+        if len(texto) == 10:
+            dia = date.fromisoformat(texto)
+            return datetime(dia.year, dia.month, dia.day, tzinfo=FUSO_HORARIO), True
+        data = datetime.fromisoformat(texto.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Data inválida: {texto}")
+    return (data if data.tzinfo else data.replace(tzinfo=FUSO_HORARIO)), False
+
+def dia_seguinte(data: datetime) -> datetime:
+    proximo = data.astimezone(FUSO_HORARIO).date() + timedelta(days=1)
+    return datetime(proximo.year, proximo.month, proximo.day, tzinfo=FUSO_HORARIO)
+
+# Rollup diário de vendas (vendas_diarias)
+# Uma linha por (dia, produto, cliente) com valor, quantidade e número de pedidos.
+# A linha com produto_id None guarda os totais do pedido (valor_total/total_itens),
+# que também cobrem pedidos importados sem itens detalhados.
+# As rotas de escrita de pedidos mantêm o rollup e as de analytics leem só dele.
+def acumular_vendas_diarias(acumulado: Dict[tuple, Dict[str, Any]], pedido: Dict[str, Any], sinal: int = 1):
+    dia = pedido["dia"]
+    cliente_id = pedido.get("cliente_id")
+    
+    def linha(produto_id, produto_nome):
+        return acumulado.setdefault((dia, produto_id, cliente_id), {
+            "mes": pedido["mes"],
+            "produto_nome": produto_nome,
+            "cliente_nome": pedido.get("cliente_nome"),
+            "valor": 0,
+            "quantidade": 0,
+            "pedidos": 0,
+        })
+    
+    totais = linha(None, None)
+    totais["valor"] += sinal * pedido["valor_total"]
+    totais["quantidade"] += sinal * pedido["total_itens"]
+    totais["pedidos"] += sinal
+    
+    # Agrupa os itens por produto antes, para o pedido contar uma vez por produto
+    por_produto = {}
+    for item in pedido.get("itens", []):
+        stats = por_produto.setdefault(item["produto_id"], {"nome": item["produto_nome"], "valor": 0, "quantidade": 0})
+        stats["valor"] += item["valor_total"]
+        stats["quantidade"] += item["quantidade"]
+    
+    for produto_id, stats in por_produto.items():
+        produto = linha(produto_id, stats["nome"])
+        produto["valor"] += sinal * stats["valor"]
+        produto["quantidade"] += sinal * stats["quantidade"]
+        produto["pedidos"] += sinal
+
+async def aplicar_vendas_diarias(acumulado: Dict[tuple, Dict[str, Any]]):
+    if not acumulado:
+        return
+    await repos.vendas.aplicar(acumulado)
+    motor_colunar.registrar(acumulado)
+    cache_analytics.invalidar()
+    transmissao_analytics.registrar(acumulado)
+
+async def rebuild_vendas_diarias() -> int:
+    # Recalcula o rollup inteiro a partir dos pedidos (substitui a coleção via $out).
+    # Rodar com o caixa parado: pedidos gravados durante o rebuild podem ficar de fora.
+    # Só MongoDB: no armazenamento em memória o rollup nasce junto com os pedidos.
+    await db.pedidos.aggregate([
+        # O rollup cobre o histórico inteiro, inclusive os pedidos já arquivados
+        {"$unionWith": "pedidos_arquivo"},
+        {"$project": {
+            "_id": 0,
+            "id": 1,
+            "dia": 1,
+            "mes": 1,
+            "cliente_id": 1,
+            "cliente_nome": 1,
+            "linhas": {"$concatArrays": [
+                [{"produto_id": None, "produto_nome": None, "valor": "$valor_total", "quantidade": "$total_itens"}],
+                {"$map": {
+                    "input": {"$ifNull": ["$itens", []]},
+                    "as": "item",
+                    "in": {
+                        "produto_id": "$$item.produto_id",
+                        "produto_nome": "$$item.produto_nome",
+                        "valor": "$$item.valor_total",
+                        "quantidade": "$$item.quantidade",
+                    },
+                }},
+            ]},
+        }},
+        {"$unwind": "$linhas"},
+        # Primeiro por pedido, para o mesmo produto repetido num pedido contar uma vez
+        {"$group": {
+            "_id": {"pedido": "$id", "dia": "$dia", "produto_id": "$linhas.produto_id", "cliente_id": "$cliente_id"},
+            "mes": {"$last": "$mes"},
+            "produto_nome": {"$last": "$linhas.produto_nome"},
+            "cliente_nome": {"$last": "$cliente_nome"},
+            "valor": {"$sum": "$linhas.valor"},
+            "quantidade": {"$sum": "$linhas.quantidade"},
+        }},
+        {"$group": {
+            "_id": {"dia": "$_id.dia", "produto_id": "$_id.produto_id", "cliente_id": "$_id.cliente_id"},
+            "mes": {"$last": "$mes"},
+            "produto_nome": {"$last": "$produto_nome"},
+            "cliente_nome": {"$last": "$cliente_nome"},
+            "valor": {"$sum": "$valor"},
+            "quantidade": {"$sum": "$quantidade"},
+            "pedidos": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "dia": "$_id.dia",
+            "mes": 1,
+            "produto_id": "$_id.produto_id",
+            "cliente_id": "$_id.cliente_id",
+            "produto_nome": 1,
+            "cliente_nome": 1,
+            "valor": 1,
+            "quantidade": 1,
+            "pedidos": 1,
+        }},
+        {"$out": "vendas_diarias"},
+    ], allowDiskUse=True).to_list(None)
+    motor_colunar.invalidar()
+    cache_analytics.invalidar()
+    
+    return await db.vendas_diarias.count_documents({})
+
 # Routes - Pedidos (Protegidas)
 @api_router.post("/pedidos", response_model=Pedido)
 async def create_pedido(pedido: PedidoCreate):
     pedido_dict = pedido.model_dump()
-    pedido_dict['data_pedido'] = datetime.now(timezone.utc).isoformat()
+    pedido_dict.update(campos_data_pedido(datetime.now(timezone.utc)))
     pedido_dict['id'] = str(ObjectId())
     
     if pedido_dict.get('cliente_id'):
-        cliente = await db.clientes.find_one({"id": pedido_dict['cliente_id']}, {"_id": 0})
+        cliente = await repos.clientes.obter(pedido_dict['cliente_id'])
         if cliente:
             pedido_dict['cliente_nome'] = cliente.get('nome')
             pedido_dict['cliente_telefone'] = cliente.get('telefone')
             pedido_dict['cliente_endereco'] = cliente.get('endereco')
     
-    await db.pedidos.insert_one(pedido_dict)
+    baixadas, sem_estoque = await baixar_estoque(pedido_dict['id'], quantidades_por_produto(pedido_dict['itens']))
+    if sem_estoque and ESTOQUE_MODO == 'rejeitar':
+        await repor_estoque(baixadas)
+        nomes = sorted({i['produto_nome'] for i in pedido_dict['itens'] if i['produto_id'] in sem_estoque})
+        raise HTTPException(status_code=409, detail=f"Estoque insuficiente: {', '.join(nomes)}")
+    pedido_dict['estoque_baixado'] = True
+    if sem_estoque:
+        pedido_dict['itens_sem_estoque'] = sem_estoque
+    
+    try:
+        await repos.pedidos.inserir(pedido_dict)
+    except Exception:
+        await repor_estoque(baixadas)
+        raise
+    
+    vendas = {}
+    acumular_vendas_diarias(vendas, pedido_dict)
+    await aplicar_vendas_diarias(vendas)
+    
     return Pedido(**pedido_dict)
 
+MAX_PEDIDOS_LOTE = int(os.environ.get('MAX_PEDIDOS_LOTE', '1000'))
+
+def resumir_erros_validacao(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, erro['loc']))}: {erro['msg']}" for erro in e.errors()[:3])
+
+def planejar_baixas(pedidos: List[Dict[str, Any]], estoques: Dict[str, Any]) -> List[tuple]:
+    # Simula, na ordem do lote, as baixas que POST /pedidos faria pedido a pedido.
+    # Retorna (baixadas ou None se rejeitado, produto_ids sem estoque) por pedido
+    planos = []
+    for pedido in pedidos:
+        quantidades = quantidades_por_produto(pedido['itens'])
+        baixadas = {}
+        for produto_id, quantidade in quantidades.items():
+            disponivel = estoques.get(produto_id)
+            if isinstance(disponivel, (int, float)) and disponivel >= quantidade:
+                baixadas[produto_id] = quantidade
+        sem_estoque = [pid for pid in quantidades if pid not in baixadas]
+        if sem_estoque and ESTOQUE_MODO == 'rejeitar':
+            planos.append((None, sem_estoque))
+            continue
+        for produto_id, quantidade in baixadas.items():
+            estoques[produto_id] -= quantidade
+        planos.append((baixadas, sem_estoque))
+    return planos
+
+async def baixar_estoque_lote(lote_id: str, pedidos: List[Dict[str, Any]]) -> List[tuple]:
+    # Uma leitura dos estoques e um único bulk_write com o total por produto. Se outra
+    # venda mexeu no estoque entre a leitura e a baixa, desfaz e refaz pedido a pedido
+    produto_ids = list({item['produto_id'] for pedido in pedidos for item in pedido['itens']})
+    planos = planejar_baixas(pedidos, await repos.produtos.estoques(produto_ids))
+    
+    totais = defaultdict(float)
+    for baixadas, _ in planos:
+        for produto_id, quantidade in (baixadas or {}).items():
+            totais[produto_id] += quantidade
+    baixadas_lote, faltou = await baixar_estoque(lote_id, dict(totais))
+    if not faltou:
+        return planos
+    
+    await repor_estoque(baixadas_lote)
+    planos = []
+    for pedido in pedidos:
+        baixadas, sem_estoque = await baixar_estoque(pedido['id'], quantidades_por_produto(pedido['itens']))
+        if sem_estoque and ESTOQUE_MODO == 'rejeitar':
+            await repor_estoque(baixadas)
+            baixadas = None
+        planos.append((baixadas, sem_estoque))
+    return planos
+
+@api_router.post("/pedidos/batch")
+async def create_pedidos_batch(pedidos: List[Dict[str, Any]]):
+    # Sincronização do caixa: cada pedido é validado e gravado por conta própria e a
+    # resposta traz um resultado por posição (criado, duplicado, rejeitado ou invalido/erro).
+    # Clientes numa consulta $in, estoque num bulk_write, pedidos num insert_many
+    if len(pedidos) > MAX_PEDIDOS_LOTE:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_PEDIDOS_LOTE} pedidos por lote")
+    
+    resultados: List[Dict[str, Any]] = [None] * len(pedidos)
+    agora = datetime.now(timezone.utc)
+    validos = []  # (posição, pedido_dict)
+    ids_no_lote = set()
+    for posicao, dados in enumerate(pedidos):
+        try:
+            pedido = PedidoLote.model_validate(dados)
+        except ValidationError as e:
+            resultados[posicao] = {"posicao": posicao, "status": "invalido", "erro": resumir_erros_validacao(e)}
+            continue
+        pedido_dict = pedido.model_dump(exclude={'id', 'data_pedido'})
+        pedido_dict['id'] = pedido.id or str(ObjectId())
+        pedido_dict.update(campos_data_pedido(pedido.data_pedido or agora))
+        if pedido_dict['id'] in ids_no_lote:
+            resultados[posicao] = {"posicao": posicao, "status": "duplicado", "id": pedido_dict['id']}
+            continue
+        ids_no_lote.add(pedido_dict['id'])
+        validos.append((posicao, pedido_dict))
+    
+    # Reenvio de um lote já (parcialmente) sincronizado: os pedidos gravados não contam de novo
+    existentes = await repos.pedidos.ids_existentes([pedido['id'] for _, pedido in validos])
+    novos = []
+    for posicao, pedido_dict in validos:
+        if pedido_dict['id'] in existentes:
+            resultados[posicao] = {"posicao": posicao, "status": "duplicado", "id": pedido_dict['id']}
+        else:
+            novos.append((posicao, pedido_dict))
+    
+    clientes = await repos.clientes.obter_muitos(list({p['cliente_id'] for _, p in novos if p.get('cliente_id')}))
+    for _, pedido_dict in novos:
+        cliente = clientes.get(pedido_dict.get('cliente_id'))
+        if cliente:
+            pedido_dict['cliente_nome'] = cliente.get('nome')
+            pedido_dict['cliente_telefone'] = cliente.get('telefone')
+            pedido_dict['cliente_endereco'] = cliente.get('endereco')
+    
+    planos = await baixar_estoque_lote(str(ObjectId()), [pedido for _, pedido in novos])
+    aceitos = []  # (posição, pedido_dict, baixadas)
+    for (posicao, pedido_dict), (baixadas, sem_estoque) in zip(novos, planos):
+        if baixadas is None:
+            nomes = sorted({i['produto_nome'] for i in pedido_dict['itens'] if i['produto_id'] in sem_estoque})
+            resultados[posicao] = {"posicao": posicao, "status": "rejeitado", "id": pedido_dict['id'],
+                                   "erro": f"Estoque insuficiente: {', '.join(nomes)}"}
+            continue
+        pedido_dict['estoque_baixado'] = True
+        if sem_estoque:
+            pedido_dict['itens_sem_estoque'] = sem_estoque
+        aceitos.append((posicao, pedido_dict, baixadas))
+    
+    falhas = await repos.pedidos.inserir_muitos([pedido for _, pedido, _ in aceitos]) if aceitos else {}
+    
+    vendas = {}
+    estornar = defaultdict(float)
+    for indice, (posicao, pedido_dict, baixadas) in enumerate(aceitos):
+        if indice in falhas:
+            for produto_id, quantidade in baixadas.items():
+                estornar[produto_id] += quantidade
+            resultados[posicao] = {"posicao": posicao, "status": "erro", "id": pedido_dict['id'], "erro": falhas[indice]}
+            continue
+        acumular_vendas_diarias(vendas, pedido_dict)
+        resultados[posicao] = {
+            "posicao": posicao,
+            "status": "criado",
+            "id": pedido_dict['id'],
+            "data_pedido": pedido_dict['data_pedido'],
+            "itens_sem_estoque": pedido_dict.get('itens_sem_estoque'),
+        }
+    await repor_estoque(dict(estornar))
+    await aplicar_vendas_diarias(vendas)
+    
+    contagem = defaultdict(int)
+    for resultado in resultados:
+        contagem[resultado['status']] += 1
+    return {"total": len(pedidos), **{status: contagem[status] for status in ("criado", "duplicado", "rejeitado", "invalido", "erro")},
+            "resultados": resultados}
+
+# Cursor da paginação por keyset: (data_pedido, id) do último pedido da página,
+# codificado em base64 para o cliente tratá-lo como opaco
+
+def codificar_cursor(pedido: Dict[str, Any]) -> str:
+    valor = f"{pedido['data_pedido'].isoformat()},{pedido['id']}"
+    return base64.urlsafe_b64encode(valor.encode("utf-8")).decode("ascii")
+
+def decodificar_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        data_pedido, pedido_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit(",", 1)
+        data_pedido = datetime.fromisoformat(data_pedido)
+        if data_pedido.tzinfo is None:
+            raise ValueError(data_pedido)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    
+    # Pedidos estritamente depois do cursor na ordem (data_pedido desc, id desc)
+    return {"$or": [
+        {"data_pedido": {"$lt": data_pedido}},
+        {"data_pedido": data_pedido, "id": {"$lt": pedido_id}},
+    ]}
+
 @api_router.get("/pedidos")
 async def get_pedidos(
     dataInicio: Optional[str] = None,
     dataFim: Optional[str] = None,
     clienteId: Optional[str] = None,
-    page: int = 1,
-    pageSize: int = 20,
+    page: int = Query(1, ge=1),
+    pageSize: int = Query(20, ge=1, le=1000),
+    after: Optional[str] = None,
+    includeTotal: Optional[bool] = None,
 ):
-    query = {}
-    
-    if dataInicio and dataFim:
-        query["data_pedido"] = {
-            "$gte": dataInicio,
-            "$lte": dataFim
-        }
+    # Dois modos: page/pageSize (skip, mantido para clientes antigos) e
+    # after=<cursor> (seek pelo índice data_pedido_id, custo constante por página)
+    query = filtro_pedidos(dataInicio, dataFim, clienteId)
     
-    if clienteId:
-        query["cliente_id"] = clienteId
+    # Um pedido a mais só para saber se existe próxima página
+    pedidos = await repos.pedidos.listar(
+        {"$and": [query, decodificar_cursor(after)]} if after else query,
+        0 if after else (page - 1) * pageSize,
+        pageSize + 1,
+    )
+    next_cursor = codificar_cursor(pedidos[pageSize - 1]) if len(pedidos) > pageSize else None
+    pedidos = pedidos[:pageSize]
     
-    total_count = await db.pedidos.count_documents(query)
-    skip = (page - 1) * pageSize
+    # Total: padrão no modo page, opcional no modo cursor; sem filtros usa a contagem estimada
+    if includeTotal is None:
+        includeTotal = not after
+    total_count = await repos.pedidos.contar(query) if includeTotal else None
     
-    pedidos = await db.pedidos.find(query, {"_id": 0}).sort("data_pedido", -1).skip(skip).limit(pageSize).to_list(pageSize)
-    
-    return {
+    result = {
         "pedidos": pedidos,
         "totalCount": total_count,
-        "page": page,
-        "pageSize": pageSize
+        "pageSize": pageSize,
+        "nextCursor": next_cursor
     }
+    if not after:
+        result["page"] = page
+    
+    # Sem response_model aqui: o caminho rápido só troca o encoder
+    return RespostaJSONRapida(result) if SERIALIZACAO_RAPIDA else result
+
+@api_router.get("/pedidos/export")
+async def export_pedidos(
+    formato: str = Query("csv", pattern="^(csv|ndjson)$"),
+    dataInicio: Optional[str] = None,
+    dataFim: Optional[str] = None,
+    clienteId: Optional[str] = None,
+):
+    query = filtro_pedidos(dataInicio, dataFim, clienteId)
+    campos = None if formato == 'ndjson' else CAMPOS_CSV_PEDIDOS
+    docs = repos.pedidos.exportar(query, campos, EXPORT_BATCH_SIZE)
+    return resposta_exportacao(docs, formato, CAMPOS_CSV_PEDIDOS, "pedidos")
 
 @api_router.get("/pedidos/{pedido_id}", response_model=Pedido)
 async def get_pedido(pedido_id: str):
-    pedido = await db.pedidos.find_one({"id": pedido_id}, {"_id": 0})
+    # Pedidos de meses fechados continuam acessíveis pelo id, lidos de pedidos_arquivo
+    pedido = await repos.pedidos.obter(pedido_id) or await repos.pedidos.obter_arquivado(pedido_id)
     if not pedido:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
     return pedido
 
 @api_router.delete("/pedidos/{pedido_id}")
 async def delete_pedido(pedido_id: str):
-    # Verificar se pedido existe
-    pedido = await db.pedidos.find_one({"id": pedido_id})
+    # Excluir pedido (MongoDB não tem ItemPedido separado, itens estão dentro do pedido)
+    pedido = await repos.pedidos.excluir(pedido_id)
     if not pedido:
+        if await repos.pedidos.obter_arquivado(pedido_id):
+            raise HTTPException(status_code=409, detail="Pedido arquivado (mês fechado) não pode ser excluído")
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
     
-    # Excluir pedido (MongoDB não tem ItemPedido separado, itens estão dentro do pedido)
-    result = await db.pedidos.delete_one({"id": pedido_id})
+    vendas = {}
+    acumular_vendas_diarias(vendas, pedido, sinal=-1)
+    await aplicar_vendas_diarias(vendas)
     
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=500, detail="Erro ao excluir pedido")
+    # Pedidos anteriores à baixa de estoque (ou importados) não devolvem nada
+    if pedido.get('estoque_baixado'):
+        sem_estoque = set(pedido.get('itens_sem_estoque') or [])
+        quantidades = quantidades_por_produto(pedido.get('itens', []))
+        await repor_estoque({pid: q for pid, q in quantidades.items() if pid not in sem_estoque})
     
     return {"message": "Pedido excluído com sucesso"}
 
-@api_router.post("/pedidos/import-csv")
-async def import_csv(file: UploadFile = File(...)):
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Arquivo deve ser CSV")
+def parse_linha_pedido(row: Dict[str, str]) -> Dict[str, Any]:
+    # Validar campos obrigatórios
+    if not row.get('data_pedido') or not row.get('valor_total'):
+        raise ValueError("Campos obrigatórios faltando: data_pedido, valor_total")
+    
+    # Parse de data (suporta dd/MM/yyyy e yyyy-MM-dd); sem fuso = horário da loja
+    data_str = row['data_pedido'].strip()
+    try:
+        if '/' in data_str:
+            # Formato dd/MM/yyyy
+            parts = data_str.split('/')
+            data_pedido = datetime(int(parts[2]), int(parts[1]), int(parts[0]), tzinfo=FUSO_HORARIO)
+        else:
+            # Formato yyyy-MM-dd
+            data_pedido = datetime.fromisoformat(data_str.replace('Z', '+00:00'))
+            if data_pedido.tzinfo is None:
+                data_pedido = data_pedido.replace(tzinfo=FUSO_HORARIO)
+    except (ValueError, IndexError):
+        raise ValueError(f"Data inválida: {data_str}")
+    
+    # Parse de valores numéricos
+    try:
+        valor_total = float(row['valor_total'].replace(',', '.'))
+        total_itens = float(row.get('total_itens', 0))
+    except (TypeError, ValueError):
+        raise ValueError("Valores numéricos inválidos")
+    
+    return {
+        'id': str(ObjectId()),
+        **campos_data_pedido(data_pedido),
+        'cliente_id': None,
+        'cliente_nome': (row.get('cliente_nome') or '').strip() or None,
+        'cliente_telefone': (row.get('cliente_telefone') or '').strip() or None,
+        'cliente_endereco': None,
+        'total_itens': total_itens,
+        'valor_total': valor_total,
+        'observacao': (row.get('observacao') or '').strip() or None,
+        'itens': []  # Importação simplificada sem itens detalhados
+    }
+
+async def inserir_lote_pedidos(lote: List[tuple], resumo: Dict[str, Any]):
+    if not lote:
+        return
+    
+    # O resto do lote é gravado; só as linhas com erro ficam de fora
+    falhas_lote = await repos.pedidos.inserir_muitos([pedido for _, pedido in lote])
     
-    # Ler conteúdo do arquivo
-    contents = await file.read()
-    decoded = contents.decode('utf-8')
-    csv_reader = csv.DictReader(io.StringIO(decoded), delimiter=';')
+    vendas = {}
+    for posicao, (linha, pedido) in enumerate(lote):
+        if posicao in falhas_lote:
+            registrar_falha(resumo, linha, falhas_lote[posicao])
+            continue
+        acumular_vendas_diarias(vendas, pedido)
+        resumo['importados'] += 1
     
-    importados = 0
-    falhas = 0
-    erros_detalhados = []
+    await aplicar_vendas_diarias(vendas)
+
+async def importar_pedidos(arquivo: BinaryIO, batch_size: int, progresso=None) -> Dict[str, Any]:
+    resumo = novo_resumo_importacao()
+    lote = []
+    linhas = 0
     
     # Cabeçalhos esperados: data_pedido;cliente_nome;cliente_telefone;total_itens;valor_total;observacao
-    for idx, row in enumerate(csv_reader, start=2):  # start=2 porque linha 1 é cabeçalho
+    for idx, row in ler_linhas_csv(arquivo):
+        linhas = idx - 1
         try:
-            # Validar campos obrigatórios
-            if not row.get('data_pedido') or not row.get('valor_total'):
-                raise ValueError("Campos obrigatórios faltando: data_pedido, valor_total")
-            
-            # Parse de data (suporta dd/MM/yyyy e yyyy-MM-dd)
-            data_str = row['data_pedido'].strip()
-            try:
-                if '/' in data_str:
-                    # Formato dd/MM/yyyy
-                    parts = data_str.split('/')
-                    data_pedido = datetime(int(parts[2]), int(parts[1]), int(parts[0]), tzinfo=timezone.utc)
-                else:
-                    # Formato yyyy-MM-dd
-                    data_pedido = datetime.fromisoformat(data_str.replace('Z', '+00:00'))
-                    if data_pedido.tzinfo is None:
-                        data_pedido = data_pedido.replace(tzinfo=timezone.utc)
-            except:
-                raise ValueError(f"Data inválida: {data_str}")
-            
-            # Parse de valores numéricos
-            try:
-                valor_total = float(row['valor_total'].replace(',', '.'))
-                total_itens = float(row.get('total_itens', 0))
-            except:
-                raise ValueError("Valores numéricos inválidos")
-            
-            # Criar pedido
-            pedido_dict = {
-                'id': str(ObjectId()),
-                'data_pedido': data_pedido.isoformat(),
-                'cliente_id': None,
-                'cliente_nome': row.get('cliente_nome', '').strip() or None,
-                'cliente_telefone': row.get('cliente_telefone', '').strip() or None,
-                'cliente_endereco': None,
-                'total_itens': total_itens,
-                'valor_total': valor_total,
-                'observacao': row.get('observacao', '').strip() or None,
-                'itens': []  # Importação simplificada sem itens detalhados
-            }
-            
-            await db.pedidos.insert_one(pedido_dict)
-            importados += 1
-            
+            lote.append((idx, parse_linha_pedido(row)))
         except Exception as e:
-            falhas += 1
-            erros_detalhados.append({
-                'linha': idx,
-                'erro': str(e)
-            })
+            registrar_falha(resumo, idx, e)
+        
+        if len(lote) >= batch_size:
+            await inserir_lote_pedidos(lote, resumo)
+            lote = []
+            if progresso:
+                await progresso.atualizar(linhas, resumo)
     
-    return {
-        'importados': importados,
-        'falhas': falhas,
-        'erros_detalhados': erros_detalhados[:10]  # Limitar a 10 erros para não sobrecarregar resposta
-    }
+    await inserir_lote_pedidos(lote, resumo)
+    if progresso:
+        await progresso.atualizar(linhas, resumo, final=True)
+    
+    return resumo
+
+@api_router.post("/pedidos/import-csv")
+async def import_csv(
+    response: Response,
+    file: UploadFile = File(...),
+    batchSize: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10000),
+    aguardar: bool = False,
+):
+    return await iniciar_importacao(file, response, "importacao_pedidos", importar_pedidos, batchSize, aguardar)
 
 # Analytics Routes (Protegidas)
-@api_router.get("/analytics/resumo")
-async def get_resumo(
+# As agregações rodam no MongoDB sobre o rollup vendas_diarias: cada endpoint monta
+# um pipeline $match/$group/$sort e recebe de volta apenas as linhas já agregadas.
+# Os filtros de período valem por dia inteiro (o rollup não guarda horário); dia e mes
+# são inteiros (AAAAMMDD, AAAAMM) no fuso da loja e viram texto só na resposta.
+LINHAS_PEDIDO = {"$match": {"produto_id": None}}
+LINHAS_PRODUTO = {"$match": {"produto_id": {"$ne": None}}}
+
+def filtro_pedidos(
     dataInicio: Optional[str] = None,
     dataFim: Optional[str] = None,
-):
+    clienteId: Optional[str] = None,
+) -> Dict[str, Any]:
     query = {}
     if dataInicio and dataFim:
-        query["data_pedido"] = {"$gte": dataInicio, "$lte": dataFim}
-    
-    pedidos = await db.pedidos.find(query, {"_id": 0}).to_list(10000)
-    
-    if not pedidos:
+        inicio, _ = ler_data_filtro(dataInicio)
+        fim, so_data = ler_data_filtro(dataFim)
+        # dataFim só com a data inclui o dia inteiro: vai até a meia-noite seguinte (exclusiva)
+        query["data_pedido"] = {"$gte": inicio, "$lt": dia_seguinte(fim)} if so_data else {"$gte": inicio, "$lte": fim}
+    if clienteId:
+        query["cliente_id"] = clienteId
+    return query
+
+def filtro_vendas(
+    dataInicio: Optional[str] = None,
+    dataFim: Optional[str] = None,
+    clienteId: Optional[str] = None,
+) -> Dict[str, Any]:
+    query = {}
+    if dataInicio and dataFim:
+        query["dia"] = {"$gte": dia_local(ler_data_filtro(dataInicio)[0]), "$lte": dia_local(ler_data_filtro(dataFim)[0])}
+    if clienteId:
+        query["cliente_id"] = clienteId
+    return query
+
+def filtro_ano(ano: Optional[int] = None, clienteId: Optional[str] = None) -> Dict[str, Any]:
+    query = {}
+    if ano:
+        query["dia"] = {"$gte": ano * 10000 + 101, "$lte": ano * 10000 + 1231}
+    if clienteId:
+        query["cliente_id"] = clienteId
+    return query
+
+async def agregar_vendas(query: Dict[str, Any], pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if ANALYTICS_MOTOR == 'colunar':
+        return await motor_colunar.agregar(query, pipeline)
+    return await repos.vendas.agregar(query, pipeline)
+
+# Pipelines (sem o $match inicial) e a formatação de cada resposta
+def pipelines_resumo() -> Dict[str, List[Dict[str, Any]]]:
+    return {
+        "totais": [
+            LINHAS_PEDIDO,
+            {"$group": {
+                "_id": None,
+                "faturamento_total": {"$sum": "$valor"},
+                "total_pedidos": {"$sum": "$pedidos"},
+            }},
+        ],
+        "produto_mais_vendido": [
+            LINHAS_PRODUTO,
+            {"$group": {
+                "_id": "$produto_id",
+                "nome": {"$last": "$produto_nome"},
+                "quantidade": {"$sum": "$quantidade"},
+            }},
+            {"$sort": {"quantidade": -1, "_id": 1}},
+            {"$limit": 1},
+        ],
+        "cliente_maior_faturamento": [
+            {"$match": {"produto_id": None, "cliente_id": {"$nin": [None, ""]}}},
+            {"$group": {
+                "_id": "$cliente_id",
+                "nome": {"$last": "$cliente_nome"},
+                "valor": {"$sum": "$valor"},
+            }},
+            {"$sort": {"valor": -1, "_id": 1}},
+            {"$limit": 1},
+        ],
+    }
+
+def formatar_resumo(facets: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    if not facets["totais"]:
         return {
             "faturamento_total": 0,
             "total_pedidos": 0,
@@ -411,38 +1470,25 @@ async def get_resumo(
             "cliente_maior_faturamento": None
         }
     
-    faturamento_total = sum(p["valor_total"] for p in pedidos)
-    total_pedidos = len(pedidos)
+    totais = facets["totais"][0]
+    faturamento_total = totais["faturamento_total"]
+    total_pedidos = totais["total_pedidos"]
     ticket_medio = faturamento_total / total_pedidos if total_pedidos > 0 else 0
     
-    # Produto mais vendido
-    produtos_qtd = defaultdict(lambda: {"quantidade": 0, "nome": ""})
-    for pedido in pedidos:
-        for item in pedido.get("itens", []):
-            produtos_qtd[item["produto_id"]]["quantidade"] += item["quantidade"]
-            produtos_qtd[item["produto_id"]]["nome"] = item["produto_nome"]
-    
     produto_mais_vendido = None
-    if produtos_qtd:
-        top_produto = max(produtos_qtd.items(), key=lambda x: x[1]["quantidade"])
+    if facets["produto_mais_vendido"]:
+        top_produto = facets["produto_mais_vendido"][0]
         produto_mais_vendido = {
-            "nome": top_produto[1]["nome"],
-            "quantidade": top_produto[1]["quantidade"]
+            "nome": top_produto["nome"],
+            "quantidade": top_produto["quantidade"]
         }
     
-    # Cliente com maior faturamento
-    clientes_valor = defaultdict(lambda: {"valor": 0, "nome": ""})
-    for pedido in pedidos:
-        if pedido.get("cliente_id"):
-            clientes_valor[pedido["cliente_id"]]["valor"] += pedido["valor_total"]
-            clientes_valor[pedido["cliente_id"]]["nome"] = pedido.get("cliente_nome", "")
-    
     cliente_maior_faturamento = None
-    if clientes_valor:
-        top_cliente = max(clientes_valor.items(), key=lambda x: x[1]["valor"])
+    if facets["cliente_maior_faturamento"]:
+        top_cliente = facets["cliente_maior_faturamento"][0]
         cliente_maior_faturamento = {
-            "nome": top_cliente[1]["nome"],
-            "valor": top_cliente[1]["valor"]
+            "nome": top_cliente.get("nome") or "",
+            "valor": top_cliente["valor"]
         }
     
     return {
@@ -453,202 +1499,842 @@ async def get_resumo(
         "cliente_maior_faturamento": cliente_maior_faturamento
     }
 
+def pipeline_vendas_por_dia() -> List[Dict[str, Any]]:
+    return [
+        LINHAS_PEDIDO,
+        {"$group": {
+            "_id": "$dia",
+            "valor": {"$sum": "$valor"},
+            "quantidade_itens": {"$sum": "$quantidade"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+def formatar_vendas_por_dia(linhas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"data": texto_dia(linha["_id"]), "valor": linha["valor"], "quantidade_itens": linha["quantidade_itens"]}
+            for linha in linhas]
+
+def pipeline_vendas_por_mes() -> List[Dict[str, Any]]:
+    return [
+        LINHAS_PEDIDO,
+        {"$group": {
+            "_id": "$mes",
+            "valor": {"$sum": "$valor"},
+            "pedidos": {"$sum": "$pedidos"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+def formatar_vendas_por_mes(linhas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"mes": texto_mes(linha["_id"]), "valor": linha["valor"], "pedidos": linha["pedidos"]} for linha in linhas]
+
+def pipeline_vendas_por_produto() -> List[Dict[str, Any]]:
+    return [
+        LINHAS_PRODUTO,
+        {"$group": {
+            "_id": "$produto_id",
+            "nome": {"$last": "$produto_nome"},
+            "valor": {"$sum": "$valor"},
+        }},
+        {"$sort": {"valor": -1, "_id": 1}},
+    ]
+
+def formatar_vendas_por_produto(linhas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"produto": linha["nome"], "valor": linha["valor"]} for linha in linhas]
+
+def pipeline_top_produtos(limit: Optional[int]) -> List[Dict[str, Any]]:
+    # limit None: todos os produtos (fechamento mensal)
+    pipeline = [
+        LINHAS_PRODUTO,
+        {"$group": {
+            "_id": "$produto_id",
+            "nome": {"$last": "$produto_nome"},
+            "quantidade": {"$sum": "$quantidade"},
+            "valor": {"$sum": "$valor"},
+        }},
+        {"$sort": {"quantidade": -1, "_id": 1}},
+    ]
+    if limit is not None:
+        pipeline.append({"$limit": limit})
+    return pipeline
+
+def formatar_top_produtos(linhas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"produto": linha["nome"], "quantidade": linha["quantidade"], "valor": linha["valor"]}
+            for linha in linhas]
+
+def pipeline_vendas_por_categoria() -> List[Dict[str, Any]]:
+    # Agrupa primeiro por produto para o $lookup rodar uma vez por produto, não por linha
+    return [
+        LINHAS_PRODUTO,
+        {"$group": {
+            "_id": "$produto_id",
+            "valor": {"$sum": "$valor"},
+            "quantidade": {"$sum": "$quantidade"},
+        }},
+        {"$lookup": {
+            "from": "produtos",
+            "localField": "_id",
+            "foreignField": "id",
+            "as": "produto",
+        }},
+        {"$group": {
+            "_id": {"$ifNull": [{"$arrayElemAt": ["$produto.tipo", 0]}, "Outros"]},
+            "valor": {"$sum": "$valor"},
+            "quantidade": {"$sum": "$quantidade"},
+        }},
+        {"$sort": {"valor": -1, "_id": 1}},
+    ]
+
+def formatar_vendas_por_categoria(linhas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"categoria": linha["_id"], "valor": linha["valor"], "quantidade": linha["quantidade"]}
+            for linha in linhas]
+
+def pipeline_produtos_por_mes() -> List[Dict[str, Any]]:
+    # Uma linha por (mês, produto); o ranking e o pivot ficam com formatar_produtos_por_mes
+    return [
+        LINHAS_PRODUTO,
+        {"$group": {
+            "_id": {"mes": "$mes", "produto_id": "$produto_id"},
+            "nome": {"$last": "$produto_nome"},
+            "valor": {"$sum": "$valor"},
+        }},
+        {"$sort": {"_id.mes": 1, "_id.produto_id": 1}},
+    ]
+
+def formatar_produtos_por_mes(linhas: List[Dict[str, Any]], limitProdutos: int) -> List[Dict[str, Any]]:
+    # Top produtos no período inteiro
+    produtos_total = defaultdict(lambda: {"valor": 0, "nome": ""})
+    for linha in linhas:
+        produto_id = linha["_id"]["produto_id"]
+        produtos_total[produto_id]["valor"] += linha["valor"]
+        produtos_total[produto_id]["nome"] = linha["nome"]
+    
+    top_produtos = sorted(produtos_total.items(), key=lambda x: x[1]["valor"], reverse=True)[:limitProdutos]
+    top_produto_ids = [p[0] for p in top_produtos]
+    produto_nomes = {p[0]: p[1]["nome"] for p in top_produtos}
+    
+    # Pivot por mês, apenas com os meses em que algum produto do top vendeu
+    vendas_mes_produto = defaultdict(dict)
+    for linha in linhas:
+        if linha["_id"]["produto_id"] in produto_nomes:
+            vendas_mes_produto[linha["_id"]["mes"]][linha["_id"]["produto_id"]] = linha["valor"]
+    
+    result = []
+    for mes in sorted(vendas_mes_produto.keys()):
+        mes_data = {"mes": texto_mes(mes)}
+        for prod_id in top_produto_ids:
+            mes_data[produto_nomes[prod_id]] = vendas_mes_produto[mes].get(prod_id, 0)
+        result.append(mes_data)
+    
+    return result
+
+@api_router.get("/analytics/resumo")
+async def get_resumo(
+    request: Request,
+    response: Response,
+    dataInicio: Optional[str] = None,
+    dataFim: Optional[str] = None,
+):
+    async def calcular():
+        query = filtro_vendas(dataInicio, dataFim)
+        facets = await agregar_vendas(query, [{"$facet": pipelines_resumo()}])
+        return formatar_resumo(facets[0])
+    
+    return await resposta_analytics(request, response, ("resumo", dataInicio, dataFim), calcular)
+
 @api_router.get("/analytics/vendas-por-dia")
 async def get_vendas_por_dia(
+    request: Request,
+    response: Response,
     dataInicio: Optional[str] = None,
     dataFim: Optional[str] = None,
     clienteId: Optional[str] = None,
 ):
-    query = {}
-    if dataInicio and dataFim:
-        query["data_pedido"] = {"$gte": dataInicio, "$lte": dataFim}
-    if clienteId:
-        query["cliente_id"] = clienteId
+    async def calcular():
+        query = filtro_vendas(dataInicio, dataFim, clienteId)
+        linhas = await agregar_vendas(query, pipeline_vendas_por_dia())
+        return formatar_vendas_por_dia(linhas)
     
-    pedidos = await db.pedidos.find(query, {"_id": 0}).to_list(10000)
-    
-    vendas_por_dia = defaultdict(lambda: {"valor": 0, "quantidade_itens": 0})
-    for pedido in pedidos:
-        data = pedido["data_pedido"][:10]  # YYYY-MM-DD
-        vendas_por_dia[data]["valor"] += pedido["valor_total"]
-        vendas_por_dia[data]["quantidade_itens"] += pedido["total_itens"]
-    
-    result = [{"data": k, "valor": v["valor"], "quantidade_itens": v["quantidade_itens"]} 
-              for k, v in sorted(vendas_por_dia.items())]
-    
-    return result
+    return await resposta_analytics(request, response, ("vendas-por-dia", dataInicio, dataFim, clienteId), calcular)
 
 @api_router.get("/analytics/vendas-por-mes")
 async def get_vendas_por_mes(
+    request: Request,
+    response: Response,
     ano: Optional[int] = None,
     clienteId: Optional[str] = None,
 ):
-    query = {}
-    if ano:
-        query["data_pedido"] = {
-            "$gte": f"{ano}-01-01",
-            "$lte": f"{ano}-12-31"
-        }
-    if clienteId:
-        query["cliente_id"] = clienteId
-    
-    pedidos = await db.pedidos.find(query, {"_id": 0}).to_list(10000)
+    async def calcular():
+        query = filtro_ano(ano, clienteId)
+        linhas = await agregar_vendas(query, pipeline_vendas_por_mes())
+        return formatar_vendas_por_mes(linhas)
     
-    vendas_por_mes = defaultdict(lambda: {"valor": 0, "pedidos": 0})
-    for pedido in pedidos:
-        mes = pedido["data_pedido"][:7]  # YYYY-MM
-        vendas_por_mes[mes]["valor"] += pedido["valor_total"]
-        vendas_por_mes[mes]["pedidos"] += 1
-    
-    result = [{"mes": k, "valor": v["valor"], "pedidos": v["pedidos"]} 
-              for k, v in sorted(vendas_por_mes.items())]
-    
-    return result
+    return await resposta_analytics(request, response, ("vendas-por-mes", ano, clienteId), calcular)
 
 @api_router.get("/analytics/vendas-por-produto")
 async def get_vendas_por_produto(
+    request: Request,
+    response: Response,
     dataInicio: Optional[str] = None,
     dataFim: Optional[str] = None,
     clienteId: Optional[str] = None,
 ):
-    query = {}
-    if dataInicio and dataFim:
-        query["data_pedido"] = {"$gte": dataInicio, "$lte": dataFim}
-    if clienteId:
-        query["cliente_id"] = clienteId
-    
-    pedidos = await db.pedidos.find(query, {"_id": 0}).to_list(10000)
-    
-    vendas_por_produto = defaultdict(float)
-    produto_nomes = {}
-    
-    for pedido in pedidos:
-        for item in pedido.get("itens", []):
-            vendas_por_produto[item["produto_id"]] += item["valor_total"]
-            produto_nomes[item["produto_id"]] = item["produto_nome"]
-    
-    result = [{"produto": produto_nomes[k], "valor": v} 
-              for k, v in sorted(vendas_por_produto.items(), key=lambda x: x[1], reverse=True)]
+    async def calcular():
+        query = filtro_vendas(dataInicio, dataFim, clienteId)
+        linhas = await agregar_vendas(query, pipeline_vendas_por_produto())
+        return formatar_vendas_por_produto(linhas)
     
-    return result
+    return await resposta_analytics(request, response, ("vendas-por-produto", dataInicio, dataFim, clienteId), calcular)
 
 @api_router.get("/analytics/top-produtos")
 async def get_top_produtos(
+    request: Request,
+    response: Response,
     dataInicio: Optional[str] = None,
     dataFim: Optional[str] = None,
-    limit: int = 10,
+    limit: int = Query(10, ge=1),
 ):
-    query = {}
-    if dataInicio and dataFim:
-        query["data_pedido"] = {"$gte": dataInicio, "$lte": dataFim}
-    
-    pedidos = await db.pedidos.find(query, {"_id": 0}).to_list(10000)
-    
-    produtos_stats = defaultdict(lambda: {"quantidade": 0, "valor": 0, "nome": ""})
-    
-    for pedido in pedidos:
-        for item in pedido.get("itens", []):
-            produtos_stats[item["produto_id"]]["quantidade"] += item["quantidade"]
-            produtos_stats[item["produto_id"]]["valor"] += item["valor_total"]
-            produtos_stats[item["produto_id"]]["nome"] = item["produto_nome"]
-    
-    result = [{"produto": v["nome"], "quantidade": v["quantidade"], "valor": v["valor"]} 
-              for k, v in sorted(produtos_stats.items(), key=lambda x: x[1]["quantidade"], reverse=True)[:limit]]
+    async def calcular():
+        query = filtro_vendas(dataInicio, dataFim)
+        linhas = await agregar_vendas(query, pipeline_top_produtos(limit))
+        return formatar_top_produtos(linhas)
     
-    return result
+    return await resposta_analytics(request, response, ("top-produtos", dataInicio, dataFim, limit), calcular)
 
 @api_router.get("/analytics/vendas-por-categoria")
 async def get_vendas_por_categoria(
+    request: Request,
+    response: Response,
     dataInicio: Optional[str] = None,
     dataFim: Optional[str] = None,
 ):
-    query = {}
-    if dataInicio and dataFim:
-        query["data_pedido"] = {"$gte": dataInicio, "$lte": dataFim}
-    
-    pedidos = await db.pedidos.find(query, {"_id": 0}).to_list(10000)
-    produtos = await db.produtos.find({}, {"_id": 0}).to_list(10000)
+    async def calcular():
+        query = filtro_vendas(dataInicio, dataFim)
+        linhas = await agregar_vendas(query, pipeline_vendas_por_categoria())
+        return formatar_vendas_por_categoria(linhas)
     
-    produto_tipo_map = {p["id"]: p["tipo"] for p in produtos}
-    
-    categoria_stats = defaultdict(lambda: {"valor": 0, "quantidade": 0})
-    
-    for pedido in pedidos:
-        for item in pedido.get("itens", []):
-            tipo = produto_tipo_map.get(item["produto_id"], "Outros")
-            categoria_stats[tipo]["valor"] += item["valor_total"]
-            categoria_stats[tipo]["quantidade"] += item["quantidade"]
-    
-    result = [{"categoria": k, "valor": v["valor"], "quantidade": v["quantidade"]} 
-              for k, v in sorted(categoria_stats.items(), key=lambda x: x[1]["valor"], reverse=True)]
-    
-    return result
+    return await resposta_analytics(request, response, ("vendas-por-categoria", dataInicio, dataFim), calcular)
 
 @api_router.get("/analytics/produtos-por-mes")
 async def get_produtos_por_mes(
+    request: Request,
+    response: Response,
     dataInicio: Optional[str] = None,
     dataFim: Optional[str] = None,
-    limitProdutos: int = 5,
+    limitProdutos: int = Query(5, ge=1),
 ):
-    query = {}
-    if dataInicio and dataFim:
-        query["data_pedido"] = {"$gte": dataInicio, "$lte": dataFim}
-    
-    pedidos = await db.pedidos.find(query, {"_id": 0}).to_list(10000)
-    
-    # Get top products overall
-    produtos_total = defaultdict(lambda: {"valor": 0, "nome": ""})
-    for pedido in pedidos:
-        for item in pedido.get("itens", []):
-            produtos_total[item["produto_id"]]["valor"] += item["valor_total"]
-            produtos_total[item["produto_id"]]["nome"] = item["produto_nome"]
+    async def calcular():
+        query = filtro_vendas(dataInicio, dataFim)
+        linhas = await agregar_vendas(query, pipeline_produtos_por_mes())
+        return formatar_produtos_por_mes(linhas, limitProdutos)
     
-    top_produtos = sorted(produtos_total.items(), key=lambda x: x[1]["valor"], reverse=True)[:limitProdutos]
-    top_produto_ids = [p[0] for p in top_produtos]
-    produto_nomes = {p[0]: p[1]["nome"] for p in top_produtos}
-    
-    # Group by month
-    vendas_mes_produto = defaultdict(lambda: defaultdict(float))
-    for pedido in pedidos:
-        mes = pedido["data_pedido"][:7]  # YYYY-MM
-        for item in pedido.get("itens", []):
-            if item["produto_id"] in top_produto_ids:
-                vendas_mes_produto[mes][item["produto_id"]] += item["valor_total"]
-    
-    result = []
-    for mes in sorted(vendas_mes_produto.keys()):
-        mes_data = {"mes": mes}
-        for prod_id in top_produto_ids:
-            mes_data[produto_nomes[prod_id]] = vendas_mes_produto[mes].get(prod_id, 0)
-        result.append(mes_data)
+    return await resposta_analytics(request, response, ("produtos-por-mes", dataInicio, dataFim, limitProdutos), calcular)
+
+@api_router.get("/analytics/dashboard")
+async def get_dashboard(
+    request: Request,
+    response: Response,
+    dataInicio: Optional[str] = None,
+    dataFim: Optional[str] = None,
+    clienteId: Optional[str] = None,
+    ano: Optional[int] = None,
+    limit: int = Query(10, ge=1),
+    limitProdutos: int = Query(5, ge=1),
+):
+    async def calcular():
+        # Todos os gráficos do dashboard num único $facet: o rollup é lido uma vez só.
+        # vendas_por_mes usa o filtro de ano; os demais usam o período. O clienteId vale para todos.
+        filtro_periodo = filtro_vendas(dataInicio, dataFim)
+        filtro_mes = filtro_ano(ano)
+        
+        query = {"$or": [filtro_periodo, filtro_mes]} if filtro_periodo and filtro_mes else {}
+        if clienteId:
+            query["cliente_id"] = clienteId
+        
+        def no_periodo(pipeline):
+            return ([{"$match": filtro_periodo}] if filtro_periodo else []) + pipeline
+        
+        facets = {f"resumo_{nome}": no_periodo(pipeline) for nome, pipeline in pipelines_resumo().items()}
+        facets.update({
+            "vendas_por_dia": no_periodo(pipeline_vendas_por_dia()),
+            "vendas_por_mes": ([{"$match": filtro_mes}] if filtro_mes else []) + pipeline_vendas_por_mes(),
+            "vendas_por_produto": no_periodo(pipeline_vendas_por_produto()),
+            "top_produtos": no_periodo(pipeline_top_produtos(limit)),
+            "vendas_por_categoria": no_periodo(pipeline_vendas_por_categoria()),
+            "produtos_por_mes": no_periodo(pipeline_produtos_por_mes()),
+        })
+        
+        resultado = (await agregar_vendas(query, [{"$facet": facets}]))[0]
+        
+        return {
+            "resumo": formatar_resumo({nome: resultado[f"resumo_{nome}"] for nome in pipelines_resumo()}),
+            "vendas_por_dia": formatar_vendas_por_dia(resultado["vendas_por_dia"]),
+            "vendas_por_mes": formatar_vendas_por_mes(resultado["vendas_por_mes"]),
+            "vendas_por_produto": formatar_vendas_por_produto(resultado["vendas_por_produto"]),
+            "top_produtos": formatar_top_produtos(resultado["top_produtos"]),
+            "vendas_por_categoria": formatar_vendas_por_categoria(resultado["vendas_por_categoria"]),
+            "produtos_por_mes": formatar_produtos_por_mes(resultado["produtos_por_mes"], limitProdutos),
+        }
     
-    return result
+    return await resposta_analytics(request, response, ("dashboard", dataInicio, dataFim, clienteId, ano, limit, limitProdutos), calcular)
 
 @api_router.get("/analytics/vendas-cliente-timeline")
 async def get_vendas_cliente_timeline(
+    request: Request,
+    response: Response,
     clienteId: str,
     dataInicio: Optional[str] = None,
     dataFim: Optional[str] = None,
 ):
-    query = {"cliente_id": clienteId}
-    if dataInicio and dataFim:
-        query["data_pedido"] = {"$gte": dataInicio, "$lte": dataFim}
+    async def calcular():
+        query = filtro_pedidos(dataInicio, dataFim, clienteId)
+        return [{"data": texto_dia(linha["dia"]), "valor": linha["valor"]} for linha in await repos.pedidos.timeline(query)]
+    
+    return await resposta_analytics(request, response, ("vendas-cliente-timeline", clienteId, dataInicio, dataFim), calcular)
+
+# Dashboard ao vivo (Server-Sent Events); ver transmissao.py
+# Vendas gravadas são agrupadas por ANALYTICS_STREAM_INTERVALO segundos antes de
+# reler o rollup, então muitos dashboards abertos custam uma leitura por intervalo
+ANALYTICS_STREAM_INTERVALO = float(os.environ.get('ANALYTICS_STREAM_INTERVALO', '1'))
+ANALYTICS_STREAM_FILA = 100
+ANALYTICS_STREAM_PING_SEGUNDOS = 15
+
+async def ler_dias_stream(dias: List[int], cliente_id: Optional[str]) -> Dict[int, Dict[str, Any]]:
+    query = {"dia": {"$in": dias}}
+    if cliente_id:
+        query["cliente_id"] = cliente_id
+    linhas = await agregar_vendas(query, [
+        LINHAS_PEDIDO,
+        {"$group": {
+            "_id": "$dia",
+            "valor": {"$sum": "$valor"},
+            "quantidade_itens": {"$sum": "$quantidade"},
+            "pedidos": {"$sum": "$pedidos"},
+        }},
+    ])
+    por_dia = {linha["_id"]: linha for linha in linhas}
+    # Dia que ficou sem pedidos (exclusão) sai com zeros
+    return {
+        dia: {
+            "data": texto_dia(dia),
+            "valor": por_dia.get(dia, {}).get("valor", 0),
+            "quantidade_itens": por_dia.get(dia, {}).get("quantidade_itens", 0),
+            "pedidos": por_dia.get(dia, {}).get("pedidos", 0),
+        }
+        for dia in dias
+    }
+
+async def ler_ranking_stream(dia_inicio: Optional[int], dia_fim: Optional[int], limite: int,
+                             cliente_id: Optional[str]) -> List[Dict[str, Any]]:
+    query = {"dia": {"$gte": dia_inicio, "$lte": dia_fim}} if dia_inicio is not None else {}
+    if cliente_id:
+        query["cliente_id"] = cliente_id
+    return formatar_top_produtos(await agregar_vendas(query, pipeline_top_produtos(limite)))
+
+transmissao_analytics = TransmissaoAnalytics(
+    ANALYTICS_STREAM_INTERVALO, ANALYTICS_STREAM_FILA, ANALYTICS_STREAM_PING_SEGUNDOS,
+    ler_dias_stream, ler_ranking_stream,
+)
+
+@api_router.get("/analytics/stream")
+async def stream_analytics(
+    dataInicio: Optional[str] = None,
+    dataFim: Optional[str] = None,
+    limit: int = Query(10, ge=1),
+    clienteId: Optional[str] = None,
+):
+    # Mesmos filtros do dashboard (dataInicio e dataFim juntos, clienteId) e o limit de top-produtos
+    periodo = filtro_vendas(dataInicio, dataFim).get("dia", {})
+    return StreamingResponse(
+        transmissao_analytics.eventos(periodo.get("$gte"), periodo.get("$lte"), limit, clienteId or None),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: o nginx repassa cada evento na hora, sem bufferizar
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Arquivamento de pedidos e fechamentos mensais
+# Pedidos de meses com mais de ARQUIVO_HORIZONTE_MESES (contados do mês corrente, no
+# fuso da loja; 0 desliga) saem de pedidos para pedidos_arquivo em lotes, a cada
+# ARQUIVO_INTERVALO_HORAS e pelo manage.py arquivar-pedidos. Antes de mover um mês,
+# os totais dele e as vendas de todos os produtos são gravados em fechamentos_mensais.
+# Fechamentos não são alterados: um pedido que chega depois para um mês fechado (caixa
+# offline, importação) entra na próxima rodada como ajuste, outro documento do mesmo
+# mês só com a diferença. Os fechamentos são o registro de auditoria: os gráficos
+# continuam lendo o rollup (histórico inteiro, sempre em dia) e a listagem, a contagem,
+# a exportação e a timeline de pedidos leem as duas coleções. Desligado por padrão.
+ARQUIVO_HORIZONTE_MESES = int(os.environ.get('ARQUIVO_HORIZONTE_MESES', '0'))
+ARQUIVO_INTERVALO_HORAS = float(os.environ.get('ARQUIVO_INTERVALO_HORAS', '24'))
+ARQUIVO_LOTE = 1000
+DIFERENCA_MINIMA = 1e-6  # abaixo disso é arredondamento de float, não ajuste
+
+def inicio_mes(mes: int) -> datetime:
+    return datetime(mes // 100, mes % 100, 1, tzinfo=FUSO_HORARIO)
+
+def mes_corte_arquivo(agora: datetime) -> int:
+    # Primeiro mês que fica em pedidos
+    local = agora.astimezone(FUSO_HORARIO)
+    meses = local.year * 12 + local.month - 1 - ARQUIVO_HORIZONTE_MESES
+    return (meses // 12) * 100 + meses % 12 + 1
+
+def somar_fechamentos(fechamentos: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    # Fechamento e ajustes de cada mês somados: {mes: {valor, pedidos, produtos: {id: ...}}}
+    por_mes: Dict[int, Dict[str, Any]] = {}
+    for fechamento in fechamentos:
+        mes = por_mes.setdefault(fechamento["mes"], {"valor": 0, "pedidos": 0, "produtos": {}})
+        mes["valor"] += fechamento["vendas_por_mes"]["valor"]
+        mes["pedidos"] += fechamento["vendas_por_mes"]["pedidos"]
+        for produto in fechamento["top_produtos"]:
+            atual = mes["produtos"].setdefault(produto["produto_id"], {"produto": produto["produto"], "quantidade": 0, "valor": 0})
+            atual["produto"] = produto["produto"]
+            atual["quantidade"] += produto["quantidade"]
+            atual["valor"] += produto["valor"]
+    return por_mes
+
+async def fechar_mes(mes: int) -> bool:
+    # Grava o fechamento do mês, ou o ajuste com o que mudou desde os fechamentos anteriores
+    existentes = await repos.fechamentos.listar(mes, mes)
+    anterior = somar_fechamentos(existentes).get(mes, {"valor": 0, "pedidos": 0, "produtos": {}})
+    query = {"dia": {"$gte": mes * 100 + 1, "$lte": mes * 100 + 31}}
+    resultado = (await agregar_vendas(query, [{"$facet": {
+        "vendas_por_mes": pipeline_vendas_por_mes(),
+        "top_produtos": pipeline_top_produtos(None),
+    }}]))[0]
+    total = resultado["vendas_por_mes"][0] if resultado["vendas_por_mes"] else {"valor": 0, "pedidos": 0}
+
+    produtos = []
+    atuais = {linha["_id"]: linha for linha in resultado["top_produtos"]}
+    for produto_id in sorted(set(atuais) | set(anterior["produtos"])):
+        atual = atuais.get(produto_id, {"quantidade": 0, "valor": 0})
+        antes = anterior["produtos"].get(produto_id, {"produto": None, "quantidade": 0, "valor": 0})
+        quantidade = atual["quantidade"] - antes["quantidade"]
+        valor = atual["valor"] - antes["valor"]
+        if abs(quantidade) > DIFERENCA_MINIMA or abs(valor) > DIFERENCA_MINIMA:
+            produtos.append({"produto_id": produto_id, "produto": atual.get("nome", antes["produto"]),
+                             "quantidade": quantidade, "valor": valor})
+    valor = total["valor"] - anterior["valor"]
+    pedidos = total["pedidos"] - anterior["pedidos"]
+    if not produtos and abs(valor) <= DIFERENCA_MINIMA and not pedidos:
+        return False
+
+    produtos.sort(key=lambda produto: (-produto["quantidade"], produto["produto_id"]))
+    # Dois processos fechando o mesmo mês: a sequência repetida é recusada pelo índice único
+    return await repos.fechamentos.inserir({
+        "mes": mes,
+        "sequencia": len(existentes) + 1,
+        "fechado_em": datetime.now(timezone.utc).isoformat(),
+        "vendas_por_mes": {"mes": texto_mes(mes), "valor": valor, "pedidos": pedidos},
+        "top_produtos": produtos,
+    })
+
+async def arquivar_pedidos() -> Dict[str, Any]:
+    resumo = {"meses": [], "fechamentos": 0, "pedidos_arquivados": 0}
+    if ARQUIVO_HORIZONTE_MESES <= 0:
+        return resumo
+    corte = mes_corte_arquivo(datetime.now(timezone.utc))
+    for mes in await repos.pedidos.meses_anteriores(inicio_mes(corte)):
+        resumo["fechamentos"] += await fechar_mes(mes)
+        filtro = {"mes": mes, "data_pedido": {"$lt": inicio_mes(corte)}}
+        while True:
+            movidos = await repos.pedidos.arquivar(filtro, ARQUIVO_LOTE)
+            resumo["pedidos_arquivados"] += movidos
+            if movidos < ARQUIVO_LOTE:
+                break
+            await asyncio.sleep(0)
+        # Pedido gravado entre o fechamento e a cópia já entra como ajuste nesta rodada
+        resumo["fechamentos"] += await fechar_mes(mes)
+        resumo["meses"].append(texto_mes(mes))
+    if resumo["pedidos_arquivados"]:
+        logger.info(f"{resumo['pedidos_arquivados']} pedido(s) arquivado(s) de {', '.join(resumo['meses'])}")
+    return resumo
+
+async def agendar_arquivamento():
+    while True:
+        try:
+            await arquivar_pedidos()
+        except Exception:
+            logger.exception("Falha no arquivamento de pedidos; nova tentativa no próximo intervalo")
+        await asyncio.sleep(ARQUIVO_INTERVALO_HORAS * 3600)
+
+tarefa_arquivamento: Optional[asyncio.Task] = None
+
+# Índices e migrações de schema
+# Aplicados no startup; os dois passos são idempotentes e podem rodar a cada boot.
+INDICES = {
+    "clientes": [
+        IndexModel([("id", ASCENDING)], name="id_unico", unique=True),
+        IndexModel([("telefone_normalizado", ASCENDING)], name="telefone_normalizado_unico", unique=True,
+                   partialFilterExpression={"telefone_normalizado": {"$gt": ""}}),
+        IndexModel([("busca_nome", ASCENDING)], name="busca_nome"),
+        IndexModel([("email_normalizado", ASCENDING)], name="email_normalizado"),
+        IndexModel([("telefone_local", ASCENDING)], name="telefone_local"),
+        IndexModel([("email_dominio", ASCENDING)], name="email_dominio"),
+        IndexModel([("versao", ASCENDING), ("id", ASCENDING)], name="versao_id"),
+    ],
+    "produtos": [
+        IndexModel([("id", ASCENDING)], name="id_unico", unique=True),
+        IndexModel([("cp", ASCENDING)], name="cp_unico", unique=True,
+                   partialFilterExpression={"cp": {"$type": "number"}}),
+        IndexModel([("versao", ASCENDING), ("id", ASCENDING)], name="versao_id"),
+    ],
+    "pedidos": [
+        IndexModel([("id", ASCENDING)], name="id_unico", unique=True),
+        IndexModel([("data_pedido", DESCENDING), ("id", DESCENDING)], name="data_pedido_id"),
+        IndexModel([("cliente_id", ASCENDING), ("data_pedido", DESCENDING), ("id", DESCENDING)],
+                   name="cliente_data_pedido_id"),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unico", unique=True),
+        # TTL: jobs terminados somem JOBS_RETENCAO_DIAS depois (expira_em só existe nos terminados)
+        IndexModel([("expira_em", ASCENDING)], name="expira_em_ttl", expireAfterSeconds=0),
+    ],
+    "exclusoes": [
+        IndexModel([("colecao", ASCENDING), ("versao", ASCENDING)], name="colecao_versao"),
+        # TTL: o registro de uma exclusão some SYNC_RETENCAO_DIAS depois
+        IndexModel([("expira_em", ASCENDING)], name="expira_em_ttl", expireAfterSeconds=0),
+    ],
+    "pedidos_arquivo": [
+        IndexModel([("id", ASCENDING)], name="id_unico", unique=True),
+        # A listagem e a exportação percorrem o arquivo na mesma ordem de pedidos
+        IndexModel([("data_pedido", DESCENDING), ("id", DESCENDING)], name="data_pedido_id"),
+        IndexModel([("cliente_id", ASCENDING), ("data_pedido", DESCENDING), ("id", DESCENDING)],
+                   name="cliente_data_pedido_id"),
+    ],
+    "fechamentos_mensais": [
+        IndexModel([("mes", ASCENDING), ("sequencia", ASCENDING)], name="mes_sequencia_unico", unique=True),
+    ],
+    "vendas_diarias": [
+        IndexModel([("dia", ASCENDING), ("produto_id", ASCENDING), ("cliente_id", ASCENDING)],
+                   name="dia_produto_cliente", unique=True),
+        IndexModel([("cliente_id", ASCENDING), ("dia", ASCENDING)], name="cliente_dia"),
+    ],
+}
+
+# O que define um índice além do nome: um índice existente com o mesmo nome e outra
+# definição (criado à mão ou por uma versão antiga) não é aceito no lugar do esperado
+OPCOES_INDICE = ("unique", "partialFilterExpression", "expireAfterSeconds")
+
+class IndiceDivergente(RuntimeError):
+    pass
+
+def definicao_indice(indice: Dict[str, Any]) -> Dict[str, Any]:
+    # Serve ao IndexModel.document e a uma entrada de index_information() (que pode
+    # trazer direções como float e unique: False explícito)
+    chave = indice["key"]
+    chave = chave.items() if isinstance(chave, dict) else chave
+    definicao = {"key": [(campo, int(direcao) if isinstance(direcao, (int, float)) else direcao) for campo, direcao in chave]}
+    for opcao in OPCOES_INDICE:
+        valor = indice.get(opcao)
+        if valor is None or valor is False:
+            continue
+        definicao[opcao] = int(valor) if opcao == "expireAfterSeconds" else valor
+    return definicao
+
+async def garantir_indices() -> List[str]:
+    criados = []
+    for colecao, indices in INDICES.items():
+        existentes = await db[colecao].index_information()
+        for indice in indices:
+            nome = indice.document["name"]
+            if nome in existentes:
+                esperado, atual = definicao_indice(indice.document), definicao_indice(existentes[nome])
+                if esperado != atual:
+                    # Falha o startup: seguir com a definição errada daria, por exemplo,
+                    # duplicados num índice que deveria ser único
+                    raise IndiceDivergente(
+                        f"Índice {colecao}.{nome} existe com outra definição: {atual} (esperado {esperado}). "
+                        f"Remova-o (db.{colecao}.dropIndex('{nome}')) e reinicie para recriá-lo"
+                    )
+                continue
+            try:
+                await db[colecao].create_indexes([indice])
+            except OperationFailure as e:
+                # Ex.: dados duplicados impedem um índice único; a API segue funcionando sem ele
+                logger.error(f"Não foi possível criar o índice {colecao}.{nome}: {e}")
+                continue
+            criados.append(f"{colecao}.{nome}")
+            logger.info(f"Índice criado: {colecao}.{nome}")
+    return criados
+
+async def migracao_rollup_vendas():
+    # Bases anteriores ao rollup: popula vendas_diarias a partir dos pedidos existentes
+    if await db.vendas_diarias.estimated_document_count() == 0 and await db.pedidos.estimated_document_count() > 0:
+        linhas = await rebuild_vendas_diarias()
+        logger.info(f"vendas_diarias populada com {linhas} linhas")
+
+async def migracao_indices_pedidos_com_id():
+    # Os índices de pedidos passaram a incluir o id (desempate da paginação por cursor);
+    # os antigos ficaram redundantes
+    existentes = await db.pedidos.index_information()
+    for nome in ("data_pedido", "cliente_data_pedido"):
+        if nome in existentes:
+            await db.pedidos.drop_index(nome)
+            logger.info(f"Índice removido: pedidos.{nome}")
+
+async def migracao_telefone_normalizado():
+    # Preenche a chave de deduplicação dos clientes já cadastrados, em lotes
+    pendentes = db.clientes.find({"telefone_normalizado": {"$exists": False}}, {"_id": 1, "telefone": 1})
+    duplicados = 0
+    while True:
+        lote = await pendentes.to_list(1000)
+        if not lote:
+            break
+        operacoes = [
+            UpdateOne({"_id": c["_id"]}, {"$set": {"telefone_normalizado": normalizar_telefone(c.get("telefone"))}})
+            for c in lote
+        ]
+        try:
+            await db.clientes.bulk_write(operacoes, ordered=False)
+        except BulkWriteError as e:
+            duplicados += len(e.details.get("writeErrors", []))
+    if duplicados:
+        logger.warning(f"{duplicados} cliente(s) com telefone repetido ficaram sem telefone_normalizado; "
+                       "unifique os cadastros duplicados")
+
+async def migracao_chaves_busca_clientes():
+    # Preenche as chaves de busca (exceto o telefone, já tratado na migração 3), em lotes
+    pendentes = db.clientes.find({"busca_nome": {"$exists": False}}, {"_id": 1, "nome": 1, "email": 1})
+    while True:
+        lote = await pendentes.to_list(1000)
+        if not lote:
+            break
+        operacoes = []
+        for c in lote:
+            chaves = chaves_busca_cliente(c)
+            del chaves['telefone_normalizado']
+            operacoes.append(UpdateOne({"_id": c["_id"]}, {"$set": chaves}))
+        await db.clientes.bulk_write(operacoes, ordered=False)
+
+async def migracao_chaves_busca_local_dominio():
+    # Clientes anteriores à busca pelo número sem DDD e pelo domínio do email
+    pendentes = db.clientes.find({"telefone_local": {"$exists": False}}, {"_id": 1, "telefone": 1, "email": 1})
+    while True:
+        lote = await pendentes.to_list(1000)
+        if not lote:
+            break
+        operacoes = []
+        for c in lote:
+            chaves = chaves_busca_cliente(c)
+            operacoes.append(UpdateOne({"_id": c["_id"]}, {"$set": {
+                "telefone_local": chaves["telefone_local"],
+                "email_dominio": chaves["email_dominio"],
+            }}))
+        await db.clientes.bulk_write(operacoes, ordered=False)
+
+async def migracao_contador_cp():
+    await semear_contador_cp()
+
+async def migracao_colecao_slow_queries():
+    # Capada: as consultas lentas mais antigas saem sozinhas
+    if "slow_queries" not in await db.list_collection_names(filter={"name": "slow_queries"}):
+        await db.create_collection("slow_queries", capped=True, size=16 * 1024 * 1024, max=SLOW_QUERY_MAX_REGISTROS)
+
+def data_pedido_texto(valor: Any) -> datetime:
+    # Pedidos gravados até a migração 7: ISO 8601 em UTC, com ou sem o fuso escrito
+    data = valor if isinstance(valor, datetime) else datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    return data if data.tzinfo else data.replace(tzinfo=timezone.utc)
+
+async def migracao_data_pedido_nativa():
+    # data_pedido em texto -> data do BSON + dia/mes, em lotes. Só pega o que ainda é
+    # texto: interrompida no meio, continua de onde parou no próximo startup
+    pendentes = db.pedidos.find({"data_pedido": {"$type": "string"}}, {"_id": 1, "data_pedido": 1})
+    convertidos = 0
+    invalidos = 0
+    while True:
+        lote = await pendentes.to_list(1000)
+        if not lote:
+            break
+        operacoes = []
+        for p in lote:
+            try:
+                campos = campos_data_pedido(data_pedido_texto(p["data_pedido"]))
+            except ValueError:
+                invalidos += 1
+                continue
+            operacoes.append(UpdateOne({"_id": p["_id"]}, {"$set": campos}))
+        if operacoes:
+            await db.pedidos.bulk_write(operacoes, ordered=False)
+        convertidos += len(operacoes)
+        if convertidos and convertidos % 100000 < len(operacoes):
+            logger.info(f"data_pedido: {convertidos} pedidos convertidos")
+    if invalidos:
+        logger.warning(f"{invalidos} pedido(s) com data_pedido inválida ficaram como texto")
+    
+    # O rollup passa a usar dia/mes inteiros no fuso da loja
+    if await db.vendas_diarias.find_one({"dia": {"$type": "string"}}):
+        linhas = await rebuild_vendas_diarias()
+        logger.info(f"{convertidos} pedidos convertidos; vendas_diarias recalculada com {linhas} linhas")
+
+async def migracao_versao_sincronizacao():
+    # Clientes e produtos anteriores à sincronização incremental ganham uma versão,
+    # para aparecerem na primeira lista completa (since=0)
+    for colecao in (db.clientes, db.produtos):
+        await colecao.update_many({"versao": {"$exists": False}}, {"$set": {"versao": relogio_versoes.proxima()}})
+
+async def migracao_indices_versao_com_id():
+    # A sincronização passou a paginar por (versao, id); o índice só de versão ficou redundante
+    for colecao in (db.clientes, db.produtos):
+        if "versao" in await colecao.index_information():
+            await colecao.drop_index("versao")
+            logger.info(f"Índice removido: {colecao.name}.versao")
+
+# (versão, nome, função); novas migrações entram sempre no fim da lista
+MIGRACOES = [
+    (1, "rollup_vendas_diarias", migracao_rollup_vendas),
+    (2, "indices_pedidos_com_id", migracao_indices_pedidos_com_id),
+    (3, "telefone_normalizado", migracao_telefone_normalizado),
+    (4, "chaves_busca_clientes", migracao_chaves_busca_clientes),
+    (5, "contador_cp", migracao_contador_cp),
+    (6, "colecao_slow_queries", migracao_colecao_slow_queries),
+    (7, "data_pedido_nativa", migracao_data_pedido_nativa),
+    (8, "versao_sincronizacao", migracao_versao_sincronizacao),
+    (9, "chaves_busca_local_dominio", migracao_chaves_busca_local_dominio),
+    (10, "indices_versao_com_id", migracao_indices_versao_com_id),
+]
+
+# Enquanto roda, a migração renova atualizada_em. Uma em_andamento sem sinal de vida
+# há MIGRACAO_ABANDONADA_SEGUNDOS (processo morto no meio) é retomada no startup;
+# por isso toda migração precisa poder rodar de novo sobre um resultado parcial
+MIGRACAO_PULSO_SEGUNDOS = 30
+MIGRACAO_ABANDONADA_SEGUNDOS = 120
+
+async def pulsar_migracao(versao: int):
+    while True:
+        await asyncio.sleep(MIGRACAO_PULSO_SEGUNDOS)
+        await db.schema_migrations.update_one({"_id": versao}, {"$set": {
+            "atualizada_em": datetime.now(timezone.utc).isoformat(),
+        }})
+
+async def aplicar_migracoes() -> List[int]:
+    aplicadas = []
+    for versao, nome, migracao in MIGRACOES:
+        # O documento da migração funciona como trava entre processos que sobem juntos
+        agora = datetime.now(timezone.utc).isoformat()
+        try:
+            await db.schema_migrations.insert_one({
+                "_id": versao,
+                "nome": nome,
+                "status": "em_andamento",
+                "iniciada_em": agora,
+                "atualizada_em": agora,
+            })
+        except DuplicateKeyError:
+            abandonada = (datetime.now(timezone.utc) - timedelta(seconds=MIGRACAO_ABANDONADA_SEGUNDOS)).isoformat()
+            retomada = await db.schema_migrations.find_one_and_update(
+                {"_id": versao, "status": "em_andamento", "atualizada_em": {"$lt": abandonada}},
+                {"$set": {"atualizada_em": agora}},
+            )
+            if retomada is None:
+                continue
+            logger.warning(f"Retomando a migração {versao} ({nome}), interrompida num startup anterior")
+        
+        pulso = asyncio.create_task(pulsar_migracao(versao))
+        try:
+            await migracao()
+        except Exception:
+            logger.exception(f"Falha na migração {versao} ({nome}); será tentada novamente no próximo startup")
+            await db.schema_migrations.delete_one({"_id": versao})
+            continue
+        finally:
+            pulso.cancel()
+        
+        await db.schema_migrations.update_one({"_id": versao}, {"$set": {
+            "status": "aplicada",
+            "aplicada_em": datetime.now(timezone.utc).isoformat(),
+        }})
+        aplicadas.append(versao)
+        logger.info(f"Migração aplicada: {versao} ({nome})")
+    return aplicadas
+
+# Routes - Jobs
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await repos.jobs.obter(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+@api_router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    # Cancela um job na fila ou em andamento; as linhas já gravadas permanecem
+    job = await executor_jobs.cancelar(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+# Diagnostics Routes
+@api_router.get("/diagnostics/indexes")
+async def get_diagnostics_indexes():
+    if db is None:
+        return {"armazenamento": ARMAZENAMENTO, "colecoes": {}, "migracoes": []}
     
-    pedidos = await db.pedidos.find(query, {"_id": 0}).sort("data_pedido", 1).to_list(10000)
+    colecoes = {}
+    for colecao, indices in INDICES.items():
+        existentes = await db[colecao].index_information()
+        esperados = {indice.document["name"] for indice in indices}
+        colecoes[colecao] = {
+            "indices": [
+                {
+                    "nome": nome,
+                    "chaves": [[campo, direcao] for campo, direcao in info["key"]],
+                    "unique": info.get("unique", False),
+                }
+                for nome, info in existentes.items()
+            ],
+            "faltando": sorted(esperados - set(existentes)),
+            "divergentes": sorted(
+                indice.document["name"] for indice in indices
+                if indice.document["name"] in existentes
+                and definicao_indice(indice.document) != definicao_indice(existentes[indice.document["name"]])
+            ),
+        }
     
-    result = [{"data": p["data_pedido"][:10], "valor": p["valor_total"]} for p in pedidos]
+    migracoes = await db.schema_migrations.find({}).sort("_id", 1).to_list(None)
     
-    return result
+    return {
+        "colecoes": colecoes,
+        "migracoes": [
+            {"versao": m["_id"], "nome": m["nome"], "status": m["status"], "aplicada_em": m.get("aplicada_em")}
+            for m in migracoes
+        ],
+    }
+
+@api_router.get("/diagnostics/slow-queries")
+async def get_diagnostics_slow_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    colecao: Optional[str] = None,
+    collscan: Optional[bool] = None,
+):
+    resultado = {"limite_ms": SLOW_QUERY_MS, "descartadas": consultas_lentas.descartadas}
+    if db is None:
+        return {"armazenamento": ARMAZENAMENTO, **resultado, "consultas": []}
+    
+    filtro = {}
+    if colecao:
+        filtro["colecao"] = colecao
+    if collscan is not None:
+        filtro["plano.collscan"] = collscan
+    
+    # Ordem natural da coleção capada = ordem de inserção; as mais recentes primeiro
+    consultas = await db.slow_queries.find(filtro, {"_id": 0}).sort("$natural", -1).to_list(limit)
+    return {**resultado, "consultas": consultas}
 
 app.include_router(api_router)
 
+# Métricas (formato texto do Prometheus), na raiz, onde o scraper procura por padrão
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# Por último: fica por fora do CORS e mede a requisição inteira
+app.add_middleware(MiddlewareMetricas)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -656,6 +2342,31 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_client():
+    if db is not None:
+        await garantir_indices()
+        await aplicar_migracoes()
+        consultas_lentas.iniciar(db)
+    transmissao_analytics.iniciar()
+    interrompidos = await executor_jobs.interromper_abandonados(JOB_ABANDONADO_SEGUNDOS)
+    if interrompidos:
+        logger.warning(f"{interrompidos} job(s) sem progresso marcados como interrompidos")
+    await catalogo.carregar()
+    if ANALYTICS_MOTOR == 'colunar':
+        # Depois das migrações, que podem recalcular o rollup
+        await motor_colunar.garantir_atualizada()
+    if ARQUIVO_HORIZONTE_MESES > 0:
+        global tarefa_arquivamento
+        tarefa_arquivamento = asyncio.create_task(agendar_arquivamento())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if tarefa_arquivamento is not None:
+        tarefa_arquivamento.cancel()
+        await asyncio.gather(tarefa_arquivamento, return_exceptions=True)
+    await executor_jobs.parar()
+    await consultas_lentas.parar()
+    await transmissao_analytics.parar()
+    if client is not None:
+        client.close()
\ No newline at end of file
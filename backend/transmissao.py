@@ -0,0 +1,188 @@
+"""Dashboard ao vivo: GET /api/analytics/stream (Server-Sent Events).
+
+Toda escrita em pedidos passa por aplicar_vendas_diarias (server.py), que entrega
+aqui o acumulado que acabou de ser gravado no rollup. registrar() só soma as
+mudanças por dia, sem I/O. Uma tarefa em segundo plano junta o que chegou em
+ANALYTICS_STREAM_INTERVALO segundos, relê do rollup os dias alterados (e o ranking
+de produtos, quando algum produto mudou) uma vez para todas as conexões com o
+mesmo filtro de cliente e distribui os eventos para cada dashboard conectado,
+conforme o período e o cliente dele:
+
+    totais          diferença no faturamento, nos itens e nos pedidos do período
+    vendas_por_dia  os dias alterados com os valores novos (formato de /vendas-por-dia,
+                    mais o número de pedidos; 0 pedidos = o dia saiu do gráfico)
+    top_produtos    o ranking novo, só quando mudou (formato de /top-produtos)
+    recarregar      a conexão ficou para trás e vai ser fechada: recarregue tudo
+
+Cada conexão tem uma fila limitada: quem não consome a tempo recebe recarregar e
+é desconectado, sem segurar as demais. A difusão é por processo: vendas gravadas
+por outro processo (ou pelo manage.py) não aparecem no stream deste.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Assinatura:
+    def __init__(self, dia_inicio: Optional[int], dia_fim: Optional[int], limite: int, cliente_id: Optional[str],
+                 tamanho_fila: int):
+        self.dia_inicio = dia_inicio
+        self.dia_fim = dia_fim
+        self.limite = limite
+        self.cliente_id = cliente_id
+        self.fila: asyncio.Queue = asyncio.Queue(tamanho_fila)
+        self.ranking: Optional[List[Dict[str, Any]]] = None  # último top_produtos enviado
+        self.encerrada = False
+
+    def no_periodo(self, dia: int) -> bool:
+        return (self.dia_inicio is None or dia >= self.dia_inicio) and (self.dia_fim is None or dia <= self.dia_fim)
+
+    def do_cliente(self, cliente_id: Optional[str]) -> bool:
+        return self.cliente_id is None or cliente_id == self.cliente_id
+
+    def acompanha(self, dia: int, cliente_id: Optional[str]) -> bool:
+        return self.no_periodo(dia) and self.do_cliente(cliente_id)
+
+
+class TransmissaoAnalytics:
+    def __init__(self, intervalo: float, tamanho_fila: int, intervalo_ping: float,
+                 ler_dias: Callable[[List[int], Optional[str]], Awaitable[Dict[int, Dict[str, Any]]]],
+                 ler_ranking: Callable[[Optional[int], Optional[int], int, Optional[str]], Awaitable[List[Dict[str, Any]]]]):
+        self.intervalo = intervalo
+        self.tamanho_fila = max(tamanho_fila, 2)  # recarregar e o fim da conexão sempre cabem
+        self.intervalo_ping = intervalo_ping
+        self.ler_dias = ler_dias
+        self.ler_ranking = ler_ranking
+        self.assinaturas: Set[Assinatura] = set()
+        # (dia, cliente_id) -> [valor, quantidade, pedidos] ainda não enviados
+        self.totais: Dict[Tuple[int, Optional[str]], List[float]] = {}
+        self.dias_produtos: Set[Tuple[int, Optional[str]]] = set()
+        self.pendente: Optional[asyncio.Event] = None
+        self.tarefa: Optional[asyncio.Task] = None
+
+    def iniciar(self):
+        self.pendente = asyncio.Event()
+        self.tarefa = asyncio.create_task(self.processar())
+
+    async def parar(self):
+        if self.tarefa is not None:
+            self.tarefa.cancel()
+            try:
+                await self.tarefa
+            except asyncio.CancelledError:
+                pass
+            self.tarefa = None
+        # Sem isso o shutdown do uvicorn esperaria os dashboards abertos
+        for assinatura in list(self.assinaturas):
+            self.encerrar(assinatura)
+
+    def assinar(self, dia_inicio: Optional[int], dia_fim: Optional[int], limite: int,
+                cliente_id: Optional[str] = None) -> Assinatura:
+        assinatura = Assinatura(dia_inicio, dia_fim, limite, cliente_id, self.tamanho_fila)
+        self.assinaturas.add(assinatura)
+        return assinatura
+
+    def registrar(self, acumulado: Dict[tuple, Dict[str, Any]]):
+        # Chamado depois de gravar o rollup: nada de I/O aqui
+        if self.pendente is None or not self.assinaturas:
+            return
+        for (dia, produto_id, cliente_id), linha in acumulado.items():
+            if produto_id is None:
+                totais = self.totais.setdefault((dia, cliente_id), [0, 0, 0])
+                totais[0] += linha["valor"]
+                totais[1] += linha["quantidade"]
+                totais[2] += linha["pedidos"]
+            else:
+                self.dias_produtos.add((dia, cliente_id))
+        self.pendente.set()
+
+    async def processar(self):
+        while True:
+            await self.pendente.wait()
+            # As escritas de um intervalo inteiro viram uma leitura só do rollup
+            await asyncio.sleep(self.intervalo)
+            self.pendente.clear()
+            totais, self.totais = self.totais, {}
+            dias_produtos, self.dias_produtos = self.dias_produtos, set()
+            try:
+                await self.distribuir(totais, dias_produtos)
+            except Exception:
+                logger.exception("Falha ao montar os eventos do dashboard ao vivo")
+
+    async def distribuir(self, totais: Dict[Tuple[int, Optional[str]], List[float]],
+                         dias_produtos: Set[Tuple[int, Optional[str]]]):
+        assinaturas = list(self.assinaturas)
+        alteracoes = set(totais) | dias_produtos
+        if not assinaturas or not alteracoes:
+            return
+        # Uma leitura dos dias alterados por filtro de cliente (None = todos os clientes)
+        leituras: Dict[Optional[str], Dict[int, Dict[str, Any]]] = {}
+        rankings: Dict[Tuple[Optional[int], Optional[int], int, Optional[str]], List[Dict[str, Any]]] = {}
+
+        for assinatura in assinaturas:
+            alterados = sorted({dia for dia, cliente_id in alteracoes if assinatura.acompanha(dia, cliente_id)})
+            if not alterados:
+                continue
+            soma = [
+                sum(linha[i] for (dia, cliente_id), linha in totais.items() if assinatura.acompanha(dia, cliente_id))
+                for i in range(3)
+            ]
+            if any(soma):
+                self.enviar(assinatura, "totais", {"valor": soma[0], "quantidade_itens": soma[1], "pedidos": soma[2]})
+            if assinatura.cliente_id not in leituras:
+                dias = sorted({dia for dia, cliente_id in alteracoes if assinatura.do_cliente(cliente_id)})
+                leituras[assinatura.cliente_id] = await self.ler_dias(dias, assinatura.cliente_id)
+            por_dia = leituras[assinatura.cliente_id]
+            self.enviar(assinatura, "vendas_por_dia", [por_dia[dia] for dia in alterados])
+
+            if any(assinatura.acompanha(dia, cliente_id) for dia, cliente_id in dias_produtos):
+                # Dashboards com o mesmo período, limite e cliente dividem a mesma consulta
+                chave = (assinatura.dia_inicio, assinatura.dia_fim, assinatura.limite, assinatura.cliente_id)
+                if chave not in rankings:
+                    rankings[chave] = await self.ler_ranking(*chave)
+                if rankings[chave] != assinatura.ranking:
+                    assinatura.ranking = rankings[chave]
+                    self.enviar(assinatura, "top_produtos", assinatura.ranking)
+
+    def enviar(self, assinatura: Assinatura, evento: str, dados: Any):
+        if assinatura.encerrada:
+            return
+        try:
+            assinatura.fila.put_nowait((evento, dados))
+        except asyncio.QueueFull:
+            self.encerrar(assinatura, ("recarregar", {}))
+
+    def encerrar(self, assinatura: Assinatura, ultimo: Optional[tuple] = None):
+        assinatura.encerrada = True
+        self.assinaturas.discard(assinatura)
+        while not assinatura.fila.empty():
+            assinatura.fila.get_nowait()
+        if ultimo is not None:
+            assinatura.fila.put_nowait(ultimo)
+        assinatura.fila.put_nowait(None)
+
+    async def eventos(self, dia_inicio: Optional[int], dia_fim: Optional[int], limite: int,
+                      cliente_id: Optional[str] = None) -> AsyncIterator[str]:
+        # Corpo do StreamingResponse; o comentário periódico mantém proxies e o navegador conectados.
+        # A assinatura nasce na primeira iteração, já coberta pelo finally: uma conexão que cai
+        # antes de o corpo começar não deixa assinatura registrada
+        assinatura = self.assinar(dia_inicio, dia_fim, limite, cliente_id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    item = await asyncio.wait_for(assinatura.fila.get(), self.intervalo_ping)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    return
+                evento, dados = item
+                yield f"event: {evento}\ndata: {json.dumps(dados)}\n\n"
+        finally:
+            # Navegador fechou a aba: o Starlette cancela o gerador e a assinatura sai daqui
+            assinatura.encerrada = True
+            self.assinaturas.discard(assinatura)
@@ -10,6 +10,44 @@ import { SidebarProvider, useSidebar } from "@/context/SidebarContext";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Importações CSV rodam em segundo plano no backend: acompanha o job até terminar
+const aguardarJob = async (jobId) => {
+  while (true) {
+    const { data: job } = await axios.get(`${API}/jobs/${jobId}`);
+    if (!['na_fila', 'processando'].includes(job.status)) {
+      return job;
+    }
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+  }
+};
+
+// Cópia local das listas de clientes e produtos: depois da primeira carga, cada tela
+// pede só o que mudou desde o último token (?since=) e aplica alterações e exclusões
+const copiasLocais = {};
+
+const ordemProdutos = (a, b) =>
+  (a.cp != null) - (b.cp != null) || (a.cp || 0) - (b.cp || 0);
+
+const sincronizarLista = async (colecao) => {
+  const copia = copiasLocais[colecao] || (copiasLocais[colecao] = { token: "0", itens: new Map() });
+  let temMais = true;
+  while (temMais) {
+    const { data } = await axios.get(`${API}/${colecao}`, { params: { since: copia.token } });
+    if (data.completo) {
+      copia.itens.clear();
+    }
+    data.itens.forEach((item) => copia.itens.set(item.id, item));
+    data.excluidos.forEach((id) => copia.itens.delete(id));
+    copia.token = data.token;
+    temMais = data.temMais;
+  }
+  return Array.from(copia.itens.values());
+};
+
+const carregarClientes = () => sincronizarLista("clientes");
+
+const carregarProdutos = async () => (await sincronizarLista("produtos")).sort(ordemProdutos);
+
 // Clientes Page
 const Clientes = () => {
   const [clientes, setClientes] = useState([]);
@@ -31,8 +69,7 @@ const Clientes = () => {
 
   const loadClientes = async () => {
     try {
-      const response = await axios.get(`${API}/clientes`);
-      setClientes(response.data);
+      setClientes(await carregarClientes());
     } catch (error) {
       toast.error("Erro ao carregar clientes");
     }
@@ -106,9 +143,16 @@ const Clientes = () => {
         }
       });
 
-      const { importados, falhas, erros_detalhados } = response.data;
+      const job = await aguardarJob(response.data.id);
+      if (job.status !== 'concluido') {
+        toast.error(job.erro || `Importação ${job.status}`);
+        loadClientes();
+        return;
+      }
+
+      const { importados, inseridos, atualizados, falhas, erros_detalhados } = job.resumo;
       
-      let message = `Importação concluída: ${importados} clientes importados`;
+      let message = `Importação concluída: ${importados} clientes importados (${inseridos} novos, ${atualizados} atualizados)`;
       if (falhas > 0) {
         message += `, ${falhas} linhas com erro`;
       }
@@ -344,8 +388,7 @@ const Produtos = () => {
 
   const loadProdutos = async () => {
     try {
-      const response = await axios.get(`${API}/produtos`);
-      setProdutos(response.data);
+      setProdutos(await carregarProdutos());
     } catch (error) {
       toast.error("Erro ao carregar produtos");
     }
@@ -613,8 +656,7 @@ const Venda = () => {
 
   const loadProdutos = async () => {
     try {
-      const response = await axios.get(`${API}/produtos`);
-      setProdutos(response.data);
+      setProdutos(await carregarProdutos());
     } catch (error) {
       toast.error("Erro ao carregar produtos");
     }
@@ -622,8 +664,7 @@ const Venda = () => {
 
   const loadClientes = async () => {
     try {
-      const response = await axios.get(`${API}/clientes`);
-      setClientes(response.data);
+      setClientes(await carregarClientes());
     } catch (error) {
       toast.error("Erro ao carregar clientes");
     }
@@ -1155,41 +1196,47 @@ const ListaVendas = () => {
 
   const loadClientes = async () => {
     try {
-      const response = await axios.get(`${API}/clientes`);
-      setClientes(response.data);
+      setClientes(await carregarClientes());
     } catch (error) {
       toast.error("Erro ao carregar clientes");
     }
   };
 
+  // Data no fuso do navegador (toISOString daria o dia em UTC)
+  const dataLocal = (data) => {
+    const mes = String(data.getMonth() + 1).padStart(2, '0');
+    const dia = String(data.getDate()).padStart(2, '0');
+    return `${data.getFullYear()}-${mes}-${dia}`;
+  };
+
   const calcularDatas = (periodo) => {
     const hoje = new Date();
     let dataInicio, dataFim;
 
     switch(periodo) {
       case "hoje":
-        dataInicio = dataFim = hoje.toISOString().split('T')[0];
+        dataInicio = dataFim = dataLocal(hoje);
         break;
       case "ontem":
         const ontem = new Date(hoje);
         ontem.setDate(ontem.getDate() - 1);
-        dataInicio = dataFim = ontem.toISOString().split('T')[0];
+        dataInicio = dataFim = dataLocal(ontem);
         break;
       case "ultimos7":
         const sete = new Date(hoje);
         sete.setDate(sete.getDate() - 7);
-        dataInicio = sete.toISOString().split('T')[0];
-        dataFim = hoje.toISOString().split('T')[0];
+        dataInicio = dataLocal(sete);
+        dataFim = dataLocal(hoje);
         break;
       case "estemes":
-        dataInicio = new Date(hoje.getFullYear(), hoje.getMonth(), 1).toISOString().split('T')[0];
-        dataFim = hoje.toISOString().split('T')[0];
+        dataInicio = dataLocal(new Date(hoje.getFullYear(), hoje.getMonth(), 1));
+        dataFim = dataLocal(hoje);
         break;
       case "mesanterior":
         const mesAnt = new Date(hoje.getFullYear(), hoje.getMonth() - 1, 1);
         const fimMesAnt = new Date(hoje.getFullYear(), hoje.getMonth(), 0);
-        dataInicio = mesAnt.toISOString().split('T')[0];
-        dataFim = fimMesAnt.toISOString().split('T')[0];
+        dataInicio = dataLocal(mesAnt);
+        dataFim = dataLocal(fimMesAnt);
         break;
       default:
         return { dataInicio: filtros.dataInicio, dataFim: filtros.dataFim };
@@ -1209,8 +1256,9 @@ const ListaVendas = () => {
         pageSize: pageSize.toString()
       });
 
-      if (dataInicio) params.append('dataInicio', dataInicio + 'T00:00:00.000Z');
-      if (dataFim) params.append('dataFim', dataFim + 'T23:59:59.999Z');
+      // Só a data: o backend aplica o dia inteiro no fuso da loja
+      if (dataInicio) params.append('dataInicio', dataInicio);
+      if (dataFim) params.append('dataFim', dataFim);
       if (clienteSelecionado) params.append('clienteId', clienteSelecionado.id);
 
       const response = await axios.get(`${API}/pedidos?${params}`);
@@ -1303,7 +1351,14 @@ const ListaVendas = () => {
         }
       });
 
-      const { importados, falhas, erros_detalhados } = response.data;
+      const job = await aguardarJob(response.data.id);
+      if (job.status !== 'concluido') {
+        toast.error(job.erro || `Importação ${job.status}`);
+        aplicarFiltros();
+        return;
+      }
+
+      const { importados, falhas, erros_detalhados } = job.resumo;
       
       let message = `Importação concluída: ${importados} vendas importadas`;
       if (falhas > 0) {
@@ -27,34 +27,89 @@ const DashboardCharts = () => {
   const [vendasPorCategoria, setVendasPorCategoria] = useState([]);
   const [produtosPorMes, setProdutosPorMes] = useState([]);
   const [loading, setLoading] = useState(false);
+  const [periodo, setPeriodo] = useState(null);
 
   useEffect(() => {
     carregarDados();
   }, []);
 
+  // Vendas novas chegam pelo stream (Server-Sent Events) sem refazer as consultas
+  useEffect(() => {
+    if (!periodo) return;
+    const fonte = new EventSource(
+      `${API}/analytics/stream?dataInicio=${periodo.dataInicio}&dataFim=${periodo.dataFim}&limit=10`
+    );
+    let conectado = false;
+    fonte.onopen = () => {
+      // Reconexão (queda ou "recarregar"): o que aconteceu no intervalo não veio pelo stream
+      if (conectado) carregarDados();
+      conectado = true;
+    };
+    fonte.addEventListener("totais", (e) => {
+      const delta = JSON.parse(e.data);
+      setResumo((atual) => {
+        if (!atual) return atual;
+        const faturamento_total = atual.faturamento_total + delta.valor;
+        const total_pedidos = atual.total_pedidos + delta.pedidos;
+        return {
+          ...atual,
+          faturamento_total,
+          total_pedidos,
+          ticket_medio: total_pedidos > 0 ? faturamento_total / total_pedidos : 0
+        };
+      });
+    });
+    fonte.addEventListener("vendas_por_dia", (e) => {
+      const dias = JSON.parse(e.data);
+      setVendasPorDia((atual) => {
+        const porData = new Map(atual.map((dia) => [dia.data, dia]));
+        dias.forEach(({ data, valor, quantidade_itens, pedidos }) => {
+          if (pedidos > 0) {
+            porData.set(data, { data, valor, quantidade_itens });
+          } else {
+            porData.delete(data);
+          }
+        });
+        return Array.from(porData.values()).sort((a, b) => a.data.localeCompare(b.data));
+      });
+    });
+    fonte.addEventListener("top_produtos", (e) => {
+      const ranking = JSON.parse(e.data);
+      setTopProdutos(ranking);
+      // Mesmo critério do resumo: maior quantidade vendida no período
+      setResumo((atual) => atual && {
+        ...atual,
+        produto_mais_vendido: ranking.length
+          ? { nome: ranking[0].produto, quantidade: ranking[0].quantidade }
+          : null
+      });
+    });
+    return () => fonte.close();
+  }, [periodo]);
+
   const calcularDatas = () => {
     const hoje = new Date();
     let dataInicio, dataFim;
 
     switch(filtros.periodo) {
       case "estemes":
-        dataInicio = new Date(hoje.getFullYear(), hoje.getMonth(), 1).toISOString().split('T')[0];
-        dataFim = hoje.toISOString().split('T')[0];
+        dataInicio = format(new Date(hoje.getFullYear(), hoje.getMonth(), 1), 'yyyy-MM-dd');
+        dataFim = format(hoje, 'yyyy-MM-dd');
         break;
       case "ultimos3meses":
         const tres = subMonths(hoje, 3);
-        dataInicio = tres.toISOString().split('T')[0];
-        dataFim = hoje.toISOString().split('T')[0];
+        dataInicio = format(tres, 'yyyy-MM-dd');
+        dataFim = format(hoje, 'yyyy-MM-dd');
         break;
       case "anoatual":
-        dataInicio = new Date(hoje.getFullYear(), 0, 1).toISOString().split('T')[0];
-        dataFim = hoje.toISOString().split('T')[0];
+        dataInicio = format(new Date(hoje.getFullYear(), 0, 1), 'yyyy-MM-dd');
+        dataFim = format(hoje, 'yyyy-MM-dd');
         break;
       case "personalizado":
         return { dataInicio: filtros.dataInicio, dataFim: filtros.dataFim };
       default:
-        dataInicio = new Date(hoje.getFullYear(), hoje.getMonth(), 1).toISOString().split('T')[0];
-        dataFim = hoje.toISOString().split('T')[0];
+        dataInicio = format(new Date(hoje.getFullYear(), hoje.getMonth(), 1), 'yyyy-MM-dd');
+        dataFim = format(hoje, 'yyyy-MM-dd');
     }
 
     return { dataInicio, dataFim };
@@ -64,33 +119,24 @@ const DashboardCharts = () => {
     setLoading(true);
     try {
       const { dataInicio, dataFim } = calcularDatas();
-      const params = `?dataInicio=${dataInicio}T00:00:00.000Z&dataFim=${dataFim}T23:59:59.999Z`;
+      // Só a data: o backend aplica o dia inteiro no fuso da loja
+      const params = `?dataInicio=${dataInicio}&dataFim=${dataFim}`;
 
-      const [
-        resumoRes,
-        vendasDiaRes,
-        vendasMesRes,
-        vendasProdutoRes,
-        topProdutosRes,
-        categoriaRes,
-        produtosMesRes
-      ] = await Promise.all([
-        axios.get(`${API}/analytics/resumo${params}`),
-        axios.get(`${API}/analytics/vendas-por-dia${params}`),
-        axios.get(`${API}/analytics/vendas-por-mes?ano=${new Date().getFullYear()}`),
-        axios.get(`${API}/analytics/vendas-por-produto${params}`),
-        axios.get(`${API}/analytics/top-produtos${params}&limit=10`),
-        axios.get(`${API}/analytics/vendas-por-categoria${params}`),
-        axios.get(`${API}/analytics/produtos-por-mes${params}&limitProdutos=5`)
-      ]);
+      const response = await axios.get(
+        `${API}/analytics/dashboard${params}&ano=${new Date().getFullYear()}&limit=10&limitProdutos=5`
+      );
+      const dados = response.data;
 
-      setResumo(resumoRes.data);
-      setVendasPorDia(vendasDiaRes.data);
-      setVendasPorMes(vendasMesRes.data);
-      setVendasPorProduto(vendasProdutoRes.data.slice(0, 10));
-      setTopProdutos(topProdutosRes.data);
-      setVendasPorCategoria(categoriaRes.data);
-      setProdutosPorMes(produtosMesRes.data);
+      setPeriodo((atual) =>
+        atual && atual.dataInicio === dataInicio && atual.dataFim === dataFim ? atual : { dataInicio, dataFim }
+      );
+      setResumo(dados.resumo);
+      setVendasPorDia(dados.vendas_por_dia);
+      setVendasPorMes(dados.vendas_por_mes);
+      setVendasPorProduto(dados.vendas_por_produto.slice(0, 10));
+      setTopProdutos(dados.top_produtos);
+      setVendasPorCategoria(dados.vendas_por_categoria);
+      setProdutosPorMes(dados.produtos_por_mes);
     } catch (error) {
       toast.error("Erro ao carregar dados do dashboard");
     } finally {
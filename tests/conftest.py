@@ -0,0 +1,57 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Os testes rodam a API inteira no armazenamento em memória, sem MongoDB
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ["ARMAZENAMENTO"] = "memoria"
+os.environ["ARQUIVO_HORIZONTE_MESES"] = "0"
+os.environ["ANALYTICS_MOTOR"] = "banco"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+from armazenamento import repositorios_memoria  # noqa: E402
+
+from .dados import item, pedido  # noqa: E402
+
+
+@pytest.fixture
+def api():
+    # Estado do processo zerado a cada teste: repositórios, caches e a cópia colunar
+    server.repos = repositorios_memoria()
+    server.executor_jobs.repositorio = server.repos.jobs
+    server.cache_analytics.invalidar()
+    server.motor_colunar.tabela = None
+    server.motor_colunar.invalidar()
+    with TestClient(server.app) as cliente:
+        yield cliente
+
+
+@pytest.fixture
+def loja(api):
+    # Conjunto fixo: 3 produtos, 2 clientes e 4 pedidos em janeiro e fevereiro de 2025.
+    # Totais: 45,00 em 4 pedidos; Banana é a mais vendida (8), Ana a maior cliente (19,00)
+    produtos = api.post("/api/produtos/batch", json=[
+        {"nome": "Banana", "tipo": "fruta", "porcionamento": "kg", "qtd_porcionamento": 1, "valor_unitario": 2.0, "estoque_atual": 100},
+        {"nome": "Alface", "tipo": "verdura", "porcionamento": "un", "qtd_porcionamento": 1, "valor_unitario": 3.0, "estoque_atual": 100},
+        {"nome": "Tomate", "tipo": "legume", "porcionamento": "kg", "qtd_porcionamento": 1, "valor_unitario": 5.0, "estoque_atual": 100},
+    ]).json()
+    banana, alface, tomate = produtos
+    ana = api.post("/api/clientes", json={"nome": "Ana", "telefone": "(11) 91111-1111"}).json()
+    bruno = api.post("/api/clientes", json={"nome": "Bruno", "telefone": "(11) 92222-2222"}).json()
+    pedidos = [
+        pedido("p1", "2025-01-10T15:00:00Z", [item(banana, 3), item(alface, 1)], ana["id"]),
+        pedido("p2", "2025-01-20T15:00:00Z", [item(tomate, 3)], bruno["id"]),
+        pedido("p3", "2025-02-05T15:00:00Z", [item(banana, 5)], ana["id"]),
+        pedido("p4", "2025-02-06T15:00:00Z", [item(alface, 2), item(tomate, 1)]),
+    ]
+    resposta = api.post("/api/pedidos/batch", json=pedidos).json()
+    assert resposta["criado"] == 4
+    return {
+        "produtos": {"banana": banana, "alface": alface, "tomate": tomate},
+        "clientes": {"ana": ana, "bruno": bruno},
+        "pedidos": pedidos,
+    }
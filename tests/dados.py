@@ -0,0 +1,22 @@
+# Montagem dos pedidos usados nos testes
+
+
+def item(produto: dict, quantidade: float) -> dict:
+    return {
+        "produto_id": produto["id"],
+        "produto_nome": produto["nome"],
+        "quantidade": quantidade,
+        "valor_unitario": produto["valor_unitario"],
+        "valor_total": quantidade * produto["valor_unitario"],
+    }
+
+
+def pedido(pedido_id: str, data_pedido: str, itens: list, cliente_id: str = None) -> dict:
+    return {
+        "id": pedido_id,
+        "data_pedido": data_pedido,
+        "cliente_id": cliente_id,
+        "itens": itens,
+        "total_itens": sum(i["quantidade"] for i in itens),
+        "valor_total": sum(i["valor_total"] for i in itens),
+    }
@@ -0,0 +1,85 @@
+def test_resumo(api, loja):
+    resumo = api.get("/api/analytics/resumo").json()
+    assert resumo == {
+        "faturamento_total": 45.0,
+        "total_pedidos": 4,
+        "ticket_medio": 11.25,
+        "produto_mais_vendido": {"nome": "Banana", "quantidade": 8.0},
+        "cliente_maior_faturamento": {"nome": "Ana", "valor": 19.0},
+    }
+
+
+def test_resumo_vazio(api):
+    assert api.get("/api/analytics/resumo").json() == {
+        "faturamento_total": 0,
+        "total_pedidos": 0,
+        "ticket_medio": 0,
+        "produto_mais_vendido": None,
+        "cliente_maior_faturamento": None,
+    }
+
+
+def test_vendas_por_dia_e_por_mes(api, loja):
+    assert api.get("/api/analytics/vendas-por-dia", params={"dataInicio": "2025-01-01", "dataFim": "2025-01-31"}).json() == [
+        {"data": "2025-01-10", "valor": 9.0, "quantidade_itens": 4.0},
+        {"data": "2025-01-20", "valor": 15.0, "quantidade_itens": 3.0},
+    ]
+    assert api.get("/api/analytics/vendas-por-mes", params={"ano": 2025}).json() == [
+        {"mes": "2025-01", "valor": 24.0, "pedidos": 2},
+        {"mes": "2025-02", "valor": 21.0, "pedidos": 2},
+    ]
+    ana = loja["clientes"]["ana"]["id"]
+    assert api.get("/api/analytics/vendas-por-mes", params={"ano": 2025, "clienteId": ana}).json() == [
+        {"mes": "2025-01", "valor": 9.0, "pedidos": 1},
+        {"mes": "2025-02", "valor": 10.0, "pedidos": 1},
+    ]
+
+
+def test_rankings_de_produto(api, loja):
+    assert api.get("/api/analytics/top-produtos", params={"limit": 2}).json() == [
+        {"produto": "Banana", "quantidade": 8.0, "valor": 16.0},
+        {"produto": "Tomate", "quantidade": 4.0, "valor": 20.0},
+    ]
+    assert api.get("/api/analytics/vendas-por-produto").json() == [
+        {"produto": "Tomate", "valor": 20.0},
+        {"produto": "Banana", "valor": 16.0},
+        {"produto": "Alface", "valor": 9.0},
+    ]
+    categorias = api.get("/api/analytics/vendas-por-categoria").json()
+    assert sorted(categorias, key=lambda c: c["categoria"]) == [
+        {"categoria": "fruta", "valor": 16.0, "quantidade": 8.0},
+        {"categoria": "legume", "valor": 20.0, "quantidade": 4.0},
+        {"categoria": "verdura", "valor": 9.0, "quantidade": 3.0},
+    ]
+
+
+def test_timeline_do_cliente(api, loja):
+    ana = loja["clientes"]["ana"]["id"]
+    assert api.get("/api/analytics/vendas-cliente-timeline", params={"clienteId": ana}).json() == [
+        {"data": "2025-01-10", "valor": 9.0},
+        {"data": "2025-02-05", "valor": 10.0},
+    ]
+
+
+def test_dashboard_igual_as_rotas(api, loja):
+    # O dashboard calcula tudo num $facet; cada gráfico deve bater com a rota própria
+    parametros = {"dataInicio": "2025-01-01", "dataFim": "2025-02-28"}
+    dashboard = api.get("/api/analytics/dashboard", params={**parametros, "ano": 2025, "limit": 2, "limitProdutos": 2}).json()
+    assert dashboard["resumo"] == api.get("/api/analytics/resumo", params=parametros).json()
+    assert dashboard["vendas_por_dia"] == api.get("/api/analytics/vendas-por-dia", params=parametros).json()
+    assert dashboard["vendas_por_mes"] == api.get("/api/analytics/vendas-por-mes", params={"ano": 2025}).json()
+    assert dashboard["top_produtos"] == api.get("/api/analytics/top-produtos", params={**parametros, "limit": 2}).json()
+    assert dashboard["produtos_por_mes"] == api.get(
+        "/api/analytics/produtos-por-mes", params={**parametros, "limitProdutos": 2}
+    ).json()
+
+
+def test_etag_e_invalidacao_por_escrita(api, loja):
+    primeira = api.get("/api/analytics/resumo")
+    etag = primeira.headers["ETag"]
+    assert api.get("/api/analytics/resumo", headers={"If-None-Match": etag}).status_code == 304
+
+    assert api.delete("/api/pedidos/p4").status_code == 200
+    depois = api.get("/api/analytics/resumo", headers={"If-None-Match": etag})
+    assert depois.status_code == 200
+    assert depois.json()["faturamento_total"] == 34.0
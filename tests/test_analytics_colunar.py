@@ -0,0 +1,87 @@
+import math
+import random
+
+import pytest
+
+import server
+
+from .dados import item, pedido
+
+# clienteId: posição do cliente criado pela fixture vendas
+ROTAS = [
+    ("/api/analytics/resumo", {}),
+    ("/api/analytics/resumo", {"dataInicio": "2025-03-01", "dataFim": "2025-04-15"}),
+    ("/api/analytics/vendas-por-dia", {"dataInicio": "2025-01-01", "dataFim": "2025-06-30"}),
+    ("/api/analytics/vendas-por-mes", {"ano": 2025}),
+    ("/api/analytics/vendas-por-mes", {"ano": 2025, "clienteId": 0}),
+    ("/api/analytics/vendas-por-produto", {}),
+    ("/api/analytics/top-produtos", {"dataInicio": "2025-02-01", "dataFim": "2025-05-31", "limit": 3}),
+    ("/api/analytics/vendas-por-categoria", {}),
+    ("/api/analytics/produtos-por-mes", {"limitProdutos": 3}),
+    ("/api/analytics/dashboard", {"ano": 2025}),
+    ("/api/analytics/dashboard", {"dataInicio": "2025-02-10", "dataFim": "2025-03-20", "clienteId": 1}),
+]
+
+
+def iguais(a, b):
+    # As somas não saem na mesma ordem nos dois motores: floats com tolerância
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(iguais(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return isinstance(b, list) and len(a) == len(b) and all(iguais(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+
+@pytest.fixture
+def vendas(api):
+    rnd = random.Random(7)
+    produtos = api.post("/api/produtos/batch", json=[
+        {"nome": f"Produto {i}", "tipo": rnd.choice(["fruta", "verdura", "legume"]), "porcionamento": "kg",
+         "qtd_porcionamento": 1, "valor_unitario": round(rnd.uniform(1, 20), 2), "estoque_atual": 10_000}
+        for i in range(12)
+    ]).json()
+    clientes = [
+        api.post("/api/clientes", json={"nome": f"Cliente {i}", "telefone": f"1190000000{i}"}).json()["id"]
+        for i in range(5)
+    ]
+    pedidos = [
+        pedido(
+            f"v{i}",
+            f"2025-{rnd.randint(1, 6):02d}-{rnd.randint(1, 28):02d}T{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00Z",
+            [item(produto, rnd.randint(1, 5)) for produto in rnd.sample(produtos, rnd.randint(1, 4))],
+            rnd.choice(clientes + [None]),
+        )
+        for i in range(300)
+    ]
+    assert api.post("/api/pedidos/batch", json=pedidos).json()["criado"] == 300
+    return {"produtos": produtos, "clientes": clientes}
+
+
+def comparar(api, monkeypatch, clientes):
+    for caminho, parametros in ROTAS:
+        parametros = {k: clientes[v] if k == "clienteId" else v for k, v in parametros.items()}
+        respostas = {}
+        for motor in ("banco", "colunar"):
+            monkeypatch.setattr(server, "ANALYTICS_MOTOR", motor)
+            server.cache_analytics.invalidar()
+            respostas[motor] = api.get(caminho, params=parametros).json()
+        assert iguais(respostas["banco"], respostas["colunar"]), (caminho, parametros)
+
+
+def test_colunar_igual_ao_banco(api, vendas, monkeypatch):
+    comparar(api, monkeypatch, vendas["clientes"])
+    assert server.motor_colunar.tabela is not None
+
+
+def test_colunar_acompanha_escritas(api, vendas, monkeypatch):
+    # Carrega a cópia e depois escreve: as vendas novas e a exclusão entram sem recarga
+    comparar(api, monkeypatch, vendas["clientes"])
+    carregada_em = server.motor_colunar.carregada_em
+    novo = pedido("novo", "2025-03-10T15:00:00Z", [item(vendas["produtos"][0], 50)], vendas["clientes"][1])
+    api.post("/api/pedidos/batch", json=[novo])
+    api.delete("/api/pedidos/v0")
+
+    comparar(api, monkeypatch, vendas["clientes"])
+    assert server.motor_colunar.carregada_em == carregada_em
@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+
+from .dados import item, pedido
+
+
+@pytest.fixture
+def arquivamento(monkeypatch):
+    # Meses com mais de 3 meses vão para o arquivo: o conjunto fixo (2025) inteiro
+    monkeypatch.setattr(server, "ARQUIVO_HORIZONTE_MESES", 3)
+
+
+def retrato(api, cliente_id):
+    # Tudo o que não pode mudar quando pedidos saem para o arquivo
+    paginas, cursor = [], None
+    while True:
+        pagina = api.get("/api/pedidos", params={"pageSize": 2, **({"after": cursor} if cursor else {})}).json()
+        paginas += [p["id"] for p in pagina["pedidos"]]
+        cursor = pagina["nextCursor"]
+        if cursor is None:
+            break
+    server.cache_analytics.invalidar()
+    return {
+        "pedidos": api.get("/api/pedidos", params={"pageSize": 100}).json(),
+        "pagina_2": api.get("/api/pedidos", params={"pageSize": 2, "page": 2}).json(),
+        "do_cliente": api.get("/api/pedidos", params={"clienteId": cliente_id}).json(),
+        "cursor": paginas,
+        "export": api.get("/api/pedidos/export", params={"formato": "ndjson"}).text,
+        "csv": api.get("/api/pedidos/export", params={"dataInicio": "2025-01-01", "dataFim": "2025-01-31"}).text,
+        "dashboard": api.get("/api/analytics/dashboard", params={"ano": 2025}).json(),
+        "vendas_por_mes": api.get("/api/analytics/vendas-por-mes").json(),
+        "top_produtos": api.get("/api/analytics/top-produtos").json(),
+        "timeline": api.get("/api/analytics/vendas-cliente-timeline", params={"clienteId": cliente_id}).json(),
+    }
+
+
+def test_desligado_por_padrao(api, loja):
+    assert server.ARQUIVO_HORIZONTE_MESES == 0
+    assert api.portal.call(server.arquivar_pedidos) == {"meses": [], "fechamentos": 0, "pedidos_arquivados": 0}
+
+
+def test_listas_e_graficos_iguais_depois_de_arquivar(api, loja, arquivamento):
+    agora = datetime.now(timezone.utc).isoformat()
+    ana = loja["clientes"]["ana"]["id"]
+    api.post("/api/pedidos/batch", json=[pedido("recente", agora, [item(loja["produtos"]["banana"], 1)], ana)])
+    antes = retrato(api, ana)
+
+    resumo = api.portal.call(server.arquivar_pedidos)
+    assert resumo["meses"] == ["2025-01", "2025-02"]
+    assert resumo["pedidos_arquivados"] == 4
+    assert len(server.repos.pedidos.por_id) == 1
+
+    assert retrato(api, ana) == antes
+    fechamentos = api.portal.call(server.repos.fechamentos.listar)
+    assert [(f["mes"], f["sequencia"], f["vendas_por_mes"]["valor"]) for f in fechamentos] == [
+        (202501, 1, 24.0),
+        (202502, 1, 21.0),
+    ]
+
+
+def test_pedido_arquivado(api, loja, arquivamento):
+    api.portal.call(server.arquivar_pedidos)
+    assert api.get("/api/pedidos/p1").json()["valor_total"] == 9.0
+    assert api.delete("/api/pedidos/p1").status_code == 409
+    reenvio = api.post("/api/pedidos/batch", json=[loja["pedidos"][0]]).json()
+    assert reenvio["resultados"][0]["status"] == "duplicado"
+
+
+def test_venda_atrasada_aparece_na_hora_e_vira_ajuste(api, loja, arquivamento):
+    api.portal.call(server.arquivar_pedidos)
+    atrasada = pedido("atrasada", "2025-01-15T15:00:00Z", [item(loja["produtos"]["alface"], 10)])
+    api.post("/api/pedidos/batch", json=[atrasada])
+
+    # Os gráficos leem o rollup: a venda entra antes da próxima rodada
+    janeiro = api.get("/api/analytics/vendas-por-mes", params={"ano": 2025}).json()[0]
+    assert janeiro == {"mes": "2025-01", "valor": 54.0, "pedidos": 3}
+
+    resumo = api.portal.call(server.arquivar_pedidos)
+    assert (resumo["fechamentos"], resumo["pedidos_arquivados"]) == (1, 1)
+    ajuste = api.portal.call(server.repos.fechamentos.listar, 202501, 202501)[-1]
+    assert ajuste["sequencia"] == 2
+    assert ajuste["vendas_por_mes"] == {"mes": "2025-01", "valor": 30.0, "pedidos": 1}
+    assert api.get("/api/analytics/vendas-por-mes", params={"ano": 2025}).json()[0] == janeiro
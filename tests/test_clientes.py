@@ -0,0 +1,46 @@
+import pytest
+
+
+@pytest.fixture
+def clientes(api):
+    cadastrados = [
+        {"nome": "José da Silva", "telefone": "(11) 98888-7777", "email": "jose@gmail.com"},
+        {"nome": "Josefa Souza", "telefone": "(21) 3333-4444", "email": "josefa@empresa.com.br"},
+        {"nome": "Maria José", "telefone": "+55 11 97777-6666", "email": "maria@GMAIL.com"},
+    ]
+    return {c["nome"]: api.post("/api/clientes", json=c).json()["id"] for c in cadastrados}
+
+
+def buscar(api, termo):
+    return [c["nome"] for c in api.get("/api/clientes", params={"search": termo}).json()]
+
+
+def test_busca_por_nome(api, clientes):
+    # Prefixo de cada palavra, sem acentos; o nome que começa pelo termo vem antes
+    assert buscar(api, "jose") == ["José da Silva", "Josefa Souza", "Maria José"]
+    assert buscar(api, "SILVA jos") == ["José da Silva"]
+    assert buscar(api, "ilva") == []
+
+
+def test_busca_por_telefone_com_e_sem_ddd(api, clientes):
+    assert buscar(api, "(11) 98888-7777") == ["José da Silva"]
+    assert buscar(api, "98888-7777") == ["José da Silva"]
+    assert buscar(api, "3333") == ["Josefa Souza"]
+    assert buscar(api, "97777") == ["Maria José"]
+    assert buscar(api, "5511977776666") == ["Maria José"]
+
+
+def test_busca_por_email_e_dominio(api, clientes):
+    assert buscar(api, "josefa@") == ["Josefa Souza"]
+    assert sorted(buscar(api, "gmail.com")) == ["José da Silva", "Maria José"]
+    assert buscar(api, "@empresa") == ["Josefa Souza"]
+
+
+def test_busca_com_caracteres_de_regex(api, clientes):
+    assert api.get("/api/clientes", params={"search": "(.*"}).status_code == 200
+    assert buscar(api, "[jose") == ["José da Silva", "Josefa Souza", "Maria José"]
+
+
+def test_chaves_de_busca_nao_saem(api, clientes):
+    for cliente in api.get("/api/clientes", params={"search": "jose"}).json():
+        assert set(cliente) == {"id", "nome", "telefone", "email", "endereco", "sexo", "observacao", "data_cadastro"}
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timezone
+
+from consultas_lentas import CapturaConsultasLentas, resumir_plano
+
+EXPLAIN_FIND = {
+    "queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}},
+    "executionStats": {"nReturned": 2, "totalDocsExamined": 5000, "totalKeysExamined": 0, "executionTimeMillis": 180},
+}
+EXPLAIN_AGGREGATE = {"stages": [{"$cursor": {
+    "queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "cliente_dia"}}},
+    "executionStats": {"nReturned": 30, "totalDocsExamined": 30, "totalKeysExamined": 30, "executionTimeMillis": 4},
+}}, {"$group": {}}]}
+
+
+class BancoFalso:
+    # O suficiente de um banco do Motor para a captura: command (explain) e insert_one
+    name = "quitanda"
+
+    def __init__(self):
+        self.explains = []
+        self.registros = []
+
+    async def command(self, comando):
+        self.explains.append(comando)
+        return EXPLAIN_FIND
+
+    def __getitem__(self, colecao):
+        banco = self
+
+        class Colecao:
+            async def insert_one(self, registro):
+                banco.registros.append((colecao, registro))
+        return Colecao()
+
+
+def capturar(comandos):
+    # observar roda nas threads do Motor: aqui também, fora do loop
+    async def rodar():
+        banco = BancoFalso()
+        captura = CapturaConsultasLentas(limite_ms=100, intervalo_explain=60, tamanho_fila=10)
+        captura.iniciar(banco)
+        for comando, duracao in comandos:
+            await asyncio.to_thread(captura.observar, "quitanda", "pedidos", next(iter(comando)), comando, duracao, 2,
+                                    "/api/pedidos")
+        for _ in range(100):
+            if captura.fila.empty():
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        await captura.parar()
+        return banco, captura
+    return rodar
+
+
+def test_consulta_lenta_gravada_com_plano(api):
+    lenta = {"find": "pedidos", "filter": {"cliente_id": "c1"}, "sort": {"data_pedido": -1}, "limit": 20, "lsid": {"id": 1}}
+    rapida = {"find": "pedidos", "filter": {"cliente_id": "c1"}}
+    banco, captura = api.portal.call(capturar([(lenta, 0.25), (rapida, 0.01)]))
+
+    assert len(banco.registros) == 1
+    colecao, registro = banco.registros[0]
+    assert colecao == "slow_queries"
+    assert (registro["colecao"], registro["comando"], registro["rota"]) == ("pedidos", "find", "/api/pedidos")
+    assert (registro["duracao_ms"], registro["filtro"], registro["ordenacao"], registro["limite"]) == (
+        250.0, {"cliente_id": "c1"}, {"data_pedido": -1}, 20,
+    )
+    assert registro["plano"] == {
+        "estagios": ["SORT", "COLLSCAN"], "indices": [], "collscan": True, "docs_examinados": 5000,
+        "chaves_examinadas": 0, "retornados": 2, "tempo_execucao_ms": 180,
+    }
+    # Campos de sessão do driver não vão para o explain
+    assert banco.explains == [{"explain": {k: v for k, v in lenta.items() if k != "lsid"}, "verbosity": "executionStats"}]
+
+
+def test_mesmo_formato_reaproveita_o_plano(api):
+    primeira = {"find": "pedidos", "filter": {"data_pedido": {"$gte": datetime(2025, 1, 1, tzinfo=timezone.utc)}}}
+    segunda = {"find": "pedidos", "filter": {"data_pedido": {"$gte": datetime(2025, 6, 1, tzinfo=timezone.utc)}}}
+    outra_forma = {"find": "pedidos", "filter": {"cliente_id": "c2"}}
+    banco, _ = api.portal.call(capturar([(primeira, 0.2), (segunda, 0.3), (outra_forma, 0.2)]))
+    assert [r["plano_reaproveitado"] for _, r in banco.registros] == [False, True, False]
+    assert len(banco.explains) == 2
+    assert banco.registros[0][1]["filtro"] == {"data_pedido": {"$gte": {"$date": "2025-01-01T00:00:00Z"}}}
+
+
+def test_aggregate_com_escrita_nao_e_explicado(api):
+    com_out = {"aggregate": "pedidos", "pipeline": [{"$match": {}}, {"$out": "copia"}]}
+    banco, _ = api.portal.call(capturar([(com_out, 0.5)]))
+    assert banco.registros == [] and banco.explains == []
+
+
+def test_resumo_do_plano_de_aggregate():
+    assert resumir_plano(EXPLAIN_AGGREGATE) == {
+        "estagios": ["FETCH", "IXSCAN"], "indices": ["cliente_dia"], "collscan": False, "docs_examinados": 30,
+        "chaves_examinadas": 30, "retornados": 30, "tempo_execucao_ms": 4,
+    }
@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+import server
+
+
+def test_exportacao_csv_de_pedidos(api, loja):
+    linhas = api.get("/api/pedidos/export", params={"dataInicio": "2025-02-01", "dataFim": "2025-02-28"}).text.splitlines()
+    assert linhas[0] == ";".join(server.CAMPOS_CSV_PEDIDOS)
+    assert [linha.split(";")[0] for linha in linhas[1:]] == [
+        "2025-02-06T15:00:00+00:00",
+        "2025-02-05T15:00:00+00:00",
+    ]
+
+
+def test_exportacao_ndjson_de_clientes(api, loja):
+    resposta = api.get("/api/clientes/export", params={"formato": "ndjson"})
+    assert resposta.headers["content-type"] == "application/x-ndjson"
+    clientes = [json.loads(linha) for linha in resposta.text.splitlines()]
+    assert sorted(c["nome"] for c in clientes) == ["Ana", "Bruno"]
+
+
+def test_primeira_linha_sai_sem_esperar_o_lote(api):
+    # Cursor lento: depois da primeira linha o próximo documento demora a chegar
+    async def primeiro_pedaco(formato):
+        liberar = asyncio.Event()
+
+        async def docs():
+            yield {"nome": "Ana", "telefone": "11911111111"}
+            await liberar.wait()
+            yield {"nome": "Bruno", "telefone": "11922222222"}
+
+        gerador = server.gerar_exportacao(docs(), formato, ["nome", "telefone"])
+        pedacos = [await asyncio.wait_for(anext(gerador), 1)]
+        if formato == "csv":
+            pedacos.append(await asyncio.wait_for(anext(gerador), 1))
+        liberar.set()
+        return pedacos, [pedaco async for pedaco in gerador]
+
+    pedacos, resto = api.portal.call(primeiro_pedaco, "ndjson")
+    assert pedacos == ['{"nome": "Ana", "telefone": "11911111111"}\n']
+    assert resto == ['{"nome": "Bruno", "telefone": "11922222222"}\n']
+
+    pedacos, resto = api.portal.call(primeiro_pedaco, "csv")
+    assert pedacos == ["nome;telefone\n", "Ana;11911111111\n"]
+    assert resto == ["Bruno;11922222222\n"]
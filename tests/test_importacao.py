@@ -0,0 +1,60 @@
+import io
+
+
+def importar(api, caminho, linhas, **parametros):
+    arquivo = io.BytesIO(("\n".join(linhas) + "\n").encode("utf-8"))
+    return api.post(caminho, params={"aguardar": "true", **parametros}, files={"file": ("dados.csv", arquivo, "text/csv")})
+
+
+def test_importacao_de_pedidos_em_lotes(api, loja):
+    # Lotes de 2: a linha com erro não derruba as vizinhas do mesmo lote
+    resumo = importar(api, "/api/pedidos/import-csv", [
+        "data_pedido;cliente_nome;cliente_telefone;total_itens;valor_total;observacao",
+        "01/03/2025;Carla;11933333333;2;10,50;",
+        "2025-03-01T23:30:00;Carla;11933333333;1;4.50;tarde",
+        "31/02/2025;Carla;11933333333;1;1;",
+        "2025-03-02;;;3;7;",
+        "2025-03-03;;;1;",
+    ], batchSize=2).json()
+    assert resumo["importados"] == 3
+    assert resumo["falhas"] == 2
+    assert [erro["linha"] for erro in resumo["erros_detalhados"]] == [4, 6]
+
+    # Sem fuso é horário da loja: 23:30 ainda é dia 1º
+    dias = api.get("/api/analytics/vendas-por-dia", params={"dataInicio": "2025-03-01", "dataFim": "2025-03-31"}).json()
+    assert [(d["data"], d["valor"]) for d in dias] == [("2025-03-01", 15.0), ("2025-03-02", 7.0)]
+    assert api.get("/api/pedidos").json()["totalCount"] == 7
+
+
+def test_importacao_rejeita_arquivo_que_nao_e_csv(api):
+    arquivo = io.BytesIO(b"nome;telefone\n")
+    resposta = api.post("/api/pedidos/import-csv", files={"file": ("dados.txt", arquivo, "text/plain")})
+    assert resposta.status_code == 400
+
+
+def test_importacao_de_clientes_por_telefone(api, loja):
+    ana = loja["clientes"]["ana"]
+    resumo = importar(api, "/api/clientes/import-csv", [
+        "nome;telefone;email;endereco;sexo;observacao",
+        "Carla;(11) 93333-3333;;;;",
+        "Ana Souza;11 91111-1111;ana@exemplo.com;;F;",
+        "Carla Dias;11933333333;;Rua A;;",
+        "Dario;11944444444;invalido;;;",
+    ], batchSize=3).json()
+    assert (resumo["inseridos"], resumo["atualizados"], resumo["falhas"]) == (1, 1, 1)
+    assert resumo["duplicados_no_arquivo"] == 1
+    assert resumo["erros_detalhados"][0]["linha"] == 5
+
+    # Telefone já cadastrado (em outro formato) atualiza o mesmo cliente; no arquivo vale a última linha
+    clientes = {c["telefone"]: c for c in api.get("/api/clientes").json()}
+    assert len(clientes) == 3
+    assert clientes["11 91111-1111"]["id"] == ana["id"]
+    assert clientes["11 91111-1111"]["nome"] == "Ana Souza"
+    assert (clientes["11933333333"]["nome"], clientes["11933333333"]["endereco"]) == ("Carla Dias", "Rua A")
+
+    # Reimportar o mesmo arquivo só atualiza
+    reimportado = importar(api, "/api/clientes/import-csv", [
+        "nome;telefone",
+        "Carla Dias;11933333333",
+    ]).json()
+    assert (reimportado["inseridos"], reimportado["atualizados"]) == (0, 1)
@@ -0,0 +1,75 @@
+import asyncio
+import io
+import time
+
+import server
+
+
+def enviar_clientes(api, quantidade):
+    linhas = ["nome;telefone"] + [f"Cliente {i};1190000{i:04d}" for i in range(quantidade)]
+    arquivo = io.BytesIO(("\n".join(linhas) + "\n").encode("utf-8"))
+    return api.post("/api/clientes/import-csv", params={"batchSize": 10}, files={"file": ("clientes.csv", arquivo, "text/csv")})
+
+
+def esperar(api, job_id, status):
+    for _ in range(200):
+        job = api.get(f"/api/jobs/{job_id}").json()
+        if job["status"] in status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} ficou em {job['status']}")
+
+
+def test_importacao_em_segundo_plano(api):
+    resposta = enviar_clientes(api, 25)
+    assert resposta.status_code == 202
+    job = resposta.json()
+    assert (job["status"], job["tipo"], job["arquivo"]) == ("na_fila", "importacao_clientes", "clientes.csv")
+
+    job = esperar(api, job["id"], {"concluido"})
+    assert job["linhas_processadas"] == 25
+    assert job["resumo"]["inseridos"] == 25
+    assert job["concluido_em"] is not None and "expira_em" not in job
+    assert len(api.get("/api/clientes").json()) == 25
+
+
+def test_cancelar_job_na_fila(api, monkeypatch):
+    # Sem vaga no executor o job fica na fila até ser cancelado
+    monkeypatch.setattr(server.executor_jobs, "semaforo", asyncio.Semaphore(0))
+    job = enviar_clientes(api, 5).json()
+    cancelado = api.delete(f"/api/jobs/{job['id']}").json()
+    assert cancelado["status"] == "cancelado"
+    assert cancelado["cancelamento_solicitado"] is True
+    assert api.get("/api/clientes").json() == []
+
+
+def test_cancelar_job_em_andamento(api):
+    continuar = asyncio.Event()
+
+    async def executar(progresso):
+        # Um "lote" por vez, esperando o teste liberar o primeiro
+        for linhas in range(1, 1001):
+            await progresso.atualizar(linhas, {"importados": linhas})
+            await continuar.wait()
+        return {"importados": 1000}
+
+    job = api.portal.call(server.executor_jobs.enfileirar, "teste", {}, executar)
+    esperar(api, job["id"], {"processando"})
+    assert api.delete(f"/api/jobs/{job['id']}").json()["cancelamento_solicitado"] is True
+    api.portal.call(continuar.set)
+
+    # O cancelamento é cooperativo: o job para ao registrar o próximo lote e o que já
+    # foi gravado fica
+    job = esperar(api, job["id"], {"cancelado", "concluido"})
+    assert job["status"] == "cancelado"
+    assert job["linhas_processadas"] == 2
+
+
+def test_job_inexistente(api):
+    assert api.get("/api/jobs/nao-existe").status_code == 404
+    assert api.delete("/api/jobs/nao-existe").status_code == 404
+
+
+def test_cancelar_job_terminado_nao_muda_nada(api):
+    job = esperar(api, enviar_clientes(api, 3).json()["id"], {"concluido"})
+    assert api.delete(f"/api/jobs/{job['id']}").json()["status"] == "concluido"
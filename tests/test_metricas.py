@@ -0,0 +1,62 @@
+import re
+from types import SimpleNamespace
+
+from metricas import TemposRequisicao, metricas, monitor_comandos, tempos_requisicao
+
+
+def valor_metrica(api, linha: str) -> float:
+    for atual in api.get("/metrics").text.splitlines():
+        if atual.startswith(linha + " "):
+            return float(atual.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_server_timing_por_fase(api, loja):
+    resposta = api.get("/api/analytics/dashboard")
+    fases = dict(re.findall(r"(\w+);dur=([\d.]+)", resposta.headers["Server-Timing"]))
+    assert set(fases) == {"db", "compute", "serialize", "total"}
+    assert float(fases["total"]) >= float(fases["compute"])
+
+
+def test_contagem_por_rota_e_status(api, loja):
+    rota = 'http_requests_total{method="GET",route="/api/pedidos/{pedido_id}",status="%s"}'
+    antes = {status: valor_metrica(api, rota % status) for status in ("200", "404")}
+    api.get("/api/pedidos/p1")
+    api.get("/api/pedidos/nao-existe")
+    api.get("/api/pedidos/tambem-nao")
+    assert valor_metrica(api, rota % "200") == antes["200"] + 1
+    assert valor_metrica(api, rota % "404") == antes["404"] + 2
+
+    # Caminho fora das rotas: um rótulo só
+    sem_rota = 'http_requests_total{method="GET",route="(sem rota)",status="404"}'
+    antes_sem_rota = valor_metrica(api, sem_rota)
+    api.get("/api/nao/existe/1")
+    api.get("/api/nao/existe/2")
+    assert valor_metrica(api, sem_rota) == antes_sem_rota + 2
+
+    texto = api.get("/metrics").text
+    assert '# TYPE http_request_duration_seconds histogram' in texto
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/pedidos/{pedido_id}",le="+Inf"}' in texto
+
+
+def test_comandos_do_mongo_entram_na_requisicao(api):
+    # Eventos como os do CommandListener do pymongo: um find devolvendo 3 documentos
+    tempos = TemposRequisicao()
+    token = tempos_requisicao.set(tempos)
+    try:
+        comando = {"find": "metricas_teste", "filter": {}}
+        monitor_comandos.started(SimpleNamespace(command_name="find", command=comando, connection_id=1, request_id=7))
+        monitor_comandos.succeeded(SimpleNamespace(
+            command_name="find", connection_id=1, request_id=7, duration_micros=2500,
+            reply={"cursor": {"firstBatch": [{}, {}, {}]}}, database_name="teste",
+        ))
+        monitor_comandos.started(SimpleNamespace(command_name="find", command=comando, connection_id=1, request_id=8))
+        monitor_comandos.failed(SimpleNamespace(command_name="find", connection_id=1, request_id=8, duration_micros=1000))
+    finally:
+        tempos_requisicao.reset(token)
+
+    assert tempos.db == [0.0025, 0.001]
+    texto = metricas.exportar()
+    assert 'mongodb_command_documents_returned_total{collection="metricas_teste",command="find"} 3' in texto
+    assert 'mongodb_command_failures_total{collection="metricas_teste",command="find"} 1' in texto
+    assert 'mongodb_command_duration_seconds_count{collection="metricas_teste",command="find"} 2' in texto
@@ -0,0 +1,119 @@
+from .dados import item, pedido
+
+
+def criar_pedidos(api, produto, quantidade):
+    # Vários pedidos no mesmo instante: o id desempata a ordem da paginação
+    pedidos = [
+        pedido(f"x{i:03d}", f"2025-03-{1 + i // 4:02d}T12:00:00Z", [item(produto, 1)])
+        for i in range(quantidade)
+    ]
+    assert api.post("/api/pedidos/batch", json=pedidos).json()["criado"] == quantidade
+    return pedidos
+
+
+def test_paginacao_por_cursor_sem_repetir(api, loja):
+    criar_pedidos(api, loja["produtos"]["banana"], 23)
+    vistos, cursor, paginas = [], None, 0
+    while True:
+        parametros = {"pageSize": 5, **({"after": cursor} if cursor else {})}
+        pagina = api.get("/api/pedidos", params=parametros).json()
+        vistos += [p["id"] for p in pagina["pedidos"]]
+        cursor = pagina["nextCursor"]
+        paginas += 1
+        if cursor is None:
+            break
+
+    todos = api.get("/api/pedidos", params={"pageSize": 100}).json()
+    assert paginas == 6
+    assert len(vistos) == len(set(vistos)) == 27
+    assert vistos == [p["id"] for p in todos["pedidos"]]
+    assert todos["totalCount"] == 27
+    datas = [p["data_pedido"] for p in todos["pedidos"]]
+    assert datas == sorted(datas, reverse=True)
+
+
+def test_cursor_invalido(api, loja):
+    resposta = api.get("/api/pedidos", params={"after": "nao-e-um-cursor"})
+    assert resposta.status_code == 400
+    assert resposta.json()["detail"] == "Cursor inválido"
+
+
+def test_baixa_e_devolucao_de_estoque(api, loja):
+    banana = loja["produtos"]["banana"]
+    # O conjunto fixo já baixou 8 bananas
+    assert api.get(f"/api/produtos/{banana['id']}").json()["estoque_atual"] == 92.0
+
+    criado = api.post("/api/pedidos", json=pedido(None, None, [item(banana, 10)])).json()
+    assert criado["itens_sem_estoque"] is None
+    assert api.get(f"/api/produtos/{banana['id']}").json()["estoque_atual"] == 82.0
+
+    assert api.delete(f"/api/pedidos/{criado['id']}").status_code == 200
+    assert api.get(f"/api/produtos/{banana['id']}").json()["estoque_atual"] == 92.0
+
+
+def test_venda_sem_estoque_nao_fica_negativa(api, loja):
+    tomate = loja["produtos"]["tomate"]
+    criado = api.post("/api/pedidos", json=pedido(None, None, [item(tomate, 500)])).json()
+    assert criado["itens_sem_estoque"] == [tomate["id"]]
+    assert api.get(f"/api/produtos/{tomate['id']}").json()["estoque_atual"] == 96.0
+
+    # Sem baixa, a exclusão não devolve nada
+    api.delete(f"/api/pedidos/{criado['id']}")
+    assert api.get(f"/api/produtos/{tomate['id']}").json()["estoque_atual"] == 96.0
+
+
+def test_reenvio_de_lote_e_idempotente(api, loja):
+    alface = loja["produtos"]["alface"]
+    lote = [
+        pedido("caixa-1", "2025-03-01T12:00:00Z", [item(alface, 1)]),
+        pedido("caixa-2", "2025-03-01T13:00:00Z", [item(alface, 2)]),
+        {"id": "caixa-3", "itens": "invalido"},
+    ]
+    primeira = api.post("/api/pedidos/batch", json=lote).json()
+    assert [r["status"] for r in primeira["resultados"]] == ["criado", "criado", "invalido"]
+
+    resumo = api.get("/api/analytics/resumo").json()
+    estoque = api.get(f"/api/produtos/{alface['id']}").json()["estoque_atual"]
+
+    segunda = api.post("/api/pedidos/batch", json=lote[:2] + lote[:1]).json()
+    assert [r["status"] for r in segunda["resultados"]] == ["duplicado", "duplicado", "duplicado"]
+    assert api.get("/api/analytics/resumo").json() == resumo
+    assert api.get(f"/api/produtos/{alface['id']}").json()["estoque_atual"] == estoque
+    assert api.get("/api/pedidos").json()["totalCount"] == 6
+
+
+def test_data_sem_fuso_e_horario_da_loja(api, loja):
+    # 01:30 em São Paulo (UTC-3) é 04:30 UTC, ainda no dia 1º na loja
+    lote = [pedido("sem-fuso", "2025-03-01T01:30:00", [item(loja["produtos"]["banana"], 1)])]
+    resultado = api.post("/api/pedidos/batch", json=lote).json()["resultados"][0]
+    assert resultado["data_pedido"] == "2025-03-01T04:30:00+00:00"
+    dias = api.get("/api/analytics/vendas-por-dia", params={"dataInicio": "2025-03-01", "dataFim": "2025-03-01"}).json()
+    assert [d["data"] for d in dias] == ["2025-03-01"]
+
+
+def test_campos_internos_nao_saem(api, loja):
+    internos = {"dia", "mes", "estoque_baixado", "_id"}
+    listados = api.get("/api/pedidos").json()["pedidos"]
+    assert all(not internos & set(p) for p in listados)
+    assert not internos & set(api.get("/api/pedidos/p1").json())
+    exportados = api.get("/api/pedidos/export", params={"formato": "ndjson"}).text
+    assert "estoque_baixado" not in exportados and '"dia"' not in exportados
+
+
+def test_filtros_com_meia_noite_utc_valem_pelo_dia(api, loja):
+    # Clientes antigos mandam o dia como meia-noite UTC: não pode entrar 21:00 do dia anterior
+    def ids(inicio, fim):
+        pedidos = api.get("/api/pedidos", params={"dataInicio": inicio, "dataFim": fim}).json()["pedidos"]
+        return [p["id"] for p in pedidos]
+
+    api.post("/api/pedidos/batch", json=[pedido("vespera", "2025-01-20T01:00:00Z", [item(loja["produtos"]["banana"], 1)])])
+    assert ids("2025-01-20", "2025-01-20") == ["p2"]
+    assert ids("2025-01-20T00:00:00.000Z", "2025-01-20T00:00:00.000Z") == ["p2"]
+    assert ids("2025-01-20T00:00:00Z", "2025-01-20T00:00:00+00:00") == ["p2"]
+    # Qualquer outro horário continua sendo o instante informado
+    assert ids("2025-01-19T22:00:00-03:00", "2025-01-20T16:00:00Z") == ["p2", "vespera"]
+
+    dias = api.get("/api/analytics/vendas-por-dia", params={
+        "dataInicio": "2025-01-20T00:00:00.000Z", "dataFim": "2025-01-20T00:00:00.000Z",
+    }).json()
+    assert [d["data"] for d in dias] == ["2025-01-20"]
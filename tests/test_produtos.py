@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def catalogo(api):
+    return api.post("/api/produtos/batch", json=[
+        {"nome": nome, "tipo": tipo, "porcionamento": "kg", "qtd_porcionamento": 1, "valor_unitario": 1.0, "estoque_atual": 10}
+        for nome, tipo in [("Maçã", "fruta"), ("Mamão", "fruta"), ("Couve", "verdura"), ("Cenoura", "legume")]
+    ]).json()
+
+
+def test_lista_com_limit_e_filtros(api, catalogo):
+    assert [p["nome"] for p in api.get("/api/produtos").json()] == ["Maçã", "Mamão", "Couve", "Cenoura"]
+    assert [p["nome"] for p in api.get("/api/produtos", params={"limit": 2}).json()] == ["Maçã", "Mamão"]
+    assert [p["nome"] for p in api.get("/api/produtos", params={"search": "maca"}).json()] == ["Maçã"]
+    assert [p["nome"] for p in api.get("/api/produtos", params={"tipo": "fruta"}).json()] == ["Maçã", "Mamão"]
+    assert api.get("/api/produtos", params={"limit": 1001}).status_code == 422
+
+
+def test_etag_e_304_do_catalogo(api, catalogo):
+    lista = api.get("/api/produtos")
+    etag = lista.headers["ETag"]
+    assert api.get("/api/produtos", headers={"If-None-Match": etag}).status_code == 304
+    # Outro corte da lista é outra resposta, com outro ETag
+    assert api.get("/api/produtos", params={"limit": 2}, headers={"If-None-Match": etag}).status_code == 200
+
+    couve = catalogo[2]
+    por_cp = api.get(f"/api/produtos/cp/{couve['cp']}")
+    assert por_cp.json()["nome"] == "Couve"
+    assert api.get(f"/api/produtos/cp/{couve['cp']}", headers={"If-None-Match": por_cp.headers["ETag"]}).status_code == 304
+
+    # Qualquer escrita troca a versão do catálogo
+    api.put(f"/api/produtos/{couve['id']}", json={**couve, "valor_unitario": 4.5})
+    depois = api.get("/api/produtos", headers={"If-None-Match": etag})
+    assert depois.status_code == 200
+    assert depois.json()[2]["valor_unitario"] == 4.5
+    assert api.get(f"/api/produtos/cp/{couve['cp']}").json()["valor_unitario"] == 4.5
+
+
+def test_catalogo_acompanha_exclusao_e_baixa_de_estoque(api, catalogo):
+    maca, mamao = catalogo[0], catalogo[1]
+    api.delete(f"/api/produtos/{mamao['id']}")
+    assert api.get(f"/api/produtos/{mamao['id']}").status_code == 404
+    assert api.get(f"/api/produtos/cp/{mamao['cp']}").status_code == 404
+
+    api.post("/api/pedidos", json={
+        "itens": [{"produto_id": maca["id"], "produto_nome": "Maçã", "quantidade": 3, "valor_unitario": 1.0, "valor_total": 3.0}],
+        "total_itens": 3,
+        "valor_total": 3.0,
+    })
+    assert api.get(f"/api/produtos/{maca['id']}").json()["estoque_atual"] == 7.0
+
+
+def novo_produto(nome):
+    return {"nome": nome, "tipo": "fruta", "porcionamento": "un", "qtd_porcionamento": 1, "valor_unitario": 1.0}
+
+
+def test_cp_sem_repetir_com_cadastros_simultaneos(api):
+    async def cadastrar():
+        return await asyncio.gather(*(
+            server.create_produto(server.ProdutoCreate(**novo_produto(f"Produto {i}"))) for i in range(20)
+        ))
+
+    produtos = api.portal.call(cadastrar)
+    lote = api.post("/api/produtos/batch", json=[novo_produto("Lote A"), novo_produto("Lote B")]).json()
+    assert sorted(p.cp for p in produtos) == list(range(1, 21))
+    assert [p["cp"] for p in lote] == [21, 22]
+
+
+def test_cp_ressemeia_depois_de_cadastro_fora_da_api(api):
+    assert api.post("/api/produtos", json=novo_produto("Primeiro")).json()["cp"] == 1
+    # Produto gravado direto no banco com um cp à frente do contador
+    api.portal.call(server.repos.produtos.inserir_muitos, [{"id": "externo", "cp": 2, **novo_produto("Externo")}])
+    assert api.post("/api/produtos", json=novo_produto("Segundo")).json()["cp"] == 3
+
+    # O $max da semeadura nunca volta o contador
+    api.portal.call(server.repos.contadores.semear, server.CONTADOR_CP, 1)
+    assert api.post("/api/produtos", json=novo_produto("Terceiro")).json()["cp"] == 4
@@ -0,0 +1,94 @@
+import pytest
+
+import server
+
+from .test_importacao import importar
+
+
+@pytest.fixture
+def sem_margem(monkeypatch):
+    # Sem a margem de escritas em andamento o token avança até agora: cada delta traz só o novo
+    monkeypatch.setattr(server, "SYNC_MARGEM_SEGUNDOS", 0)
+
+
+def sincronizar(api, colecao, token, limite=100):
+    # completo vale para a sequência inteira: só a primeira página sabe se recomeçou do zero
+    itens, excluidos, completo = {}, [], None
+    while True:
+        resposta = api.get(f"/api/{colecao}", params={"since": token, "limit": limite}).json()
+        completo = resposta["completo"] if completo is None else completo
+        itens.update((item["id"], item) for item in resposta["itens"])
+        excluidos += resposta["excluidos"]
+        token = resposta["token"]
+        if not resposta["temMais"]:
+            return itens, excluidos, token, completo
+
+
+def test_carga_completa_e_deltas_de_clientes(api, loja, sem_margem):
+    ana, bruno = loja["clientes"]["ana"], loja["clientes"]["bruno"]
+    itens, excluidos, token, completo = sincronizar(api, "clientes", "0", limite=1)
+    assert completo is True
+    assert set(itens) == {ana["id"], bruno["id"]}
+    assert excluidos == []
+    assert all("versao" not in item for item in itens.values())
+
+    assert sincronizar(api, "clientes", token)[:2] == ({}, [])
+
+    api.put(f"/api/clientes/{ana['id']}", json={"nome": "Ana Maria", "telefone": ana["telefone"]})
+    api.delete(f"/api/clientes/{bruno['id']}")
+    carla = api.post("/api/clientes", json={"nome": "Carla", "telefone": "(11) 93333-3333"}).json()
+
+    itens, excluidos, token, completo = sincronizar(api, "clientes", token)
+    assert completo is False
+    assert {id_: item["nome"] for id_, item in itens.items()} == {ana["id"]: "Ana Maria", carla["id"]: "Carla"}
+    assert excluidos == [bruno["id"]]
+
+
+def test_delta_de_produtos_inclui_baixa_de_estoque(api, loja, sem_margem):
+    *_, token, _ = sincronizar(api, "produtos", "0")
+    banana = loja["produtos"]["banana"]
+    api.post("/api/pedidos/batch", json=[{
+        "id": "caixa-1",
+        "itens": [{"produto_id": banana["id"], "produto_nome": "Banana", "quantidade": 2, "valor_unitario": 2.0, "valor_total": 4.0}],
+        "total_itens": 2,
+        "valor_total": 4.0,
+    }])
+    api.delete(f"/api/produtos/{loja['produtos']['alface']['id']}")
+
+    itens, excluidos, _, _ = sincronizar(api, "produtos", token)
+    assert {id_: item["estoque_atual"] for id_, item in itens.items()} == {banana["id"]: 90.0}
+    assert excluidos == [loja["produtos"]["alface"]["id"]]
+
+
+def test_paginas_nao_perdem_escritas_em_lote(api, loja, sem_margem):
+    # Importação e cadastro em lote dão a mesma versão ao lote inteiro: as páginas
+    # cortam no meio da versão e seguem pelo id
+    *_, token_clientes, _ = sincronizar(api, "clientes", "0")
+    *_, token_produtos, _ = sincronizar(api, "produtos", "0")
+    importar(api, "/api/clientes/import-csv", ["nome;telefone"] + [f"Cliente {i};1190000000{i}" for i in range(5)])
+    produtos = api.post("/api/produtos/batch", json=[
+        {"nome": f"Produto {i}", "tipo": "fruta", "porcionamento": "kg", "qtd_porcionamento": 1, "valor_unitario": 1}
+        for i in range(5)
+    ]).json()
+
+    itens, _, token, _ = sincronizar(api, "clientes", token_clientes, limite=2)
+    assert sorted(item["nome"] for item in itens.values()) == [f"Cliente {i}" for i in range(5)]
+    assert "-" not in token
+    itens, *_ = sincronizar(api, "produtos", token_produtos, limite=2)
+    assert set(itens) == {produto["id"] for produto in produtos}
+
+
+def test_token_do_formato_anterior(api, loja, sem_margem):
+    # "base-versao" recomeça a versão: repete documentos, mas não perde nenhum
+    itens, *_ = sincronizar(api, "clientes", "1-1")
+    assert set(itens) == {cliente["id"] for cliente in loja["clientes"].values()}
+
+
+def test_versao_nao_sai_nas_listas(api, loja):
+    for caminho in ("/api/clientes", "/api/produtos", "/api/clientes/export?formato=ndjson"):
+        assert "versao" not in api.get(caminho).text
+
+
+@pytest.mark.parametrize("token", ["abc", "5-3", "1-2-", "1-x-id"])
+def test_token_invalido(api, token):
+    assert api.get("/api/clientes", params={"since": token}).status_code == 400
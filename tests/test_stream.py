@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+
+from .dados import item, pedido
+
+
+@pytest.fixture
+def transmissao(api, monkeypatch):
+    # Sem a espera de agrupamento: cada escrita vira eventos na hora
+    monkeypatch.setattr(server.transmissao_analytics, "intervalo", 0)
+    return server.transmissao_analytics
+
+
+def conectar(api, **filtros):
+    gerador = server.transmissao_analytics.eventos(None, None, 10, filtros.get("cliente_id"))
+    assert api.portal.call(anext, gerador) == "retry: 5000\n\n"
+    return gerador
+
+
+def receber(api, gerador, quantidade):
+    async def ler():
+        eventos = {}
+        for _ in range(quantidade):
+            texto = await asyncio.wait_for(anext(gerador), 2)
+            evento, dados = texto.split("\n")[:2]
+            eventos[evento.removeprefix("event: ")] = json.loads(dados.removeprefix("data: "))
+        return eventos
+    return api.portal.call(ler)
+
+
+def test_eventos_filtrados_por_cliente(api, loja, transmissao):
+    ana, bruno = loja["clientes"]["ana"]["id"], loja["clientes"]["bruno"]["id"]
+    alface, tomate = loja["produtos"]["alface"], loja["produtos"]["tomate"]
+    todos = conectar(api)
+    da_ana = conectar(api, cliente_id=ana)
+
+    api.post("/api/pedidos/batch", json=[pedido("b1", "2025-01-20T15:00:00Z", [item(alface, 1)], bruno)])
+    eventos = receber(api, todos, 3)
+    assert eventos["totais"] == {"valor": 3.0, "quantidade_itens": 1.0, "pedidos": 1}
+    assert eventos["vendas_por_dia"] == [{"data": "2025-01-20", "valor": 18.0, "quantidade_itens": 4.0, "pedidos": 2}]
+    # A venda do Bruno não chega ao dashboard filtrado pela Ana
+    assinatura_ana = next(a for a in transmissao.assinaturas if a.cliente_id == ana)
+    assert assinatura_ana.fila.empty()
+
+    api.post("/api/pedidos/batch", json=[pedido("a1", "2025-01-20T16:00:00Z", [item(tomate, 1)], ana)])
+    eventos = receber(api, da_ana, 3)
+    assert eventos["totais"] == {"valor": 5.0, "quantidade_itens": 1.0, "pedidos": 1}
+    assert eventos["vendas_por_dia"] == [{"data": "2025-01-20", "valor": 5.0, "quantidade_itens": 1.0, "pedidos": 1}]
+    ranking = {linha["produto"]: linha["quantidade"] for linha in eventos["top_produtos"]}
+    assert ranking == {"Banana": 8.0, "Alface": 1.0, "Tomate": 1.0}
+    assert receber(api, todos, 2)["totais"]["valor"] == 5.0
+
+    for gerador in (todos, da_ana):
+        api.portal.call(gerador.aclose)
+    assert transmissao.assinaturas == set()
+
+
+def test_conexao_que_cai_antes_de_comecar_nao_fica_assinada(api, transmissao):
+    # O StreamingResponse nunca iterou o corpo: nenhuma assinatura foi criada
+    gerador = transmissao.eventos(None, None, 10)
+    assert transmissao.assinaturas == set()
+    api.portal.call(gerador.aclose)
+    assert transmissao.assinaturas == set()
+
+
+def test_fila_cheia_pede_recarga(api, loja, transmissao, monkeypatch):
+    monkeypatch.setattr(transmissao, "tamanho_fila", 2)
+    gerador = conectar(api)
+    banana = loja["produtos"]["banana"]
+    # Cada venda gera mais de um evento: a fila de 2 enche antes de o dashboard ler
+    api.post("/api/pedidos/batch", json=[pedido("c1", "2025-03-01T12:00:00Z", [item(banana, 1)])])
+    eventos = receber(api, gerador, 1)
+    assert eventos == {"recarregar": {}}
+    assert transmissao.assinaturas == set()